@@ -0,0 +1 @@
+"""Local benchmarks and load-test harnesses (not part of the test suite)."""
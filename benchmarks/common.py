@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+
+def use_temp_database() -> str:
+    """Point the bot at a throwaway SQLite file unless DATABASE_URL is set.
+
+    Must run before anything under ``src`` is imported.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="dl-video-bench-"), "bench.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{path}")
+    os.environ.setdefault("TOKEN", "123456:BENCHMARK")
+    return os.environ["DATABASE_URL"]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values`` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """Throughput and latency percentiles (milliseconds) for one run."""
+    return {
+        "count": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+    }
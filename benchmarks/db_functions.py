@@ -0,0 +1,297 @@
+"""Time the functions in ``src/db.py`` on a production-sized database.
+
+Seeds ``--users`` users (``--premium-share`` of them with a subscription)
+and ``--rows`` downloads spread over the last ``--days`` days, then times
+each function through the bot's own engines and pragma profile (reads
+through the read-only pool, as the handlers do):
+
+- ``single``: ``--ops`` calls one after another, a session each
+- ``concurrent``: ``--ops`` calls from ``--concurrency`` tasks at once
+
+The JSON report (stdout, and ``--output``) records the commit, versions,
+row counts and settings next to the results, so runs can be compared
+across commits; ``--compare`` adds the p50/p99 ratios against an earlier
+report (above 1 is slower).
+
+    python -m benchmarks.db_functions --rows 2000000 --users 50000 --output db.json
+    python -m benchmarks.db_functions --rows 2000000 --users 50000 --compare db.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import summarize, use_temp_database
+
+DATABASE_URL = use_temp_database()
+
+import sqlalchemy  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.db import (  # noqa: E402
+    async_session,
+    count_downloads_today,
+    create_subscription,
+    engine,
+    get_cached_video,
+    get_or_create_user,
+    get_premium_until,
+    has_active_subscription,
+    init_db,
+    load_user,
+    read_engine,
+    read_session,
+    reserve_download,
+    sqlite_pragmas,
+    start_download,
+)
+
+PATH = DATABASE_URL.replace("sqlite+aiosqlite:///", "")
+DAILY_LIMIT = 10**9
+MODES = ("single", "concurrent")
+
+
+def _ts(value: datetime) -> str:
+    """A datetime in the format SQLAlchemy stores in SQLite."""
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+async def seed(args) -> dict:
+    """Create the schema and bulk-load the rows; returns the row counts."""
+    await init_db()
+    await engine.dispose()
+
+    rng = random.Random(1)
+    now = datetime.now()
+    db = sqlite3.connect(PATH)
+    db.execute("PRAGMA synchronous=OFF")
+    db.executemany(
+        "INSERT INTO users (telegram_id, username, is_bot, created_at) VALUES (?, ?, 0, ?)",
+        ((10_000 + u, f"user{u}", _ts(now)) for u in range(1, args.users + 1)),
+    )
+    premium = range(1, args.users + 1, max(1, round(1 / args.premium_share)))
+    db.executemany(
+        "INSERT INTO subscriptions (user_id, telegram_charge_id, stars_paid, "
+        "starts_at, expires_at, created_at) VALUES (?, ?, 250, ?, ?, ?)",
+        (
+            (u, f"charge{u}", _ts(now - timedelta(days=10)), _ts(now + timedelta(days=20)),
+             _ts(now))
+            for u in premium
+        ),
+    )
+    db.execute(
+        "UPDATE users SET premium_until = "
+        "(SELECT max(expires_at) FROM subscriptions WHERE user_id = users.id)"
+    )
+    # The daily_usage triggers fire here too, so quota counts match the rows
+    db.executemany(
+        "INSERT INTO downloads (user_id, tweet_url, created_at) VALUES (?, ?, ?)",
+        (
+            (
+                rng.randint(1, args.users),
+                f"https://x.com/i/status/{i}",
+                _ts(now - timedelta(seconds=rng.randrange(args.days * 24 * 3600))),
+            )
+            for i in range(args.rows)
+        ),
+    )
+    db.executemany(
+        "INSERT INTO cached_videos (tweet_id, file_id, file_size, created_at) "
+        "VALUES (?, ?, 1000000, ?)",
+        ((str(i), f"file{i}", _ts(now)) for i in range(0, args.rows, 10)),
+    )
+    db.commit()
+    # What the maintenance job's PRAGMA optimize would have left behind
+    db.execute("ANALYZE")
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    counts = {
+        table: db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        for table in ("users", "subscriptions", "downloads", "daily_usage", "cached_videos")
+    }
+    db.close()
+    return counts
+
+
+def cases(args) -> dict:
+    """name -> (session maker, ``call(session, rng, i)``)."""
+
+    def user_id(rng):
+        return rng.randint(1, args.users)
+
+    def telegram_id(rng):
+        return 10_000 + user_id(rng)
+
+    return {
+        # A known user whose profile didn't change: one SELECT, no write
+        "get_or_create_user": (
+            async_session,
+            lambda s, rng, i: get_or_create_user(s, telegram_id(rng), username=None),
+        ),
+        "get_or_create_user_new": (
+            async_session,
+            lambda s, rng, i: get_or_create_user(s, 10**9 + i + rng.randrange(10**9), "new"),
+        ),
+        "reserve_download": (
+            async_session,
+            lambda s, rng, i: reserve_download(
+                s, user_id(rng), f"https://x.com/b/{i}", DAILY_LIMIT
+            ),
+        ),
+        "count_downloads_today": (
+            read_session, lambda s, rng, i: count_downloads_today(s, user_id(rng))
+        ),
+        "has_active_subscription": (
+            read_session, lambda s, rng, i: has_active_subscription(s, user_id(rng))
+        ),
+        "get_premium_until": (
+            read_session, lambda s, rng, i: get_premium_until(s, user_id(rng))
+        ),
+        "create_subscription": (
+            async_session,
+            lambda s, rng, i: create_subscription(s, user_id(rng), 250, f"bench{i}"),
+        ),
+        "get_cached_video": (
+            read_session,
+            lambda s, rng, i: get_cached_video(s, str(rng.randrange(args.rows))),
+        ),
+        # The download path's unit of work (see handlers._process_download)
+        "load_user": (async_session, lambda s, rng, i: load_user(s, telegram_id(rng))),
+        "start_download": (
+            async_session,
+            lambda s, rng, i: start_download(
+                s, user_id(rng), False, f"https://x.com/b/{i}",
+                str(rng.randrange(args.rows)), DAILY_LIMIT,
+            ),
+        ),
+    }
+
+
+async def _timed(maker, call, rng, i: int, latencies: list) -> None:
+    async with maker() as session:
+        t0 = time.perf_counter()
+        await call(session, rng, i)
+        latencies.append(time.perf_counter() - t0)
+
+
+async def bench_single(maker, call, ops: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(ops):
+        await _timed(maker, call, rng, i, latencies)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def bench_concurrent(maker, call, ops: int, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            await _timed(maker, call, rng, i, latencies)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(ops)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    """p50/p99 of ``results`` over ``baseline`` per function and mode."""
+    ratios = {}
+    for name, modes in results.items():
+        for mode, result in modes.items():
+            before = baseline.get("results", {}).get(name, {}).get(mode)
+            if not before:
+                continue
+            ratios.setdefault(name, {})[mode] = {
+                pct: round(result[pct] / before[pct], 2) if before[pct] else None
+                for pct in ("p50_ms", "p99_ms")
+            }
+    return ratios
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000, help="download rows")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--premium-share", type=float, default=0.05)
+    parser.add_argument("--days", type=int, default=365, help="age of the oldest download")
+    parser.add_argument("--ops", type=int, default=500, help="calls per function and mode")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--functions", nargs="+", help="default: all")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", help="an earlier report to compare against")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = await seed(args)
+    seed_s = round(time.perf_counter() - started, 1)
+
+    selected = cases(args)
+    if args.functions:
+        selected = {name: selected[name] for name in args.functions}
+    results = {}
+    try:
+        for n, (name, (maker, call)) in enumerate(selected.items()):
+            results[name] = {
+                "single": await bench_single(maker, call, args.ops, seed=n),
+                "concurrent": await bench_concurrent(
+                    maker, call, args.ops, args.concurrency, seed=1000 + n
+                ),
+            }
+    finally:
+        await engine.dispose()
+        await read_engine.dispose()
+        shutil.rmtree(os.path.dirname(PATH), ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "sqlalchemy": sqlalchemy.__version__,
+            "rows": counts,
+            "seed_s": seed_s,
+            "ops": args.ops,
+            "concurrency": args.concurrency,
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "read_pool_size": settings.DB_READ_POOL_SIZE,
+            "pragmas": {name: str(value) for name, value in sqlite_pragmas().items()},
+        },
+        "p50_ms": {
+            name: {mode: modes[mode]["p50_ms"] for mode in MODES}
+            for name, modes in results.items()
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["compare"] = compare(results, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,225 @@
+"""Database time per download: a session per step vs request-scoped units of work.
+
+``per_step`` replays what the download pipeline used to do: separate
+sessions (and commits) for the user lookup, the reservation, linking it
+to the job, the file_id lookup, saving the new file_id and recording a
+premium download. ``unit_of_work`` is the current pipeline: ``load_user``
++ ``start_download`` in one transaction before the download, and
+``finish_downloads`` for that one download after it. ``write_behind`` is the current pipeline:
+the bookkeeping goes through the download writer, flushed every
+``--flush-every`` downloads (the flushes are timed too). Only the database
+calls are timed; the download and upload themselves are skipped. ``--cold`` runs the user
+lookup on every download (a user-cache miss); by default the user is
+cached, as on the hot path.
+
+    python -m benchmarks.download_db_time --downloads 1000 --users 100
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from benchmarks.common import summarize, use_temp_database
+
+use_temp_database()
+
+from sqlalchemy import event, insert, select, update  # noqa: E402
+
+from src.batcher import download_writer  # noqa: E402
+from src.db import (  # noqa: E402
+    async_session,
+    engine,
+    finish_downloads,
+    get_cached_video,
+    get_or_create_user,
+    get_premium_until,
+    init_db,
+    load_user,
+    record_download,
+    reserve_download,
+    start_download,
+)
+from src.models import JOB_RUNNING, CachedVideo, Job  # noqa: E402
+
+DAILY_LIMIT = 10**9
+
+
+async def legacy_save_cached_video(session, tweet_id, file_id, file_unique_id, file_size):
+    """save_cached_video as it was: load the row, assign, commit."""
+    stmt = select(CachedVideo).where(CachedVideo.tweet_id == tweet_id)
+    cached = (await session.execute(stmt)).scalar_one_or_none()
+    if cached is None:
+        cached = CachedVideo(tweet_id=tweet_id, file_id=file_id)
+        session.add(cached)
+    cached.file_id = file_id
+    cached.file_unique_id = file_unique_id
+    cached.file_size = file_size
+    await session.commit()
+
+
+async def legacy_set_job_download(session, job_id, download_id):
+    """Linking a reservation to its job in a transaction of its own."""
+    await session.execute(update(Job).where(Job.id == job_id).values(download_id=download_id))
+    await session.commit()
+
+
+async def per_step(d, cold: bool) -> None:
+    if cold:
+        async with async_session() as session:
+            user = await get_or_create_user(session, **d.profile)
+            await get_premium_until(session, user.id)
+    if not d.premium:
+        async with async_session() as session:
+            reservation = await reserve_download(session, d.user_id, d.url, DAILY_LIMIT)
+            await legacy_set_job_download(session, d.job_id, reservation.id)
+    async with async_session() as session:
+        cached = await get_cached_video(session, d.tweet_id)
+    if cached is None:
+        async with async_session() as session:
+            await legacy_save_cached_video(
+                session, d.tweet_id, d.video.file_id, d.video.file_unique_id, d.video.file_size
+            )
+    if d.premium:
+        async with async_session() as session:
+            await record_download(session, d.user_id, d.url)
+
+
+async def unit_of_work(d, cold: bool) -> None:
+    async with async_session() as session:
+        if cold:
+            await load_user(session, **d.profile)
+        started = await start_download(
+            session, d.user_id, d.premium, d.url, d.tweet_id, DAILY_LIMIT, job_id=d.job_id
+        )
+    videos = [] if started.cached else [{"tweet_id": d.tweet_id, **vars(d.video)}]
+    records = []
+    if d.premium:
+        records.append({"user_id": d.user_id, "tweet_url": d.url, "created_at": datetime.now()})
+    async with async_session() as session:
+        await finish_downloads(session, records=records, videos=videos)
+
+
+# The bot's download writer; its background loop is not started here
+writer = download_writer
+
+
+async def write_behind(d, cold: bool) -> None:
+    async with async_session() as session:
+        if cold:
+            await load_user(session, **d.profile)
+        started = await start_download(
+            session, d.user_id, d.premium, d.url, d.tweet_id, DAILY_LIMIT, job_id=d.job_id
+        )
+    if not started.cached:
+        video = {"tweet_id": d.tweet_id, **vars(d.video)}
+        await writer.submit(("video", video), key=("video", d.tweet_id))
+    if d.premium:
+        row = {"user_id": d.user_id, "tweet_url": d.url, "created_at": datetime.now()}
+        await writer.submit(("record", row))
+
+
+FLOWS = {"per_step": per_step, "unit_of_work": unit_of_work, "write_behind": write_behind}
+
+
+async def _downloads(name: str, count: int, users: list, seed: int = 1) -> list:
+    """Synthetic downloads, each with its own running job. Half the users
+    are premium; tweets repeat, so later requests hit the file_id cache."""
+    rng = random.Random(seed)
+    picks = []
+    for _ in range(count):
+        user_id, profile, premium = rng.choice(users)
+        picks.append((user_id, profile, premium, f"{name}{rng.randrange(count // 3 + 1)}"))
+    # One active job per telegram_user_id, so give every job its own id
+    offset = len(FLOWS) * count * (list(FLOWS).index(name) + 1)
+    rows = [
+        {
+            "telegram_user_id": offset + i,
+            "chat_id": profile["telegram_id"],
+            "tweet_url": f"https://x.com/i/status/{tweet_id}",
+            "tweet_id": tweet_id,
+            "payload": "{}",
+            "state": JOB_RUNNING,
+        }
+        for i, (_, profile, _, tweet_id) in enumerate(picks)
+    ]
+    async with async_session() as session:
+        job_ids = (await session.scalars(insert(Job).returning(Job.id), rows)).all()
+        await session.commit()
+    return [
+        SimpleNamespace(
+            user_id=user_id,
+            profile=profile,
+            premium=premium,
+            tweet_id=tweet_id,
+            url=f"https://x.com/i/status/{tweet_id}",
+            job_id=job_id,
+            video=SimpleNamespace(file_id=f"F{tweet_id}", file_unique_id=f"U{tweet_id}", file_size=1),
+        )
+        for (user_id, profile, premium, tweet_id), job_id in zip(picks, job_ids)
+    ]
+
+
+async def measure(flow, downloads, cold: bool, flush_every: int) -> dict:
+    counts = {"transactions": 0, "statements": 0}
+
+    def on_begin(_conn):
+        counts["transactions"] += 1
+
+    def on_execute(*_args):
+        counts["statements"] += 1
+
+    event.listen(engine.sync_engine, "begin", on_begin)
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    latencies = []
+    started = time.perf_counter()
+    for i, d in enumerate(downloads, 1):
+        t0 = time.perf_counter()
+        await flow(d, cold)
+        latencies.append(time.perf_counter() - t0)
+        # Stand-in for the flush interval
+        if i % flush_every == 0:
+            await writer.flush()
+    await writer.flush()
+    elapsed = time.perf_counter() - started
+    event.remove(engine.sync_engine, "begin", on_begin)
+    event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+    return {
+        **summarize(latencies, elapsed),
+        "mean_ms": round(elapsed / len(downloads) * 1000, 2),
+        **{f"{k}_per_download": round(v / len(downloads), 2) for k, v in counts.items()},
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--downloads", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--cold", action="store_true", help="look the user up on every download")
+    parser.add_argument("--flush-every", type=int, default=50, help="downloads per batch flush")
+    args = parser.parse_args()
+
+    await init_db()
+    users = []
+    async with async_session() as session:
+        for u in range(args.users):
+            profile = {"telegram_id": 10_000 + u, "username": f"user{u}", "full_name": f"User {u}"}
+            user = await get_or_create_user(session, **profile)
+            users.append((user.id, profile, u % 2 == 0))
+
+    results = {}
+    for name, flow in FLOWS.items():
+        downloads = await _downloads(name, args.downloads, users)
+        results[name] = await measure(flow, downloads, args.cold, args.flush_every)
+    for name in ("unit_of_work", "write_behind"):
+        saved = 1 - results[name]["mean_ms"] / results["per_step"]["mean_ms"]
+        results[name]["db_time_saved"] = f"{saved:.0%}"
+    results["write_behind"]["writer"] = writer.stats()
+    await engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
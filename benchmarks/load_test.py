@@ -0,0 +1,398 @@
+"""End-to-end download throughput at several MAX_CONCURRENT_DOWNLOADS values.
+
+Drives the real application in process: every synthetic user pastes a
+tweet link, the ``download_video`` handler queues a job, the job worker
+runs ``_process_download`` (user lookup, quota reservation, file_id
+cache, download admission, upload, write-behind bookkeeping) against a
+fresh SQLite database. Only the edges are fake: Bot API calls are
+answered by ``FakeBotRequest`` (with upload latency), and ``dl_video`` is
+replaced by ``FakeDownloader`` (lognormal latency and size, an error
+rate) run in threads, or any ``--downloader module:function`` with the
+same signature. Tweets are drawn with Zipf popularity, so repeats hit the
+file_id cache or join an in-flight download.
+
+Reports, per MAX_CONCURRENT_DOWNLOADS value: requests per second, latency
+from update to final reply (p50/p95/p99), outcomes, mean time per
+pipeline stage (from the /metrics histograms) and database contention:
+statement latency as seen by the bot (including waits for the write
+lock) and "database is locked" errors.
+
+    python -m benchmarks.load_test --updates 2000 --concurrency 1 5 10 20
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks.common import percentile, summarize, use_temp_database
+
+DATABASE_URL = use_temp_database()
+# Quotas would turn most of a long run into "limit reached" replies
+os.environ.setdefault("FREE_DAILY_LIMIT", "1000000")
+# The fake downloader does not use the video cache
+os.environ.setdefault("VIDEO_CACHE_MAX_BYTES", "0")
+
+from sqlalchemy import event, func, insert, select  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+from yt_dlp.utils import DownloadError  # noqa: E402
+
+import src.handlers as handlers  # noqa: E402
+from main import build_application  # noqa: E402
+from src.batcher import download_writer, profile_writer  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.db import async_session, engine, init_db  # noqa: E402
+from src.downloader import MAX_FILE_SIZE, FileTooLargeError  # noqa: E402
+from src.jobs import JobWorker  # noqa: E402
+from src.metrics import STAGE_SECONDS  # noqa: E402
+from src.models import JOB_QUEUED, JOB_RUNNING, Job, User  # noqa: E402
+from src.scheduler import FREE, PREMIUM, PriorityScheduler  # noqa: E402
+from src.user_cache import UserCache  # noqa: E402
+from tests.fakes import FakeBotRequest  # noqa: E402
+
+PATH = DATABASE_URL.replace("sqlite+aiosqlite:///", "")
+STAGES = ("db_lookup", "slot_wait", "extract", "download", "merge", "upload", "cleanup")
+
+
+class FakeDownloader:
+    """Stand-in for ``download_video``: sleeps a lognormal latency (timed
+    as the ``download`` stage), then writes a sparse file of lognormal
+    size. ``error_rate`` of the calls raise DownloadError; sizes over
+    Telegram's limit raise FileTooLargeError.
+    """
+
+    def __init__(
+        self,
+        latency: float,
+        latency_sigma: float,
+        size_mb: float,
+        size_sigma: float,
+        error_rate: float,
+        seed: int = 1,
+    ):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.size_mb = size_mb
+        self.size_sigma = size_sigma
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str, output_filename: str, cache=None) -> str:
+        with self._lock:
+            self.calls += 1
+            latency = _lognormal(self._rng, self.latency, self.latency_sigma)
+            size = int(_lognormal(self._rng, self.size_mb, self.size_sigma) * 1024 * 1024)
+            failed = self._rng.random() < self.error_rate
+        with STAGE_SECONDS.labels("download").time():
+            time.sleep(latency)
+        if failed:
+            raise DownloadError(f"fake download failed: {url}")
+        if size > MAX_FILE_SIZE:
+            raise FileTooLargeError(size)
+        with open(output_filename, "wb") as fp:
+            fp.truncate(size)
+        return output_filename
+
+
+def _lognormal(rng: random.Random, median: float, sigma: float) -> float:
+    if median <= 0:
+        return 0.0
+    return rng.lognormvariate(0, sigma) * median if sigma else median
+
+
+def _load_callable(spec: str):
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+class ReplyTracker:
+    """Pairs every update with the bot's final reply in its chat.
+
+    A request ends with the video (``ok``), an edited status message
+    (``failed``), the daily-limit reply (``limit``), the one-download-
+    at-a-time reply (``busy``) or the database-locked reply (``db_busy``).
+    """
+
+    def __init__(self):
+        self.pending: dict[int, deque] = {}
+        self.latencies: list[float] = []
+        self.outcomes: dict[str, int] = {}
+
+    def expect(self, chat_id: int) -> None:
+        self.pending.setdefault(chat_id, deque()).append(time.perf_counter())
+
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self.pending.values())
+
+    def on_call(self, method: str, params: dict) -> None:
+        text = params.get("text") or ""
+        if method == "sendVideo":
+            outcome = "ok"
+        elif method == "editMessageText":
+            outcome = "failed"
+        elif method == "sendMessage" and text.startswith("Alcanzaste"):
+            outcome = "limit"
+        elif method == "sendMessage" and text.startswith("Ya tienes"):
+            outcome = "busy"
+        elif method == "sendMessage" and text.startswith("El servidor esta ocupado"):
+            outcome = "db_busy"
+        else:
+            return
+        queue = self.pending.get(int(params["chat_id"]))
+        if not queue:
+            return
+        # A busy reply answers the newest update, the others the oldest
+        started = queue.pop() if outcome == "busy" else queue.popleft()
+        self.latencies.append(time.perf_counter() - started)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+
+class DatabaseProbe:
+    """Statement latency and lock errors on the bot's engine."""
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.lock_errors = 0
+
+    def __enter__(self):
+        target = engine.sync_engine
+        event.listen(target, "before_cursor_execute", self._before)
+        event.listen(target, "after_cursor_execute", self._after)
+        event.listen(target, "handle_error", self._error)
+        return self
+
+    def __exit__(self, *_exc):
+        target = engine.sync_engine
+        event.remove(target, "before_cursor_execute", self._before)
+        event.remove(target, "after_cursor_execute", self._after)
+        event.remove(target, "handle_error", self._error)
+
+    def _before(self, conn, *_args):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after(self, conn, *_args):
+        self.latencies.append(time.perf_counter() - conn.info["query_started"].pop())
+
+    def _error(self, context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+        if "locked" in str(context.original_exception):
+            self.lock_errors += 1
+
+    def report(self, requests: int) -> dict:
+        return {
+            "statements": len(self.latencies),
+            "statements_per_request": round(len(self.latencies) / requests, 1),
+            "db_ms_per_request": round(sum(self.latencies) / requests * 1000, 2),
+            "statement_p99_ms": round(percentile(self.latencies, 99) * 1000, 2),
+            "statement_max_ms": round(max(self.latencies, default=0.0) * 1000, 2),
+            "lock_errors": self.lock_errors,
+        }
+
+
+def _stage_snapshot() -> dict:
+    return {
+        stage: (STAGE_SECONDS.labels(stage).count(), STAGE_SECONDS.labels(stage).sum())
+        for stage in STAGES
+    }
+
+
+def _stage_means(before: dict) -> dict:
+    means = {}
+    for stage, (count, total) in _stage_snapshot().items():
+        count -= before[stage][0]
+        if count:
+            means[stage] = round((total - before[stage][1]) / count * 1000, 2)
+    return means
+
+
+def _make_update(update_id: int, user_id: int, tweet_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": f"https://x.com/user{user_id}/status/{tweet_id}",
+        },
+    }
+
+
+def make_updates(args, seed: int = 1) -> list[dict]:
+    """``args.updates`` link messages from ``args.users`` users, round-robin,
+    for tweets picked with Zipf(1) popularity out of ``args.tweets``."""
+    rng = random.Random(seed)
+    tweets = args.tweets or args.updates
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, tweets + 1)))
+    return [
+        _make_update(
+            i + 1,
+            100_000 + i % args.users,
+            1_000_000 + rng.choices(range(tweets), cum_weights=weights)[0],
+        )
+        for i in range(args.updates)
+    ]
+
+
+async def _queued_jobs() -> int:
+    async with async_session() as session:
+        return await session.scalar(
+            select(func.count()).select_from(Job).where(Job.state.in_((JOB_QUEUED, JOB_RUNNING)))
+        )
+
+
+async def reset_database(args) -> None:
+    """A fresh database where ``args.premium_share`` of the users are premium."""
+    await engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(PATH + suffix)
+    await init_db()
+    premium = int(args.users * args.premium_share)
+    if premium:
+        until = datetime.now() + timedelta(days=30)
+        rows = [
+            {"telegram_id": 100_000 + u, "username": f"user{u}", "premium_until": until}
+            for u in range(premium)
+        ]
+        async with async_session() as session:
+            await session.execute(insert(User), rows)
+            await session.commit()
+
+
+async def measure(application, api, updates, limit: int, args) -> dict:
+    """Push every update (at ``args.rate`` per second, 0 = all at once) and
+    wait for the final replies."""
+    await reset_database(args)
+    handlers._download_scheduler = PriorityScheduler(
+        limit,
+        reserved={
+            PREMIUM: settings.PREMIUM_RESERVED_DOWNLOADS,
+            FREE: settings.FREE_RESERVED_DOWNLOADS,
+        },
+        aging_seconds=settings.PRIORITY_AGING_SECONDS,
+    )
+    handlers.user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
+    handlers._inflight_downloads.clear()
+    handlers._user_locks.clear()
+    worker = JobWorker(
+        concurrency=args.job_concurrency or max(settings.JOB_WORKER_CONCURRENCY, 2 * limit),
+        batch_size=settings.JOB_CLAIM_BATCH,
+        lease_seconds=settings.JOB_LEASE_SECONDS,
+        poll_seconds=settings.JOB_POLL_SECONDS,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+    handlers.job_worker = worker
+    await worker.start(lambda job: handlers.run_job(application, job))
+
+    tracker = ReplyTracker()
+    api.on_call = tracker.on_call
+    downloads_before = handlers.dl_video.calls if hasattr(handlers.dl_video, "calls") else None
+    stages_before = _stage_snapshot()
+    with DatabaseProbe() as probe:
+        started = time.perf_counter()
+        for i, data in enumerate(updates):
+            if args.rate:
+                await asyncio.sleep(max(0.0, started + i / args.rate - time.perf_counter()))
+            update = Update.de_json(data, application.bot)
+            tracker.expect(update.effective_chat.id)
+            await application.process_update(update)
+        deadline = time.perf_counter() + args.timeout
+        while tracker.waiting() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+            # Jobs that raised never reply; stop once the queue has drained
+            if not worker.in_flight() and not await _queued_jobs():
+                break
+        elapsed = time.perf_counter() - started
+        await worker.stop()
+        await download_writer.flush()
+        await profile_writer.flush()
+
+    async with async_session() as session:
+        jobs = dict(
+            (await session.execute(select(Job.state, func.count()).group_by(Job.state))).all()
+        )
+    result = {
+        "max_concurrent_downloads": limit,
+        **summarize(tracker.latencies, elapsed),
+        "unanswered": tracker.waiting(),
+        "outcomes": tracker.outcomes,
+        "jobs": jobs,
+        "stages_mean_ms": _stage_means(stages_before),
+        "db": probe.report(len(updates)),
+    }
+    if downloads_before is not None:
+        result["downloads"] = handlers.dl_video.calls - downloads_before
+    return result
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--tweets", type=int, default=0, help="distinct tweets (0 = --updates)")
+    parser.add_argument("--premium-share", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--job-concurrency", type=int, default=0,
+                        help="jobs run at once (0 = max(JOB_WORKER_CONCURRENCY, 2x downloads))")
+    parser.add_argument("--rate", type=float, default=0.0, help="updates/s (0 = all at once)")
+    parser.add_argument("--latency", type=float, default=2.0, help="median download seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--size-mb", type=float, default=8.0, help="median video size")
+    parser.add_argument("--size-sigma", type=float, default=0.8)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--upload-latency", type=float, default=0.2, help="seconds per sendVideo")
+    parser.add_argument("--upload-mbps", type=float, default=200.0)
+    parser.add_argument("--downloader", help="module:function replacing the fake downloader")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    if args.downloader:
+        handlers.dl_video = _load_callable(args.downloader)
+    else:
+        handlers.dl_video = FakeDownloader(
+            args.latency, args.latency_sigma, args.size_mb, args.size_sigma, args.error_rate
+        )
+    # Downloads run in the default executor (the process pool is not
+    # started); the scheduler, not the thread count, bounds them
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max(args.concurrency))
+    )
+
+    api = FakeBotRequest(upload_latency=args.upload_latency, upload_mbps=args.upload_mbps)
+    application = build_application(
+        Application.builder().request(api).get_updates_request(api)
+    )
+    await application.initialize()
+    profile_writer.start()
+    download_writer.start()
+    updates = make_updates(args)
+    results = []
+    try:
+        for limit in args.concurrency:
+            results.append(await measure(application, api, updates, limit, args))
+    finally:
+        await profile_writer.stop()
+        await download_writer.stop()
+        await application.shutdown()
+        await engine.dispose()
+        for suffix in ("", "-wal", "-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(PATH + suffix)
+    print(json.dumps({"updates": args.updates, "users": args.users, "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
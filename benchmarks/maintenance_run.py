@@ -0,0 +1,138 @@
+"""Time a database maintenance run and the reservations made during it.
+
+Seeds ``--rows`` downloads spread over the last year (most of them past
+the retention window), then runs the maintenance job while a writer keeps
+reserving downloads, as the download path does. ``batched`` deletes and
+vacuums ``--batch`` rows / pages per transaction, as the bot does;
+``single`` does each in one transaction. Reports the maintenance report
+and the reservation latency during the run, counting reservations that
+gave up waiting for the lock.
+
+    python -m benchmarks.maintenance_run --rows 1000000 --users 20000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import summarize, use_temp_database
+
+DATABASE_URL = use_temp_database()
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.db import async_session, engine, init_db, reserve_download  # noqa: E402
+from src.maintenance import DatabaseMaintenance  # noqa: E402
+
+PATH = DATABASE_URL.replace("sqlite+aiosqlite:///", "")
+
+
+def _ts(value: datetime) -> str:
+    """A datetime in the format SQLAlchemy stores in SQLite."""
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+async def seed(rows: int, users: int) -> None:
+    """A fresh database with ``rows`` downloads over the last year."""
+    await engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(PATH + suffix)
+    await init_db()
+    await engine.dispose()
+
+    rng = random.Random(1)
+    now = datetime.now()
+    db = sqlite3.connect(PATH)
+    db.execute("PRAGMA synchronous=OFF")
+    db.executemany(
+        "INSERT INTO users (telegram_id, username, is_bot, created_at) VALUES (?, ?, 0, ?)",
+        ((10_000 + u, f"user{u}", _ts(now)) for u in range(users)),
+    )
+    db.executemany(
+        "INSERT INTO downloads (user_id, tweet_url, created_at) VALUES (?, ?, ?)",
+        (
+            (
+                rng.randint(1, users),
+                f"https://x.com/i/status/{i}",
+                _ts(now - timedelta(seconds=rng.randrange(365 * 24 * 3600))),
+            )
+            for i in range(rows)
+        ),
+    )
+    db.commit()
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+
+
+async def reserve_until(done: asyncio.Event, users: int) -> tuple[list[float], int]:
+    """Reserve downloads until ``done``; returns the latencies and the
+    reservations that gave up waiting for the lock (busy timeout)."""
+    rng = random.Random(2)
+    latencies = []
+    locked = 0
+    i = 0
+    while not done.is_set():
+        t0 = time.perf_counter()
+        try:
+            async with async_session() as session:
+                await reserve_download(
+                    session, rng.randint(1, users), f"https://x.com/r/{i}", 10**9
+                )
+        except OperationalError:
+            locked += 1
+        latencies.append(time.perf_counter() - t0)
+        i += 1
+        # Leave the loop room to run the maintenance job
+        await asyncio.sleep(0.001)
+    return latencies, locked
+
+
+async def measure(batch_size: int, args) -> dict:
+    await seed(args.rows, args.users)
+    maintenance = DatabaseMaintenance(
+        retention_days=settings.DOWNLOAD_RETENTION_DAYS,
+        job_retention_days=settings.JOB_RETENTION_DAYS,
+        batch_size=batch_size,
+        vacuum_pages=10**9,
+    )
+    done = asyncio.Event()
+    writer = asyncio.create_task(reserve_until(done, args.users))
+    started = time.perf_counter()
+    report = await maintenance.run()
+    elapsed = time.perf_counter() - started
+    done.set()
+    latencies, locked = await writer
+    await engine.dispose()
+    return {
+        "report": report,
+        "reservations_during_run": {**summarize(latencies, elapsed), "locked_out": locked},
+        "db_size_mb": round(os.path.getsize(PATH) / 1024 / 1024, 1),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--batch", type=int, default=settings.MAINTENANCE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    results = {
+        "batched": await measure(args.batch, args),
+        "single": await measure(10**9, args),
+    }
+    for suffix in ("", "-wal", "-shm"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(PATH + suffix)
+    print(json.dumps({"rows": args.rows, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,167 @@
+"""Count user-profile database writes per 1k messages, before and after.
+
+``before`` replays what the handlers used to do: every message ran the
+ORM get_or_create_user, passing only the username outside /start, so the
+stored full name and language flipped between real values and None.
+``after`` does what the handlers do now: the user lookup is a
+dirty-checked upsert that only writes changed fields, and on the download
+path (where the user cache usually answers) the profile goes through the
+write-behind batcher. 1% of messages carry a renamed username. All users
+are registered before counting, so the numbers are steady-state.
+
+    python -m benchmarks.profile_writes --messages 1000 --users 100
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from benchmarks.common import use_temp_database
+
+use_temp_database()
+
+from sqlalchemy import event, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from src.batcher import WriteBehindBatcher  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.db import get_or_create_user, update_user_profiles  # noqa: E402
+from src.models import Base, User  # noqa: E402
+
+
+async def legacy_get_or_create_user(
+    session, telegram_id, username=None, full_name=None, is_bot=False, language_code=None
+):
+    """get_or_create_user as it was: assign every field, then commit."""
+    stmt = select(User).where(User.telegram_id == telegram_id)
+    user = (await session.execute(stmt)).scalar_one_or_none()
+    if user is None:
+        user = User(
+            telegram_id=telegram_id,
+            username=username,
+            full_name=full_name,
+            is_bot=is_bot,
+            language_code=language_code,
+        )
+        session.add(user)
+        await session.commit()
+        await session.refresh(user)
+    else:
+        user.username = username
+        user.full_name = full_name
+        user.language_code = language_code
+        await session.commit()
+    return user
+
+
+async def _write_stats(engine, checkpoint: str) -> tuple[int, int]:
+    """Rows changed on the (single) connection and WAL frames written since
+    the last TRUNCATE checkpoint."""
+    async with engine.connect() as conn:
+        rows = (await conn.execute(text("SELECT total_changes()"))).scalar()
+        frames = (await conn.execute(text(f"PRAGMA wal_checkpoint({checkpoint})"))).one()[1]
+    return rows, frames
+
+
+def _messages(count: int, users: int, seed: int = 1) -> list[tuple[str, dict]]:
+    rng = random.Random(seed)
+    names = {u: f"user{u}" for u in range(users)}
+    messages = []
+    for _ in range(count):
+        u = rng.randrange(users)
+        if rng.random() < 0.01:
+            names[u] = f"user{u}_{rng.randrange(10**6)}"
+        kind = rng.choices(["start", "status", "download"], [5, 15, 80])[0]
+        profile = {
+            "telegram_id": 10_000 + u,
+            "username": names[u],
+            "full_name": f"User {u}",
+            "language_code": "es",
+        }
+        messages.append((kind, profile))
+    return messages
+
+
+async def run_before(maker, messages) -> None:
+    for kind, p in messages:
+        async with maker() as session:
+            if kind == "start":
+                await legacy_get_or_create_user(
+                    session,
+                    p["telegram_id"],
+                    p["username"],
+                    p["full_name"],
+                    language_code=p["language_code"],
+                )
+            else:
+                await legacy_get_or_create_user(session, p["telegram_id"], p["username"])
+
+
+async def run_after(maker, messages, flush_every: int) -> None:
+    async def flush(profiles):
+        async with maker() as session:
+            await update_user_profiles(session, profiles)
+
+    batcher = WriteBehindBatcher("profiles", flush, max_batch=500, max_delay=1, max_pending=10_000)
+    for i, (kind, p) in enumerate(messages, 1):
+        if kind == "download":
+            await batcher.submit(p, key=p["telegram_id"])
+        else:
+            async with maker() as session:
+                await get_or_create_user(session, **p)
+        # Stand-in for the flush interval
+        if i % flush_every == 0:
+            await batcher.flush()
+    await batcher.stop()
+
+
+async def measure(name: str, messages, flush_every: int) -> dict:
+    # One connection so total_changes() covers every write; no automatic
+    # checkpoints so the WAL keeps every frame written
+    engine = create_async_engine(
+        settings.DATABASE_URL.replace(".db", f"-{name}.db"), poolclass=StaticPool
+    )
+    event.listen(
+        engine.sync_engine,
+        "connect",
+        lambda dbapi_conn, _: dbapi_conn.execute("PRAGMA wal_autocheckpoint=0"),
+    )
+    async with engine.begin() as conn:
+        await conn.execute(text("PRAGMA journal_mode=WAL"))
+        await conn.run_sync(Base.metadata.create_all)
+    maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with maker() as session:
+        for p in {p["telegram_id"]: p for _, p in messages}.values():
+            original = f"user{p['telegram_id'] - 10_000}"
+            await get_or_create_user(session, **{**p, "username": original})
+    rows_before, _ = await _write_stats(engine, "TRUNCATE")
+    if name == "before":
+        await run_before(maker, messages)
+    else:
+        await run_after(maker, messages, flush_every)
+    rows, frames = await _write_stats(engine, "PASSIVE")
+    await engine.dispose()
+    per_1k = 1000 / len(messages)
+    return {
+        "rows_written_per_1k": round((rows - rows_before) * per_1k, 1),
+        "wal_frames_per_1k": round(frames * per_1k, 1),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--flush-every", type=int, default=50, help="messages per batch flush")
+    args = parser.parse_args()
+
+    messages = _messages(args.messages, args.users)
+    results = {
+        name: await measure(name, messages, args.flush_every) for name in ("before", "after")
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""Run the real ``download_video`` against a local media server.
+
+For every fault profile, layout (progressive MP4, HLS, DASH) and
+fragment concurrency, downloads the same video ``--runs`` times with
+yt-dlp and reports wall time, failures, the extract/download/merge stage
+times from the metrics histograms and what the server saw: requests,
+429s sent, responses dropped midway, bytes sent and peak concurrent
+requests.
+
+Profiles: ``clean``; ``throttled`` (``--bandwidth-mbps`` per connection);
+``flaky`` (``--throttle-share`` of requests answered 429 and
+``--drop-share`` of media responses cut off halfway).
+
+With ffmpeg installed the server serves real H.264/AAC media, so DASH's
+separate tracks get merged and ``merge`` is measured; without it the
+payloads are filler bytes and DASH fails at format selection, as it
+would in a deployment without ffmpeg.
+
+    python -m benchmarks.real_download --size-mb 8 --runs 3 --fragments 1 4
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import summarize
+from src import downloader
+from src.metrics import STAGE_SECONDS
+from tests.fakes import MediaFiles, MediaServer
+
+STAGES = ("extract", "download", "merge")
+
+
+def _stages() -> dict:
+    return {
+        stage: (STAGE_SECONDS.labels(stage).count(), STAGE_SECONDS.labels(stage).sum())
+        for stage in STAGES
+    }
+
+
+def _stage_means(before: dict) -> dict:
+    means = {}
+    for stage, (count, total) in _stages().items():
+        count -= before[stage][0]
+        if count:
+            means[stage] = round((total - before[stage][1]) / count * 1000, 1)
+    return means
+
+
+def measure(server: MediaServer, layout: str, runs: int, workdir: str) -> dict:
+    server.reset_stats()
+    before = _stages()
+    latencies = []
+    errors = {}
+    sizes = []
+    started = time.perf_counter()
+    for i in range(runs):
+        output = os.path.join(workdir, f"{layout}-{i}.mp4")
+        t0 = time.perf_counter()
+        try:
+            path = downloader.download_video(server.url(layout), output)
+        except Exception as e:
+            # First line of yt-dlp's message, without the URL-specific tail
+            key = f"{type(e).__name__}: {str(e).splitlines()[0][:90]}"
+            errors[key] = errors.get(key, 0) + 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+        sizes.append(os.path.getsize(path))
+        os.remove(path)
+    elapsed = time.perf_counter() - started
+    result = summarize(latencies, elapsed)
+    del result["throughput_per_s"]
+    return {
+        **result,
+        "failed": sum(errors.values()),
+        "errors": errors,
+        "mb_per_s": round(sum(sizes) / sum(latencies) / 1024 / 1024, 1) if latencies else 0.0,
+        "stages_mean_ms": _stage_means(before),
+        "server": dict(server.stats),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=8.0, help="filler media size")
+    parser.add_argument("--segments", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--layouts", nargs="+", default=["progressive", "hls", "dash"])
+    parser.add_argument("--profiles", nargs="+", default=["clean", "throttled", "flaky"])
+    parser.add_argument("--fragments", type=int, nargs="+", default=[1, 4],
+                        help="yt-dlp concurrent_fragment_downloads values (HLS/DASH)")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0)
+    parser.add_argument("--throttle-share", type=float, default=0.1)
+    parser.add_argument("--drop-share", type=float, default=0.1)
+    parser.add_argument("--filler", action="store_true", help="filler bytes even with ffmpeg")
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") and not args.filler:
+        media = MediaFiles.generate(segments=args.segments)
+    else:
+        media = MediaFiles.filler(int(args.size_mb * 1024 * 1024), args.segments)
+    profiles = {
+        "clean": {},
+        "throttled": {"bandwidth": int(args.bandwidth_mbps * 1_000_000 / 8)},
+        "flaky": {"throttle_share": args.throttle_share, "drop_share": args.drop_share},
+    }
+
+    workdir = tempfile.mkdtemp(prefix="dl-video-bench-")
+    default_opts = dict(downloader.DEFAULT_OPTS)
+    results = []
+    try:
+        for profile in args.profiles:
+            server = MediaServer(media, **profiles[profile]).start()
+            try:
+                for layout in args.layouts:
+                    fragments = [1] if layout == "progressive" else args.fragments
+                    for count in fragments:
+                        downloader.DEFAULT_OPTS["concurrent_fragment_downloads"] = count
+                        results.append({
+                            "profile": profile,
+                            "layout": layout,
+                            "fragments": count,
+                            **measure(server, layout, args.runs, workdir),
+                        })
+            finally:
+                server.stop()
+    finally:
+        downloader.DEFAULT_OPTS.clear()
+        downloader.DEFAULT_OPTS.update(default_opts)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total = len(media.progressive)
+    print(json.dumps(
+        {"real_media": media.real, "media_mb": round(total / 1024 / 1024, 1), "runs": results},
+        indent=2,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Compare quota reservation strategies: latency and correctness under contention.
+
+``select_count`` is the original implementation (SELECT COUNT over the
+user's downloads for today, then INSERT, then refresh); ``single_statement``
+is the current ``src.db.reserve_download``. Both run against the same
+SQLite file, seeded with download history for the measured user.
+
+    python -m benchmarks.reservation_latency --history 100000 --reservations 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.common import summarize, use_temp_database
+
+use_temp_database()
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.db import reserve_download  # noqa: E402
+from src.models import Base, Download, User  # noqa: E402
+
+
+async def reserve_select_count(session, user_id: int, tweet_url: str, daily_limit: int):
+    """The original check-then-insert reservation."""
+    stmt = select(func.count(Download.id)).where(
+        Download.user_id == user_id,
+        func.date(Download.created_at) == date.today(),
+    )
+    count = (await session.execute(stmt)).scalar() or 0
+    if count >= daily_limit:
+        return None
+    download = Download(user_id=user_id, tweet_url=tweet_url, created_at=datetime.now())
+    session.add(download)
+    await session.commit()
+    await session.refresh(download)
+    return download
+
+
+STRATEGIES = {
+    "select_count": reserve_select_count,
+    "single_statement": reserve_download,
+}
+
+
+async def _seed(maker, history: int) -> tuple[int, int]:
+    """Create the measured user (with ``history`` past downloads) and a user
+    for the contention run."""
+    async with maker() as session:
+        users = [User(telegram_id=1), User(telegram_id=2)]
+        session.add_all(users)
+        await session.commit()
+        busy, contended = users[0].id, users[1].id
+        start = datetime.now() - timedelta(days=365)
+        rows = [
+            {
+                "user_id": busy,
+                "tweet_url": f"https://x.com/i/status/{i}",
+                "created_at": start + timedelta(seconds=i * 300),
+            }
+            for i in range(history)
+        ]
+        for offset in range(0, len(rows), 10_000):
+            await session.execute(insert(Download), rows[offset : offset + 10_000])
+        await session.commit()
+    return busy, contended
+
+
+async def bench_latency(maker, reserve, user_id: int, reservations: int) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for i in range(reservations):
+        async with maker() as session:
+            t0 = time.perf_counter()
+            await reserve(session, user_id, f"https://x.com/i/status/new{i}", 10**9)
+            latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def bench_contention(makers, reserve, user_id: int, attempts: int, limit: int) -> dict:
+    async def one(i: int):
+        async with makers[i % len(makers)]() as session:
+            return await reserve(session, user_id, f"https://x.com/i/status/c{i}", limit)
+
+    results = await asyncio.gather(*(one(i) for i in range(attempts)), return_exceptions=True)
+    granted = sum(1 for r in results if r is not None and not isinstance(r, Exception))
+    errors = sum(1 for r in results if isinstance(r, Exception))
+    async with makers[0]() as session:
+        await session.execute(text("DELETE FROM downloads WHERE user_id = :u"), {"u": user_id})
+        await session.commit()
+    return {"limit": limit, "attempts": attempts, "granted": granted, "errors": errors}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, default=100_000)
+    parser.add_argument("--reservations", type=int, default=500)
+    parser.add_argument("--attempts", type=int, default=300, help="parallel reservations")
+    parser.add_argument("--limit", type=int, default=25)
+    parser.add_argument("--connections", type=int, default=4)
+    args = parser.parse_args()
+
+    engines = [
+        create_async_engine(settings.DATABASE_URL, connect_args={"timeout": 30})
+        for _ in range(args.connections)
+    ]
+    makers = [async_sessionmaker(bind=e, expire_on_commit=False) for e in engines]
+    async with engines[0].begin() as conn:
+        await conn.execute(text("PRAGMA journal_mode=WAL"))
+        await conn.run_sync(Base.metadata.create_all)
+    busy, contended = await _seed(makers[0], args.history)
+
+    results = {}
+    for name, reserve in STRATEGIES.items():
+        results[name] = {
+            "latency": await bench_latency(makers[0], reserve, busy, args.reservations),
+            "contention": await bench_contention(
+                makers, reserve, contended, args.attempts, args.limit
+            ),
+        }
+    for e in engines:
+        await e.dispose()
+    print(json.dumps({"history_rows": args.history, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+"""Measure how update throughput scales with the number of shard workers.
+
+Each update is handled by a CPU-bound synthetic handler (hashing for a few
+milliseconds, standing in for parsing/bookkeeping work that holds the GIL)
+that then replies through a local fake Bot API server. Updates are routed
+through ``ShardPool`` exactly as the sharded dispatcher does; throughput is
+measured from routing the first update until the last reply arrives;
+latency is from routing an update until its reply arrives.
+Speedup is only visible with as many free CPU cores as shards.
+
+    python -m benchmarks.shard_scaling --updates 400 --shards 1 2 4 --work-ms 5
+"""
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, MessageHandler, filters
+
+from benchmarks.common import summarize
+from src.sharding import ShardPool, shard_for
+from tests.fakes import FakeTelegramServer
+
+TOKEN = "123456:benchmark"
+
+
+def _busy(work_ms: float) -> None:
+    deadline = time.perf_counter() + work_ms / 1000
+    digest = b"x"
+    while time.perf_counter() < deadline:
+        digest = hashlib.sha256(digest).digest()
+
+
+def build_cpu_app(base_url: str, work_ms: float, builder: ApplicationBuilder) -> Application:
+    """Shard worker application with a single CPU-bound echo handler."""
+
+    async def handle(update: Update, context) -> None:
+        _busy(work_ms)
+        await update.message.reply_text(f"{os.getpid()}:{update.update_id}")
+
+    application = builder.token(TOKEN).base_url(base_url).build()
+    application.add_handler(MessageHandler(filters.TEXT, handle))
+    return application
+
+
+def _make_update(update_id: int, user_id: int) -> Update:
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": "ping",
+            },
+        },
+        None,
+    )
+
+
+class _ReplyCounter:
+    """Counts replies, when each update was answered and by which process."""
+
+    def __init__(self):
+        self.count = 0
+        self.replied_at: dict[int, float] = {}
+        self.pids: dict[int, set[str]] = {}
+        self._cond = threading.Condition()
+
+    def on_call(self, method: str, params: dict) -> None:
+        if method != "sendMessage":
+            return
+        with self._cond:
+            pid, update_id = params["text"].split(":")
+            self.count += 1
+            self.replied_at[int(update_id)] = time.perf_counter()
+            self.pids.setdefault(int(params["chat_id"]), set()).add(pid)
+            self._cond.notify_all()
+
+    def wait_for(self, count: int, timeout: float = 120.0) -> None:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.count >= count, timeout):
+                raise TimeoutError(f"got {self.count}/{count} replies")
+
+
+async def bench_shards(shards: int, updates: int, users: int, work_ms: float) -> dict:
+    counter = _ReplyCounter()
+    server = FakeTelegramServer(on_call=counter.on_call).start()
+    pool = ShardPool(functools.partial(build_cpu_app, server.base_url, work_ms), shards)
+    loop = asyncio.get_running_loop()
+    try:
+        pool.start()
+        # Warm up: one update per shard so every worker is running
+        for user_id in range(shards):
+            await pool.route(_make_update(user_id + 1, user_id))
+        await loop.run_in_executor(None, counter.wait_for, shards)
+
+        first = counter.count
+        routed_at = {}
+        started = time.perf_counter()
+        for i in range(updates):
+            update_id = shards + i + 1
+            routed_at[update_id] = time.perf_counter()
+            await pool.route(_make_update(update_id, 1_000 + i % users))
+        await loop.run_in_executor(None, counter.wait_for, first + updates)
+        elapsed = time.perf_counter() - started
+    finally:
+        await loop.run_in_executor(None, pool.stop)
+        server.stop()
+
+    latencies = [counter.replied_at[u] - t for u, t in routed_at.items()]
+    result = summarize(latencies, elapsed)
+    result["shards"] = shards
+    # Every user must have been answered by exactly one process
+    result["users_split_across_shards"] = sum(
+        1 for user_id, pids in counter.pids.items() if user_id >= 1_000 and len(pids) > 1
+    )
+    result["users_per_shard"] = [
+        sum(1 for u in range(users) if shard_for(1_000 + u, shards) == s) for s in range(shards)
+    ]
+    return result
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=400)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--work-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    results = {}
+    for shards in args.shards:
+        results[shards] = await bench_shards(shards, args.updates, args.users, args.work_ms)
+    baseline = results[args.shards[0]]["throughput_per_s"]
+    for result in results.values():
+        result["speedup"] = round(result["throughput_per_s"] / baseline, 2)
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
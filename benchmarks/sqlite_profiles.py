@@ -0,0 +1,241 @@
+"""Compare SQLite pragma profiles on a database with 1M+ download rows.
+
+Every profile runs on a copy of the same seeded database:
+
+- ``reserve``: sequential quota reservations (the download hot path)
+- ``status``: /status reads (today's count + premium status) through
+  a read-only pool
+- ``history``: per-day download counts over the last 90 days (a large
+  scan with a GROUP BY / ORDER BY, where cache and temp_store matter)
+- ``mixed``: concurrent reservations and /status reads through pools of
+  the configured size
+
+    python -m benchmarks.sqlite_profiles --rows 1000000 --users 20000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import summarize, use_temp_database
+
+DATABASE_URL = use_temp_database()
+
+from sqlalchemy import func, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from src.config import settings  # noqa: E402
+from src.db import (  # noqa: E402
+    apply_pragmas,
+    count_downloads_today,
+    get_premium_until,
+    migrate,
+    reserve_download,
+    sqlite_pragmas,
+)
+from src.models import Base, Download  # noqa: E402
+
+PROFILES = {
+    # What the bot ran with before: SQLite's defaults (synchronous=FULL,
+    # 2 MB page cache, no mmap, temp tables on disk)
+    "sqlite_defaults": {},
+    # The configured profile (settings' SQLITE_*)
+    "configured": sqlite_pragmas(),
+    # ... trading the last commits on power loss back for an fsync per commit
+    "durable": {**sqlite_pragmas(), "synchronous": "FULL"},
+    # ... plus a 64 MB page cache and in-memory temp tables
+    "large_cache": {**sqlite_pragmas(), "cache_size": -64 * 1024, "temp_store": "MEMORY"},
+}
+
+
+def _path(url: str) -> str:
+    return url.replace("sqlite+aiosqlite:///", "")
+
+
+def _remove_database(url: str) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(_path(url) + suffix)
+
+
+def _ts(value: datetime) -> str:
+    """A datetime in the format SQLAlchemy stores in SQLite."""
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+async def seed(rows: int, users: int) -> None:
+    """Create the schema and ``rows`` downloads over the last year."""
+    engine = create_async_engine(DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.execute(text("PRAGMA journal_mode=WAL"))
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate)
+    await engine.dispose()
+
+    rng = random.Random(1)
+    now = datetime.now()
+    db = sqlite3.connect(_path(DATABASE_URL))
+    db.execute("PRAGMA synchronous=OFF")
+    db.executemany(
+        "INSERT INTO users (telegram_id, username, is_bot, created_at) VALUES (?, ?, 0, ?)",
+        ((10_000 + u, f"user{u}", _ts(now)) for u in range(users)),
+    )
+    db.executemany(
+        "INSERT INTO subscriptions (user_id, telegram_charge_id, stars_paid, "
+        "starts_at, expires_at, created_at) VALUES (?, ?, 250, ?, ?, ?)",
+        (
+            (u, f"charge{u}", _ts(now - timedelta(days=10)), _ts(now + timedelta(days=20)), _ts(now))
+            for u in range(1, users + 1, 10)
+        ),
+    )
+    db.execute(
+        "UPDATE users SET premium_until = "
+        "(SELECT max(expires_at) FROM subscriptions WHERE user_id = users.id)"
+    )
+    db.executemany(
+        "INSERT INTO downloads (user_id, tweet_url, created_at) VALUES (?, ?, ?)",
+        (
+            (
+                rng.randint(1, users),
+                f"https://x.com/i/status/{i}",
+                _ts(now - timedelta(seconds=rng.randrange(365 * 24 * 3600))),
+            )
+            for i in range(rows)
+        ),
+    )
+    db.commit()
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+
+
+async def bench_reserve(maker, users: int, count: int) -> dict:
+    rng = random.Random(2)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        async with maker() as session:
+            t0 = time.perf_counter()
+            await reserve_download(session, rng.randint(1, users), f"https://x.com/r/{i}", 10**9)
+            latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def _status(maker, user_id: int) -> None:
+    async with maker() as session:
+        await count_downloads_today(session, user_id)
+        await get_premium_until(session, user_id)
+
+
+async def bench_status(maker, users: int, count: int) -> dict:
+    rng = random.Random(3)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        t0 = time.perf_counter()
+        await _status(maker, rng.randint(1, users))
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def bench_history(maker, count: int) -> dict:
+    day = func.date(Download.created_at)
+    stmt = (
+        select(day, func.count())
+        .where(Download.created_at >= datetime.now() - timedelta(days=90))
+        .group_by(day)
+        .order_by(func.count().desc())
+    )
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        async with maker() as session:
+            t0 = time.perf_counter()
+            (await session.execute(stmt)).all()
+            latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def bench_mixed(write_maker, read_maker, users: int, count: int, concurrency: int) -> dict:
+    rng = random.Random(4)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            t0 = time.perf_counter()
+            if i % 4 == 0:
+                async with write_maker() as session:
+                    await reserve_download(
+                        session, rng.randint(1, users), f"https://x.com/m/{i}", 10**9
+                    )
+            else:
+                await _status(read_maker, rng.randint(1, users))
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def run_profile(name: str, pragmas: dict, args) -> dict:
+    url = DATABASE_URL.replace(".db", f"-{name}.db")
+    shutil.copy(_path(DATABASE_URL), _path(url))
+    write_engine = create_async_engine(
+        url, pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW
+    )
+    read_engine = create_async_engine(url, pool_size=settings.DB_READ_POOL_SIZE, max_overflow=0)
+    apply_pragmas(write_engine, pragmas)
+    apply_pragmas(read_engine, pragmas, query_only=True)
+    write_maker = async_sessionmaker(bind=write_engine, expire_on_commit=False)
+    read_maker = async_sessionmaker(bind=read_engine, expire_on_commit=False)
+    try:
+        return {
+            "reserve": await bench_reserve(write_maker, args.users, args.ops),
+            "status": await bench_status(read_maker, args.users, args.ops),
+            "history": await bench_history(read_maker, args.scans),
+            "mixed": await bench_mixed(
+                write_maker, read_maker, args.users, args.ops * 2, args.concurrency
+            ),
+        }
+    finally:
+        await write_engine.dispose()
+        await read_engine.dispose()
+        _remove_database(url)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--ops", type=int, default=500, help="operations per workload")
+    parser.add_argument("--scans", type=int, default=5, help="history scans")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    await seed(args.rows, args.users)
+    seeded_s = round(time.perf_counter() - started, 1)
+
+    results = {name: await run_profile(name, PROFILES[name], args) for name in args.profiles}
+    _remove_database(DATABASE_URL)
+    summary = {
+        name: {workload: r[workload]["p50_ms"] for workload in r}
+        for name, r in results.items()
+    }
+    print(
+        json.dumps(
+            {"rows": args.rows, "seed_s": seeded_s, "p50_ms": summary, "results": results},
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
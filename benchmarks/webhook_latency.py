@@ -0,0 +1,165 @@
+"""Measure update-to-reply latency of webhook mode vs long polling.
+
+Runs the real bot application against a local fake Bot API server, so no
+Telegram access is needed. Each synthetic update is a command from its own
+chat; latency is the time from handing the update over (POST to the
+webhook, or making it available to getUpdates) until the bot's reply
+reaches the fake API.
+
+    python -m benchmarks.webhook_latency --updates 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import socket
+import time
+
+from benchmarks.common import summarize, use_temp_database
+
+use_temp_database()
+
+import httpx  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from main import build_application  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.db import engine, init_db  # noqa: E402
+from tests.fakes import FakeTelegramServer  # noqa: E402
+
+SECRET_TOKEN = "benchmark-secret"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _make_update(update_id: int, chat_id: int, command: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": command,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+class _ReplyWaiter:
+    """Resolves one future per chat when the bot's reply arrives."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.pending: dict[int, asyncio.Future] = {}
+
+    def expect(self, chat_id: int) -> asyncio.Future:
+        future = self.loop.create_future()
+        self.pending[chat_id] = future
+        return future
+
+    def on_call(self, method: str, params: dict) -> None:
+        if method != "sendMessage":
+            return
+        future = self.pending.pop(int(params["chat_id"]), None)
+        if future is not None:
+            self.loop.call_soon_threadsafe(future.set_result, time.perf_counter())
+
+
+async def _drive(send, waiter: _ReplyWaiter, updates: int, concurrency: int, command: str):
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int) -> None:
+        async with limit:
+            chat_id = 10_000 + i
+            replied = waiter.expect(chat_id)
+            started = time.perf_counter()
+            await send(_make_update(i + 1, chat_id, command))
+            latencies.append(await asyncio.wait_for(replied, 30) - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(updates)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def bench_webhook(updates: int, concurrency: int, command: str) -> dict:
+    waiter = _ReplyWaiter(asyncio.get_running_loop())
+    server = FakeTelegramServer(on_call=waiter.on_call).start()
+    application = build_application(Application.builder().base_url(server.base_url))
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/{settings.WEBHOOK_PATH}"
+    try:
+        async with application, httpx.AsyncClient() as client:
+            await application.updater.start_webhook(
+                listen="127.0.0.1",
+                port=port,
+                url_path=settings.WEBHOOK_PATH,
+                webhook_url=url,
+                secret_token=SECRET_TOKEN,
+                max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+            )
+            await application.start()
+
+            async def send(update: dict) -> None:
+                response = await client.post(
+                    url,
+                    content=json.dumps(update),
+                    headers={
+                        "Content-Type": "application/json",
+                        "X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN,
+                    },
+                )
+                response.raise_for_status()
+
+            result = await _drive(send, waiter, updates, concurrency, command)
+            await application.updater.stop()
+            await application.stop()
+    finally:
+        server.stop()
+    return result
+
+
+async def bench_polling(updates: int, concurrency: int, command: str) -> dict:
+    waiter = _ReplyWaiter(asyncio.get_running_loop())
+    server = FakeTelegramServer(on_call=waiter.on_call).start()
+    application = build_application(Application.builder().base_url(server.base_url))
+    try:
+        async with application:
+            await application.updater.start_polling(poll_interval=0.0, timeout=10)
+            await application.start()
+
+            async def send(update: dict) -> None:
+                server.push_update(update)
+
+            result = await _drive(send, waiter, updates, concurrency, command)
+            await application.updater.stop()
+            await application.stop()
+    finally:
+        server.stop()
+    return result
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--command", default="/help", help="e.g. /help or /status")
+    parser.add_argument("--mode", choices=["both", "webhook", "polling"], default="both")
+    args = parser.parse_args()
+
+    await init_db()
+    results = {}
+    if args.mode in ("both", "polling"):
+        results["polling"] = await bench_polling(args.updates, args.concurrency, args.command)
+    if args.mode in ("both", "webhook"):
+        results["webhook"] = await bench_webhook(args.updates, args.concurrency, args.command)
+    await engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
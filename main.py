@@ -1,40 +1,154 @@
+import asyncio
 import logging
 
 from telegram import Update
 from telegram.ext import (
     Application,
+    ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     PreCheckoutQueryHandler,
     filters,
 )
 
+from src.batcher import download_writer, profile_writer
 from src.config import settings
-from src.db import init_db
+from src.db import engine, init_db
+from src.disk_cache import video_cache
 from src.handlers import (
+    download_concurrency,
     download_video,
     help_command,
     pre_checkout_handler,
+    run_job,
     start,
     status_command,
     subscribe_command,
     successful_payment_handler,
 )
+from src.jobs import job_worker
+from src.maintenance import db_maintenance
+from src.metrics import MetricsServer, registry
+from src.pool import download_pool
+from src.sharding import ShardPool, run_dispatcher
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
 
 
 async def post_init(application: Application) -> None:
-    """Initialize the database when the bot starts."""
+    """Initialize the database, video cache, download pool, write batching
+    and job worker, schedule database maintenance and concurrency control
+    and serve metrics."""
+    # Shard workers share a database the dispatcher already set up
+    if "shard" not in application.bot_data:
+        await init_db()
+    if video_cache is not None:
+        video_cache.reconcile()
+    download_pool.start()
+    profile_writer.start()
+    download_writer.start()
+    await job_worker.start(lambda job: run_job(application, job))
+    schedule_maintenance(application)
+    schedule_concurrency_control(application)
+    await start_metrics_server(application)
+
+
+def schedule_maintenance(application: Application) -> None:
+    """Run database maintenance periodically (in one shard worker only)."""
+    if application.bot_data.get("shard", 0) != 0:
+        return
+    if application.job_queue is None:
+        logger.warning(
+            "JobQueue unavailable (python-telegram-bot[job-queue] not installed), "
+            "database maintenance disabled"
+        )
+        return
+    application.job_queue.run_repeating(
+        db_maintenance.run_job,
+        interval=settings.MAINTENANCE_INTERVAL_SECONDS,
+        # Off the startup path
+        first=60,
+        name="db-maintenance",
+    )
+
+
+def schedule_concurrency_control(application: Application) -> None:
+    """Resize the download limit periodically if ADAPTIVE_CONCURRENCY is on
+    (in every shard worker: each has its own limit)."""
+    if download_concurrency is None:
+        return
+    if application.job_queue is None:
+        logger.warning(
+            "JobQueue unavailable (python-telegram-bot[job-queue] not installed), "
+            "adaptive download concurrency disabled"
+        )
+        return
+    application.job_queue.run_repeating(
+        download_concurrency.run_job,
+        interval=settings.ADAPTIVE_INTERVAL_SECONDS,
+        name="download-concurrency",
+    )
+
+
+async def start_metrics_server(application: Application) -> None:
+    """Serve ``/metrics`` if METRICS_PORT is set (one port per shard worker)."""
+    if settings.METRICS_PORT <= 0:
+        return
+    port = settings.METRICS_PORT + application.bot_data.get("shard", 0)
+    server = MetricsServer(registry, settings.METRICS_LISTEN, port)
+    try:
+        await server.start()
+    except OSError as e:
+        logger.error(f"Metrics server failed to start on port {port}: {e}")
+        return
+    application.bot_data["metrics_server"] = server
+
+
+async def prepare_database() -> None:
+    """Create the schema and run migrations once, before the shard workers
+    start, so they don't race on the same SQLite file."""
     await init_db()
+    # Its connections belong to this event loop
+    await engine.dispose()
 
 
-def main() -> None:
-    """Start the bot."""
-    application = Application.builder().token(settings.TOKEN).post_init(post_init).build()
+async def post_stop(application: Application) -> None:
+    """Let running jobs finish (or re-queue them) while the bot can still send,
+    then flush buffered writes."""
+    await job_worker.stop()
+    await profile_writer.stop()
+    await download_writer.stop()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Stop the download worker processes and the metrics server."""
+    download_pool.shutdown()
+    server = application.bot_data.pop("metrics_server", None)
+    if server is not None:
+        await server.stop()
+
+
+def build_application(builder: ApplicationBuilder | None = None) -> Application:
+    """Build the bot application with every handler registered.
+
+    A pre-configured ``builder`` can be passed in, e.g. by the benchmarks
+    to point the bot at a local fake Bot API server.
+    """
+    builder = (builder or Application.builder()).token(settings.TOKEN)
+    if settings.UPDATE_QUEUE_SIZE > 0:
+        builder = builder.update_queue(asyncio.Queue(maxsize=settings.UPDATE_QUEUE_SIZE))
+    if settings.CONCURRENT_UPDATES > 0:
+        builder = builder.concurrent_updates(settings.CONCURRENT_UPDATES)
+    application = (
+        builder.post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Commands
     application.add_handler(CommandHandler("start", start))
@@ -52,9 +166,42 @@ def main() -> None:
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, download_video)
     )
+    return application
+
+
+def webhook_options() -> dict | None:
+    """Webhook server settings, or None to use long polling."""
+    if not settings.WEBHOOK_URL:
+        return None
+    return {
+        "listen": settings.WEBHOOK_LISTEN,
+        "port": settings.WEBHOOK_PORT,
+        "url_path": settings.WEBHOOK_PATH,
+        "webhook_url": f"{settings.WEBHOOK_URL.rstrip('/')}/{settings.WEBHOOK_PATH}",
+        "secret_token": settings.WEBHOOK_SECRET_TOKEN or None,
+        "max_connections": settings.WEBHOOK_MAX_CONNECTIONS,
+    }
+
+
+def main() -> None:
+    """Start the bot."""
+    if settings.SHARD_WORKERS > 0:
+        # This process only fetches updates; the workers run the bot
+        asyncio.run(prepare_database())
+        pool = ShardPool(build_application, settings.SHARD_WORKERS, settings.UPDATE_QUEUE_SIZE)
+        asyncio.run(
+            run_dispatcher(settings.TOKEN, pool, webhook_options(), Update.ALL_TYPES)
+        )
+        return
+
+    application = build_application()
 
     # Run the bot until the user presses Ctrl-C
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    options = webhook_options()
+    if options:
+        application.run_webhook(allowed_updates=Update.ALL_TYPES, **options)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
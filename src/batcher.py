@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+
+from src.config import settings
+from src.db import async_session, finish_downloads, retry_locked, update_user_profiles
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram in stats()
+BATCH_SIZE_BUCKETS = (1, 10, 100, 1000)
+
+# Tries of a batch while SQLite reports the database locked
+_FLUSH_ATTEMPTS = 5
+
+
+class WriteBehindBatcher:
+    """Buffers database writes and flushes them in one transaction.
+
+    A flush happens ``max_delay`` seconds after the first buffered item or
+    as soon as ``max_batch`` items are waiting, whichever comes first.
+    Items submitted with a ``key`` replace a pending item with the same key
+    (only the latest profile of a user is written). Memory is bounded: once
+    ``max_pending`` items wait, ``submit`` flushes before buffering more.
+    A batch that finds the database locked is retried with backoff; one
+    that still fails is dropped and counted in ``failed_items``.
+    """
+
+    def __init__(self, name: str, flush, max_batch: int, max_delay: float, max_pending: int):
+        self.name = name
+        self._flush_items = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._pending: dict = {}
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._loop_task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.flushed_items = 0
+        self.failed_items = 0
+        self.max_batch_size = 0
+        self.batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    def start(self) -> None:
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background loop and flush everything still buffered."""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        await self.flush()
+        logger.info(f"{self.name} writer stopped: {self.stats()}")
+
+    async def submit(self, item, key=None) -> None:
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+        if key is None:
+            self._seq += 1
+            key = (None, self._seq)
+        else:
+            # Re-insert so a replaced item keeps its newest position
+            self._pending.pop(key, None)
+        self._pending[key] = item
+        if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> None:
+        """Write everything buffered so far, ``max_batch`` items at a time."""
+        async with self._flush_lock:
+            while self._pending:
+                keys = list(self._pending)[: self.max_batch]
+                items = [self._pending.pop(key) for key in keys]
+                started = time.perf_counter()
+                try:
+                    await retry_locked(
+                        lambda: self._flush_items(items), attempts=_FLUSH_ATTEMPTS
+                    )
+                except Exception as e:
+                    self.failed_items += len(items)
+                    logger.error(
+                        f"{self.name} flush failed, dropped: items={len(items)} err={e}"
+                    )
+                    continue
+                elapsed = time.perf_counter() - started
+                self.flushes += 1
+                self.flushed_items += len(items)
+                self.max_batch_size = max(self.max_batch_size, len(items))
+                self.batch_sizes[bisect_left(BATCH_SIZE_BUCKETS, len(items))] += 1
+                self.flush_seconds_total += elapsed
+                self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_items": self.flushed_items,
+            "failed_items": self.failed_items,
+            "avg_batch_size": self.flushed_items / self.flushes if self.flushes else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "batch_sizes": {
+                f"le_{bound}": count
+                for bound, count in zip((*BATCH_SIZE_BUCKETS, "inf"), self.batch_sizes)
+            },
+            "avg_flush_ms": self.flush_seconds_total / self.flushes * 1000 if self.flushes else 0.0,
+            "max_flush_ms": self.flush_seconds_max * 1000,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if len(self._pending) < self.max_batch:
+                # Give the batch time to fill unless it's already full
+                try:
+                    await asyncio.wait_for(self._wait_full(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    async def _wait_full(self) -> None:
+        while len(self._pending) < self.max_batch:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+
+async def _flush_profiles(profiles: list[dict]) -> None:
+    async with async_session() as session:
+        await update_user_profiles(session, profiles)
+
+
+# Coalesces profile refreshes (username, name, language) of active users
+profile_writer = WriteBehindBatcher(
+    "profiles",
+    _flush_profiles,
+    max_batch=settings.WRITE_BATCH_SIZE,
+    max_delay=settings.WRITE_BATCH_INTERVAL_MS / 1000,
+    max_pending=settings.WRITE_BATCH_MAX_PENDING,
+)
+
+
+async def _flush_downloads(events: list[tuple[str, object]]) -> None:
+    rows = {"record": [], "release": [], "video": []}
+    for kind, row in events:
+        rows[kind].append(row)
+    async with async_session() as session:
+        await finish_downloads(
+            session,
+            records=rows["record"],
+            released_ids=rows["release"],
+            videos=rows["video"],
+        )
+
+
+# Download bookkeeping off the request path: premium download records,
+# released reservations and new file_ids, as (kind, row) events
+download_writer = WriteBehindBatcher(
+    "downloads",
+    _flush_downloads,
+    max_batch=settings.WRITE_BATCH_SIZE,
+    max_delay=settings.WRITE_BATCH_INTERVAL_MS / 1000,
+    max_pending=settings.WRITE_BATCH_MAX_PENDING,
+)
@@ -0,0 +1,156 @@
+import logging
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from src.downloader import FileTooLargeError
+from src.metrics import CONCURRENCY_CHANGES
+from src.scheduler import PriorityScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def is_throttled(error: BaseException) -> bool:
+    """Whether a download failed because upstream rate-limited it."""
+    message = str(error)
+    return "HTTP Error 429" in message or "Too Many Requests" in message
+
+
+class AdaptiveConcurrency:
+    """AIMD control of the download slot limit, run by PTB's JobQueue.
+
+    Downloads report their duration and outcome through ``track``. Each
+    ``adjust`` looks at the window since the previous one and multiplies
+    the limit by ``decrease_factor`` if more than ``max_throttle_rate`` of
+    the downloads got a 429, more than ``max_error_rate`` failed, the
+    median took longer than ``target_latency`` seconds, or ``disk_path``
+    has less than ``min_free_bytes`` free. Otherwise, if downloads were
+    waiting for a slot, it adds one. Rates and latency need ``min_samples``
+    downloads in the window; the limit stays within ``min_limit`` and
+    ``max_limit``.
+    """
+
+    def __init__(
+        self,
+        scheduler: PriorityScheduler,
+        min_limit: int,
+        max_limit: int,
+        target_latency: float,
+        max_error_rate: float,
+        max_throttle_rate: float,
+        min_free_bytes: int,
+        disk_path: str = tempfile.gettempdir(),
+        decrease_factor: float = 0.5,
+        min_samples: int = 5,
+    ):
+        self.scheduler = scheduler
+        # Keep the tiers' reserved slots plus one shared slot, below which
+        # the scheduler has to cap the reservations
+        self.min_limit = max(1, min_limit, sum(scheduler.reserved.values()) + 1)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.max_throttle_rate = max_throttle_rate
+        self.min_free_bytes = min_free_bytes
+        self.disk_path = disk_path
+        self.decrease_factor = decrease_factor
+        self.min_samples = min_samples
+        self._durations: list[float] = []
+        self._errors = 0
+        self._throttled = 0
+        self._saturated = False
+        self.last_window: dict | None = None
+        scheduler.set_limit(min(max(scheduler.limit, self.min_limit), self.max_limit))
+
+    @contextmanager
+    def track(self):
+        """Record the duration and outcome of the download in the block."""
+        self._note_saturation()
+        started = time.perf_counter()
+        try:
+            yield
+        except FileTooLargeError:
+            # The download itself went fine
+            self._durations.append(time.perf_counter() - started)
+            raise
+        except Exception as e:
+            if is_throttled(e):
+                self._throttled += 1
+            else:
+                self._errors += 1
+            raise
+        else:
+            self._durations.append(time.perf_counter() - started)
+
+    def adjust(self) -> int:
+        """Close the current window and resize the limit; returns it."""
+        self._note_saturation()
+        window = self._close_window()
+        old = self.scheduler.limit
+        reason = self._congestion(window)
+        if reason is not None:
+            new = max(self.min_limit, int(old * self.decrease_factor))
+        elif window["saturated"]:
+            new, reason = min(self.max_limit, old + 1), "saturated"
+        else:
+            new = old
+        if new != old:
+            self.scheduler.set_limit(new)
+            direction = "up" if new > old else "down"
+            CONCURRENCY_CHANGES.labels(direction, reason).inc()
+            logger.info(f"Download concurrency {old} -> {new} ({reason}): {window}")
+        return new
+
+    async def run_job(self, context) -> None:
+        """JobQueue callback."""
+        try:
+            self.adjust()
+        except Exception as e:
+            logger.error(f"Adaptive concurrency adjustment failed: {e}")
+
+    def _note_saturation(self) -> None:
+        # Only grow a limit that is actually holding downloads back
+        if any(tier["queued"] for tier in self.scheduler.stats().values()):
+            self._saturated = True
+
+    def _close_window(self) -> dict:
+        done = len(self._durations) + self._errors + self._throttled
+        window = {
+            "downloads": done,
+            "error_rate": round(self._errors / done, 3) if done else 0.0,
+            "throttle_rate": round(self._throttled / done, 3) if done else 0.0,
+            "median_s": round(statistics.median(self._durations), 3) if self._durations else None,
+            "free_mb": self._free_bytes() // (1024 * 1024) if self.min_free_bytes else None,
+            "saturated": self._saturated,
+        }
+        self._durations = []
+        self._errors = self._throttled = 0
+        self._saturated = False
+        self.last_window = window
+        return window
+
+    def _congestion(self, window: dict) -> str | None:
+        """Why the limit should shrink, or None."""
+        free_mb = window["free_mb"]
+        if free_mb is not None and free_mb < self.min_free_bytes / (1024 * 1024):
+            return "disk"
+        if window["downloads"] < self.min_samples:
+            return None
+        if window["throttle_rate"] > self.max_throttle_rate:
+            return "throttled"
+        if window["error_rate"] > self.max_error_rate:
+            return "errors"
+        median = window["median_s"]
+        if median is not None and median > self.target_latency:
+            return "latency"
+        return None
+
+    def _free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(self.disk_path).free
+        except OSError as e:
+            logger.warning(f"Free disk space of {self.disk_path} unavailable: {e}")
+            # Unknown counts as enough, so a bad path can't pin the limit down
+            return self.min_free_bytes
@@ -5,6 +5,20 @@ class Settings(BaseSettings):
     TOKEN: str = "DUMMY_TOKEN"
     DATABASE_URL: str = "sqlite+aiosqlite:///data/bot.db"
 
+    # Webhook mode (long polling is used when WEBHOOK_URL is empty)
+    WEBHOOK_URL: str = ""
+    WEBHOOK_LISTEN: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8443
+    WEBHOOK_PATH: str = "telegram"
+    WEBHOOK_SECRET_TOKEN: str = ""
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+
+    # Update ingestion: queue bound and handlers run at once (0 = PTB default)
+    UPDATE_QUEUE_SIZE: int = 0
+    CONCURRENT_UPDATES: int = 0
+    # Worker processes updates are sharded across by user id (0 = single process)
+    SHARD_WORKERS: int = 0
+
     # Tier limits
     FREE_DAILY_LIMIT: int = 3
     PREMIUM_PRICE_STARS: int = 250
@@ -12,6 +26,81 @@ class Settings(BaseSettings):
 
     # Concurrency limits
     MAX_CONCURRENT_DOWNLOADS: int = 5
+    # Download slots only premium / only free users can take
+    PREMIUM_RESERVED_DOWNLOADS: int = 1
+    FREE_RESERVED_DOWNLOADS: int = 1
+    # A waiting free request gains one premium's worth of priority per period
+    # (0 = no aging, premium always first)
+    PRIORITY_AGING_SECONDS: float = 30.0
+    # Adaptive download concurrency (AIMD), starting at MAX_CONCURRENT_DOWNLOADS:
+    # every interval the limit is halved on 429s, failures, slow downloads or
+    # low free disk, and grows by one while downloads wait for a slot
+    ADAPTIVE_CONCURRENCY: bool = False
+    ADAPTIVE_MIN_DOWNLOADS: int = 3
+    ADAPTIVE_MAX_DOWNLOADS: int = 20
+    ADAPTIVE_INTERVAL_SECONDS: float = 30.0
+    ADAPTIVE_TARGET_LATENCY_SECONDS: float = 60.0
+    ADAPTIVE_MAX_ERROR_RATE: float = 0.2
+    ADAPTIVE_MAX_THROTTLE_RATE: float = 0.05
+    ADAPTIVE_MIN_FREE_DISK_MB: int = 1024
+
+    # Pick the best rendition estimated to fit this many bytes
+    DOWNLOAD_SIZE_BUDGET: int = 45 * 1024 * 1024
+
+    # Durable job queue: jobs run at once, claim batch size, lease and retries.
+    # Every running job writes, and SQLite has a single writer
+    JOB_WORKER_CONCURRENCY: int = 8
+    JOB_CLAIM_BATCH: int = 10
+    JOB_LEASE_SECONDS: int = 300
+    JOB_POLL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 3
+
+    # Download engine: "process" (dedicated pool) or "thread" (asyncio default)
+    DOWNLOAD_EXECUTOR: str = "process"
+    # 0 = MAX_CONCURRENT_DOWNLOADS (ADAPTIVE_MAX_DOWNLOADS when adaptive)
+    DOWNLOAD_WORKERS: int = 0
+    DOWNLOAD_WORKER_MAX_JOBS: int = 50  # recycle a worker after N jobs
+
+    # Write-behind batching of non-critical writes: flush interval, batch
+    # size, and buffered items before submitters have to wait for a flush
+    WRITE_BATCH_INTERVAL_MS: int = 1000
+    WRITE_BATCH_SIZE: int = 500
+    WRITE_BATCH_MAX_PENDING: int = 10_000
+
+    # SQLite pragmas applied to every pooled connection. In WAL mode NORMAL
+    # can lose the last commits on power loss (not on a crash); FULL can't
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_MB: int = 0  # 0 = SQLite's default (~2MB)
+    SQLITE_MMAP_SIZE_MB: int = 256
+    SQLITE_TEMP_STORE: str = "DEFAULT"
+
+    # Connection pools: read/write, and read-only for /status-type reads
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_READ_POOL_SIZE: int = 5
+
+    # Maintenance job: rolls downloads up into daily_download_stats, deletes
+    # raw rows past the retention window (0 keeps them) and vacuums
+    DOWNLOAD_RETENTION_DAYS: int = 90
+    JOB_RETENTION_DAYS: int = 7
+    MAINTENANCE_INTERVAL_SECONDS: int = 3600
+    MAINTENANCE_BATCH_SIZE: int = 1000  # rows per delete transaction
+    MAINTENANCE_VACUUM_PAGES: int = 10_000  # free pages returned per run
+
+    # Prometheus metrics at http://METRICS_LISTEN:METRICS_PORT/metrics (0 = off);
+    # shard worker i listens on METRICS_PORT + i
+    METRICS_LISTEN: str = "127.0.0.1"
+    METRICS_PORT: int = 0
+
+    # In-process cache of user id and premium status (0 disables it)
+    USER_CACHE_SIZE: int = 10_000
+    USER_CACHE_TTL_SECONDS: float = 300.0
+
+    # On-disk video cache (0 bytes disables it)
+    VIDEO_CACHE_DIR: str = "data/cache"
+    VIDEO_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    VIDEO_CACHE_TTL_SECONDS: int = 24 * 60 * 60
 
     class Config:
         env_file = ".env"
@@ -1,18 +1,175 @@
+import asyncio
+import itertools
 import logging
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from pathlib import Path
+from typing import NamedTuple
 
-from sqlalchemy import func, select, text
+from sqlalchemy import (
+    DateTime,
+    bindparam,
+    case,
+    delete,
+    distinct,
+    event,
+    func,
+    insert,
+    literal,
+    literal_column,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from src.config import settings
-from src.models import Base, Download, Subscription, User
+from src.models import (
+    DAILY_USAGE_TRIGGERS,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    Base,
+    CachedVideo,
+    DailyDownloadStats,
+    DailyUsage,
+    Download,
+    Job,
+    Subscription,
+    User,
+)
 
 logger = logging.getLogger(__name__)
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
+def _add_column(table: str, column: str, ddl: str):
+    """Migration step adding a column unless create_all() already did."""
+
+    def add(conn) -> None:
+        columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+    return add
+
+
+# Schema changes create_all() can't apply to an existing database (it
+# skips tables that already exist, indexes included). Entry N upgrades a
+# database from PRAGMA user_version N to N + 1. Statements (SQL, or
+# callables taking the connection) must be idempotent, as fresh databases
+# already have the current schema.
+_MIGRATIONS: list[list] = [
+    # 1: index-friendly quota and subscription lookups
+    [
+        "CREATE INDEX IF NOT EXISTS ix_downloads_user_created "
+        "ON downloads (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_user_expires "
+        "ON subscriptions (user_id, expires_at)",
+    ],
+    # 2: daily_usage counters, backfilled from the download history
+    [
+        "INSERT OR IGNORE INTO daily_usage (user_id, day, count) "
+        "SELECT user_id, date(created_at), count(*) FROM downloads "
+        "GROUP BY user_id, date(created_at)",
+    ],
+    # 3: daily_usage maintained by triggers on downloads
+    list(DAILY_USAGE_TRIGGERS),
+    # 4: retention deletes the oldest downloads first
+    [
+        "CREATE INDEX IF NOT EXISTS ix_downloads_created ON downloads (created_at)",
+    ],
+    # 5: users.premium_until, backfilled from the latest subscription
+    [
+        _add_column("users", "premium_until", "DATETIME"),
+        "UPDATE users SET premium_until = (SELECT max(expires_at) FROM subscriptions "
+        "WHERE subscriptions.user_id = users.id) WHERE premium_until IS NULL",
+    ],
+]
+
+
+
+def sqlite_pragmas() -> dict[str, object]:
+    """The per-connection pragma profile configured in settings."""
+    pragmas = {
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024,
+        "temp_store": settings.SQLITE_TEMP_STORE,
+    }
+    if settings.SQLITE_CACHE_SIZE_MB:
+        # Negative cache_size is in KiB rather than pages
+        pragmas["cache_size"] = -settings.SQLITE_CACHE_SIZE_MB * 1024
+    return pragmas
+
+
+def apply_pragmas(engine, pragmas: dict[str, object], query_only: bool = False) -> None:
+    """Run ``PRAGMA name=value`` on every connection ``engine`` opens.
+
+    Most pragmas are per connection, so setting them once (as
+    ``journal_mode`` is in ``init_db``) would only tune one pooled
+    connection. ``query_only`` makes the connections refuse writes.
+    """
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas.items()]
+    if query_only:
+        statements.append("PRAGMA query_only=1")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+
+def build_engine(pool_size: int, max_overflow: int, query_only: bool = False):
+    """Async engine for DATABASE_URL with the configured pragma profile."""
+    options = {}
+    if ":memory:" not in settings.DATABASE_URL:
+        options = {"pool_size": pool_size, "max_overflow": max_overflow}
+    engine = create_async_engine(settings.DATABASE_URL, echo=False, **options)
+    apply_pragmas(engine, sqlite_pragmas(), query_only=query_only)
+    return engine
+
+
+engine = build_engine(settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
 async_session = async_sessionmaker(bind=engine, expire_on_commit=False)
 
+# Read-only pool for /status-type reads, so they never queue behind (or
+# hold) the connections the download path writes through
+read_engine = build_engine(settings.DB_READ_POOL_SIZE, 0, query_only=True)
+read_session = async_sessionmaker(bind=read_engine, expire_on_commit=False)
+
+# Backoff between attempts of a write that found the database locked
+_RETRY_DELAY = 0.05
+_RETRY_MAX_DELAY = 2.0
+
+
+async def retry_locked(work, attempts: int | None = None, until=None):
+    """Await ``work()`` again, with exponential backoff, while it raises
+    OperationalError (SQLite's "database is locked" once the busy timeout
+    runs out).
+
+    ``work`` opens its own session, so every attempt starts a fresh
+    transaction. Gives up, re-raising, after ``attempts`` tries or once
+    the event loop clock would pass ``until()``; with neither it retries
+    until the write goes through.
+    """
+    loop = asyncio.get_running_loop()
+    delay = _RETRY_DELAY
+    for attempt in itertools.count(1):
+        try:
+            return await work()
+        except OperationalError as e:
+            if attempts is not None and attempt >= attempts:
+                raise
+            if until is not None and loop.time() + delay >= until():
+                raise
+            logger.warning(f"Database busy, retrying in {delay:.2f}s: {e}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, _RETRY_MAX_DELAY)
+
 
 async def init_db():
     """Create all tables and configure SQLite pragmas."""
@@ -22,124 +179,202 @@ async def init_db():
     db_dir.mkdir(parents=True, exist_ok=True)
     
     async with engine.begin() as conn:
+        # Only takes effect on a new database (see README, Maintenance)
+        await conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
         await conn.execute(text("PRAGMA journal_mode=WAL"))
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate)
     logger.info("Database initialized")
 
 
-async def get_or_create_user(
+def migrate(conn) -> int:
+    """Apply pending ``_MIGRATIONS`` on a sync connection.
+
+    Returns the resulting schema version.
+    """
+    version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    for target, statements in enumerate(_MIGRATIONS[version:], start=version + 1):
+        for statement in statements:
+            if callable(statement):
+                statement(conn)
+            else:
+                conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(f"PRAGMA user_version = {target}")
+        logger.info(f"Migrated database schema to version {target}")
+    return max(version, len(_MIGRATIONS))
+
+
+# Profile fields refreshed from Telegram; None means "unknown, keep"
+_PROFILE_FIELDS = ("username", "full_name", "language_code")
+
+
+def _upsert_user():
+    """INSERT ... ON CONFLICT(telegram_id) DO UPDATE that only writes when
+    a known profile field differs from the stored one."""
+    stmt = sqlite_insert(User)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            field: func.coalesce(excluded[field], getattr(User, field))
+            for field in _PROFILE_FIELDS
+        },
+        where=or_(
+            *(
+                excluded[field].is_not(None)
+                & excluded[field].is_distinct_from(getattr(User, field))
+                for field in _PROFILE_FIELDS
+            )
+        ),
+    )
+
+
+async def _upsert_user_row(
     session: AsyncSession,
     telegram_id: int,
-    username: str | None = None,
-    full_name: str | None = None,
-    is_bot: bool = False,
-    language_code: str | None = None,
+    username: str | None,
+    full_name: str | None,
+    is_bot: bool,
+    language_code: str | None,
 ) -> User:
-    """Get an existing user or create a new one."""
-    stmt = select(User).where(User.telegram_id == telegram_id)
-    result = await session.execute(stmt)
-    user = result.scalar_one_or_none()
-
-    if user is None:
-        user = User(
+    stmt = (
+        _upsert_user()
+        .values(
             telegram_id=telegram_id,
             username=username,
             full_name=full_name,
             is_bot=is_bot,
             language_code=language_code,
+            created_at=datetime.now(),
         )
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
-        logger.info(f"Created new user: {user}")
-    else:
-        user.username = username
-        user.full_name = full_name
-        user.language_code = language_code
-        await session.commit()
+        .returning(User)
+    )
+    options = {"populate_existing": True}
+    user = (await session.scalars(stmt, execution_options=options)).one_or_none()
+    if user is None:
+        # Known user with an unchanged profile: nothing was written
+        stmt = select(User).where(User.telegram_id == telegram_id)
+        user = (await session.scalars(stmt, execution_options=options)).one()
+    return user
 
+
+async def get_or_create_user(
+    session: AsyncSession,
+    telegram_id: int,
+    username: str | None = None,
+    full_name: str | None = None,
+    is_bot: bool = False,
+    language_code: str | None = None,
+) -> User:
+    """Get an existing user or create a new one.
+
+    Profile fields passed as None keep their stored value, and an existing
+    row is only written when a field actually changed.
+    """
+    user = await _upsert_user_row(
+        session, telegram_id, username, full_name, is_bot, language_code
+    )
+    await session.commit()
     return user
 
 
+async def update_user_profiles(session: AsyncSession, profiles: list[dict]) -> None:
+    """Upsert many ``{"telegram_id", "username", "full_name",
+    "language_code"}`` profiles in one transaction (write-behind flush)."""
+    if not profiles:
+        return
+    await session.execute(
+        _upsert_user().values(
+            telegram_id=bindparam("telegram_id"),
+            username=bindparam("username"),
+            full_name=bindparam("full_name"),
+            language_code=bindparam("language_code"),
+            is_bot=False,
+            created_at=datetime.now(),
+        ),
+        profiles,
+    )
+    await session.commit()
+
+
 async def count_downloads_today(session: AsyncSession, user_id: int) -> int:
     """Count how many downloads a user has made today."""
-    today = date.today()
-    stmt = select(func.count(Download.id)).where(
-        Download.user_id == user_id,
-        func.date(Download.created_at) == today,
+    stmt = select(DailyUsage.count).where(
+        DailyUsage.user_id == user_id, DailyUsage.day == date.today()
     )
     result = await session.execute(stmt)
     return result.scalar() or 0
 
 
+def _reserve_stmt(user_id: int, tweet_url: str, daily_limit: int, now: datetime):
+    """INSERT ... SELECT ... WHERE count < limit RETURNING id."""
+    used = (
+        select(DailyUsage.count)
+        .where(DailyUsage.user_id == user_id, DailyUsage.day == now.date())
+        .scalar_subquery()
+    )
+    return (
+        insert(Download)
+        .from_select(
+            ["user_id", "tweet_url", "created_at"],
+            select(literal(user_id), literal(tweet_url), literal(now, DateTime)).where(
+                func.coalesce(used, 0) < daily_limit
+            ),
+        )
+        .returning(Download.id)
+    )
+
+
 async def reserve_download(
     session: AsyncSession, user_id: int, tweet_url: str, daily_limit: int
 ) -> Download | None:
     """Atomically check the daily limit and record a download.
 
     Returns the Download record if the user is within limits, or None
-    if the daily limit has been reached.  This prevents race conditions
-    where concurrent requests all pass the limit check.
+    if the daily limit has been reached.  The limit check and the insert
+    are one ``INSERT ... SELECT ... WHERE count < limit RETURNING``
+    statement (the daily_usage trigger counts it in the same statement),
+    and SQLite runs it under the database write lock, so concurrent
+    requests, even from other processes, can't exceed the limit.
     """
-    today = date.today()
-    stmt = select(func.count(Download.id)).where(
-        Download.user_id == user_id,
-        func.date(Download.created_at) == today,
-    )
-    result = await session.execute(stmt)
-    count = result.scalar() or 0
-
-    if count >= daily_limit:
-        return None
-
-    download = Download(user_id=user_id, tweet_url=tweet_url)
-    session.add(download)
+    now = datetime.now()
+    result = await session.execute(_reserve_stmt(user_id, tweet_url, daily_limit, now))
+    download_id = result.scalar_one_or_none()
     await session.commit()
-    await session.refresh(download)
-    return download
+    if download_id is None:
+        return None
+    return Download(id=download_id, user_id=user_id, tweet_url=tweet_url, created_at=now)
 
 
 async def delete_download(session: AsyncSession, download_id: int) -> None:
     """Delete a download record (used when download fails after reservation)."""
-    stmt = select(Download).where(Download.id == download_id)
-    result = await session.execute(stmt)
-    download = result.scalar_one_or_none()
-    if download:
-        await session.delete(download)
-        await session.commit()
+    await session.execute(delete(Download).where(Download.id == download_id))
+    await session.commit()
 
 
 async def has_active_subscription(session: AsyncSession, user_id: int) -> bool:
     """Check if a user has an active (non-expired) subscription."""
-    now = datetime.now()
-    stmt = (
-        select(Subscription)
-        .where(
-            Subscription.user_id == user_id,
-            Subscription.expires_at > now,
-        )
-        .limit(1)
-    )
-    result = await session.execute(stmt)
-    return result.scalar_one_or_none() is not None
+    return await get_premium_until(session, user_id) is not None
 
 
-async def get_active_subscription(
-    session: AsyncSession, user_id: int
-) -> Subscription | None:
-    """Get the active subscription for a user, if any."""
-    now = datetime.now()
-    stmt = (
-        select(Subscription)
-        .where(
-            Subscription.user_id == user_id,
-            Subscription.expires_at > now,
-        )
-        .order_by(Subscription.expires_at.desc())
-        .limit(1)
-    )
-    result = await session.execute(stmt)
-    return result.scalar_one_or_none()
+async def get_user_id(session: AsyncSession, telegram_id: int) -> int | None:
+    """Internal id of a registered Telegram user (read-only)."""
+    stmt = select(User.id).where(User.telegram_id == telegram_id)
+    return (await session.execute(stmt)).scalar()
+
+
+async def get_premium_until(session: AsyncSession, user_id: int) -> datetime | None:
+    """End of the user's active premium plan, or None."""
+    stmt = select(User.premium_until).where(User.id == user_id)
+    premium_until = (await session.execute(stmt)).scalar()
+    if premium_until is None or premium_until <= datetime.now():
+        return None
+    return premium_until
+
+
+# Compare-and-set rounds before create_subscription gives up on a plan
+# that other payments keep extending
+_PLAN_UPDATE_ATTEMPTS = 10
 
 
 async def create_subscription(
@@ -149,12 +384,40 @@ async def create_subscription(
     telegram_charge_id: str,
     duration_days: int = 30,
 ) -> Subscription:
-    """Create a new subscription for a user."""
+    """Create a new subscription for a user and extend their plan.
+
+    A renewal before expiry starts when the current plan ends, so the
+    days already paid for are kept.
+    """
     now = datetime.now()
+    for _ in range(_PLAN_UPDATE_ATTEMPTS):
+        row = (
+            await session.execute(select(User.premium_until).where(User.id == user_id))
+        ).one_or_none()
+        if row is None:
+            raise ValueError(f"Cannot create a subscription for unknown user {user_id}")
+        current = row[0]
+        starts_at = max(now, current) if current is not None else now
+        expires_at = starts_at + timedelta(days=duration_days)
+        # Compare-and-set, so concurrent payments both extend the plan
+        result = await session.execute(
+            update(User)
+            .where(User.id == user_id, User.premium_until.is_not_distinct_from(current))
+            .values(premium_until=expires_at)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            break
+        await session.rollback()
+    else:
+        raise RuntimeError(
+            f"Plan of user {user_id} kept changing; gave up after "
+            f"{_PLAN_UPDATE_ATTEMPTS} attempts"
+        )
     subscription = Subscription(
         user_id=user_id,
-        starts_at=now,
-        expires_at=now + timedelta(days=duration_days),
+        starts_at=starts_at,
+        expires_at=expires_at,
         stars_paid=stars_paid,
         telegram_charge_id=telegram_charge_id,
     )
@@ -169,8 +432,389 @@ async def record_download(
     session: AsyncSession, user_id: int, tweet_url: str
 ) -> Download:
     """Record a video download (for premium users who skip reservation)."""
-    download = Download(user_id=user_id, tweet_url=tweet_url)
+    download = Download(user_id=user_id, tweet_url=tweet_url, created_at=datetime.now())
     session.add(download)
     await session.commit()
     await session.refresh(download)
     return download
+
+
+async def get_cached_video(session: AsyncSession, tweet_id: str) -> CachedVideo | None:
+    """Get the Telegram file_id cached for a tweet, if any."""
+    stmt = select(CachedVideo).where(CachedVideo.tweet_id == tweet_id)
+    result = await session.execute(stmt)
+    return result.scalar_one_or_none()
+
+
+def _upsert_cached_video():
+    """INSERT ... ON CONFLICT(tweet_id) DO UPDATE, for one row or many."""
+    stmt = sqlite_insert(CachedVideo)
+    return stmt.on_conflict_do_update(
+        index_elements=[CachedVideo.tweet_id],
+        set_={
+            name: stmt.excluded[name]
+            for name in ("file_id", "file_unique_id", "file_size")
+        },
+    )
+
+
+async def save_cached_video(
+    session: AsyncSession,
+    tweet_id: str,
+    file_id: str,
+    file_unique_id: str | None = None,
+    file_size: int | None = None,
+) -> CachedVideo:
+    """Store (or replace) the Telegram file_id of an uploaded tweet video."""
+    stmt = (
+        _upsert_cached_video()
+        .values(
+            tweet_id=tweet_id,
+            file_id=file_id,
+            file_unique_id=file_unique_id,
+            file_size=file_size,
+        )
+        .returning(CachedVideo)
+    )
+    result = await session.scalars(stmt, execution_options={"populate_existing": True})
+    cached = result.one()
+    await session.commit()
+    return cached
+
+
+async def invalidate_cached_video(
+    session: AsyncSession, tweet_id: str, file_id: str | None = None
+) -> None:
+    """Drop a cached file_id (used when Telegram rejects it as stale).
+
+    If ``file_id`` is given, only that exact entry is removed so a fresh
+    id stored concurrently by another upload is kept.
+    """
+    stmt = delete(CachedVideo).where(CachedVideo.tweet_id == tweet_id)
+    if file_id is not None:
+        stmt = stmt.where(CachedVideo.file_id == file_id)
+    await session.execute(stmt)
+    await session.commit()
+
+
+async def enqueue_job(
+    session: AsyncSession,
+    telegram_user_id: int,
+    chat_id: int,
+    tweet_url: str,
+    tweet_id: str,
+    payload: str,
+) -> Job | None:
+    """Queue a download job.
+
+    Returns None if the user already has a queued or running job (enforced
+    by a partial unique index, so it also holds across processes).
+    """
+    job = Job(
+        telegram_user_id=telegram_user_id,
+        chat_id=chat_id,
+        tweet_url=tweet_url,
+        tweet_id=tweet_id,
+        payload=payload,
+    )
+    session.add(job)
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        return None
+    return job
+
+
+async def claim_jobs(
+    session: AsyncSession, limit: int, lease_seconds: int
+) -> list[Job]:
+    """Atomically lease up to ``limit`` queued jobs, oldest first."""
+    now = datetime.now()
+    queued_ids = (
+        select(Job.id).where(Job.state == JOB_QUEUED).order_by(Job.id).limit(limit)
+    )
+    stmt = (
+        update(Job)
+        .where(Job.id.in_(queued_ids), Job.state == JOB_QUEUED)
+        .values(
+            state=JOB_RUNNING,
+            attempts=Job.attempts + 1,
+            lease_until=now + timedelta(seconds=lease_seconds),
+            updated_at=now,
+        )
+        .returning(Job)
+    )
+    result = await session.scalars(
+        stmt,
+        execution_options={"synchronize_session": False, "populate_existing": True},
+    )
+    jobs = sorted(result.all(), key=lambda job: job.id)
+    await session.commit()
+    return jobs
+
+
+async def renew_job_lease(
+    session: AsyncSession, job_id: int, lease_seconds: int
+) -> None:
+    """Extend the lease of a running job (worker heartbeat)."""
+    now = datetime.now()
+    stmt = (
+        update(Job)
+        .where(Job.id == job_id, Job.state == JOB_RUNNING)
+        .values(lease_until=now + timedelta(seconds=lease_seconds), updated_at=now)
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+
+async def finish_job(
+    session: AsyncSession, job_id: int, error: str | None = None
+) -> None:
+    """Mark a job as done, or failed if an error is given."""
+    stmt = (
+        update(Job)
+        .where(Job.id == job_id)
+        .values(
+            state=JOB_FAILED if error else JOB_DONE,
+            error=error,
+            lease_until=None,
+            updated_at=datetime.now(),
+        )
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+
+async def requeue_jobs(
+    session: AsyncSession,
+    job_ids: list[int] | None = None,
+    max_attempts: int = 3,
+) -> int:
+    """Put running jobs back in the queue and release their reservations.
+
+    With ``job_ids`` None, jobs whose lease expired are recovered (crash
+    recovery) and those out of attempts are marked failed. Otherwise the
+    given jobs are re-queued as-is (graceful shutdown).
+    """
+    now = datetime.now()
+    if job_ids is None:
+        condition = (Job.state == JOB_RUNNING) & (Job.lease_until < now)
+        new_state = case((Job.attempts >= max_attempts, JOB_FAILED), else_=JOB_QUEUED)
+    else:
+        condition = (Job.state == JOB_RUNNING) & Job.id.in_(job_ids)
+        new_state = JOB_QUEUED
+
+    # Same transaction: the delete takes the write lock before the update
+    orphaned = select(Job.download_id).where(condition, Job.download_id.is_not(None))
+    await session.execute(delete(Download).where(Download.id.in_(orphaned)))
+    result = await session.execute(
+        update(Job)
+        .where(condition)
+        .values(state=new_state, lease_until=None, download_id=None, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount
+
+
+# Request-scoped units of work for the download pipeline: each is one
+# transaction with one commit, instead of a session per step
+
+
+class DownloadStart(NamedTuple):
+    # Reservation made for a free user (None for premium users)
+    download_id: int | None
+    limit_reached: bool
+    # Telegram file_id already uploaded for this tweet, if any
+    cached: CachedVideo | None
+    # Set when the caller thought the user was free but their row says
+    # premium (a stale cached plan): the caller's cache needs refreshing
+    premium_until: datetime | None = None
+
+
+async def load_user(
+    session: AsyncSession,
+    telegram_id: int,
+    username: str | None = None,
+    full_name: str | None = None,
+    language_code: str | None = None,
+) -> tuple[int, datetime | None]:
+    """Get or register a user and the end of their premium plan (which
+    may be past).
+
+    One query for known users, whose profile is left alone (the download
+    path refreshes it write-behind). Does not commit; the caller commits a
+    registration before caching the returned id.
+    """
+    stmt = select(User.id, User.premium_until).where(User.telegram_id == telegram_id)
+    row = (await session.execute(stmt)).one_or_none()
+    if row is not None:
+        return row[0], row[1]
+    user = await _upsert_user_row(
+        session, telegram_id, username, full_name, False, language_code
+    )
+    return user.id, None
+
+
+async def start_download(
+    session: AsyncSession,
+    user_id: int,
+    is_premium: bool,
+    tweet_url: str,
+    tweet_id: str,
+    daily_limit: int,
+    job_id: int | None = None,
+) -> DownloadStart:
+    """Reserve a free user's quota, link it to the job and look up the
+    cached file_id, committing everything (and pending work such as
+    ``load_user``) once.
+
+    ``is_premium`` usually comes from a per-process cache, which can miss a
+    payment handled by another process, so the limit is only enforced
+    after the user's row confirms they are not premium.
+    """
+    download_id = None
+    premium_until = None
+    if not is_premium:
+        stmt = _reserve_stmt(user_id, tweet_url, daily_limit, datetime.now())
+        download_id = (await session.execute(stmt)).scalar_one_or_none()
+        if download_id is None:
+            premium_until = await get_premium_until(session, user_id)
+            if premium_until is None:
+                await session.commit()
+                return DownloadStart(None, True, None)
+        # Let crash recovery release this reservation if the job dies
+        elif job_id is not None:
+            await session.execute(
+                update(Job).where(Job.id == job_id).values(download_id=download_id)
+            )
+    cached = await get_cached_video(session, tweet_id)
+    await session.commit()
+    return DownloadStart(download_id, False, cached, premium_until)
+
+
+async def finish_downloads(
+    session: AsyncSession,
+    records: list[dict] = (),
+    released_ids: list[int] = (),
+    videos: list[dict] = (),
+) -> None:
+    """Apply the bookkeeping of many downloads in one transaction.
+
+    ``records`` are Download rows to insert (with their ``created_at``, so
+    the daily_usage trigger counts the right day), ``released_ids`` are
+    reservations to delete and ``videos`` are file_ids to upsert. Each
+    kind is a single executemany.
+    """
+    if not (records or released_ids or videos):
+        return
+    if released_ids:
+        await session.execute(delete(Download).where(Download.id.in_(released_ids)))
+    if records:
+        await session.execute(insert(Download), records)
+    if videos:
+        await session.execute(_upsert_cached_video(), videos)
+    await session.commit()
+
+
+# Retention and rollups, run by the maintenance job (src/maintenance.py).
+# Deletes go in small batches, each its own short transaction, so the
+# download path's writers only ever wait for one batch.
+
+
+async def rollup_download_stats(session: AsyncSession, before: date) -> int:
+    """Add the downloads of every day before ``before`` that isn't in
+    daily_download_stats yet. Returns the number of days added."""
+    last = (await session.execute(select(func.max(DailyDownloadStats.day)))).scalar()
+    day = func.date(Download.created_at)
+    days = select(day, func.count(), func.count(distinct(Download.user_id))).where(
+        Download.created_at < datetime.combine(before, time())
+    )
+    if last is not None:
+        # Only the days after the last rollup, not the whole retention window
+        after = datetime.combine(last + timedelta(days=1), time())
+        days = days.where(Download.created_at >= after)
+    # Aggregate in a read, not an INSERT ... SELECT: that would hold the
+    # write lock for the whole scan
+    rows = [
+        {"day": date.fromisoformat(row[0]), "downloads": row[1], "users": row[2]}
+        for row in (await session.execute(days.group_by(day))).all()
+    ]
+    if not rows:
+        return 0
+    stmt = sqlite_insert(DailyDownloadStats).on_conflict_do_nothing()
+    await session.execute(stmt, rows)
+    await session.commit()
+    return len(rows)
+
+
+async def prune_daily_usage(session: AsyncSession, before: date, batch_size: int) -> int:
+    """Delete up to ``batch_size`` quota counters of days before ``before``.
+
+    Run before deleting those days' downloads, so the release trigger has
+    no counter left to decrement. Returns the number deleted.
+    """
+    rowid = literal_column("rowid")
+    oldest = select(rowid).select_from(DailyUsage).where(DailyUsage.day < before).limit(batch_size)
+    result = await session.execute(delete(DailyUsage).where(rowid.in_(oldest)))
+    await session.commit()
+    return result.rowcount
+
+
+async def delete_old_downloads(session: AsyncSession, before: date, batch_size: int) -> int:
+    """Delete up to ``batch_size`` downloads from days before ``before``.
+
+    Returns the number deleted; fewer than ``batch_size`` means done.
+    """
+    oldest = (
+        select(Download.id)
+        .where(Download.created_at < datetime.combine(before, time()))
+        .limit(batch_size)
+    )
+    result = await session.execute(delete(Download).where(Download.id.in_(oldest)))
+    await session.commit()
+    return result.rowcount
+
+
+async def delete_old_jobs(session: AsyncSession, before: datetime, batch_size: int) -> int:
+    """Delete up to ``batch_size`` done or failed jobs last updated before
+    ``before``. Returns the number deleted."""
+    oldest = (
+        select(Job.id)
+        .where(Job.state.in_((JOB_DONE, JOB_FAILED)), Job.updated_at < before)
+        .limit(batch_size)
+    )
+    result = await session.execute(delete(Job).where(Job.id.in_(oldest)))
+    await session.commit()
+    return result.rowcount
+
+
+async def _write_script(session: AsyncSession, statements: str) -> None:
+    """Run ``statements`` to completion in a write transaction.
+
+    The pragmas below read before they write; run on their own, the
+    upgrade to a write lock fails at once (no busy timeout) when another
+    connection committed meanwhile. ``BEGIN IMMEDIATE`` takes the lock
+    first, waiting for it like any writer. A script also steps
+    ``incremental_vacuum`` to completion, where execute() frees one page.
+    """
+    raw = await (await session.connection()).get_raw_connection()
+    await raw.driver_connection.executescript(f"BEGIN IMMEDIATE; {statements}; COMMIT;")
+
+
+async def incremental_vacuum(session: AsyncSession, pages: int) -> int:
+    """Return up to ``pages`` free pages to the filesystem.
+
+    Returns the number of pages freed; always 0 unless the database uses
+    ``auto_vacuum=INCREMENTAL``.
+    """
+    freelist = text("PRAGMA freelist_count")
+    before = (await session.execute(freelist)).scalar()
+    await _write_script(session, f"PRAGMA incremental_vacuum({int(pages)})")
+    return before - (await session.execute(freelist)).scalar()
+
+
+async def optimize(session: AsyncSession) -> None:
+    """Refresh the query planner's statistics where they are stale."""
+    await _write_script(session, "PRAGMA optimize")
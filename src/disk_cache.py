@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Published entries are "<sha1 of url>.mp4"; anything else is a temp file
+_ENTRY_PATTERN = re.compile(r"^[0-9a-f]{40}\.mp4$")
+
+# Temp files younger than this may belong to a download still in progress
+STALE_TEMP_SECONDS = 3600
+
+
+class DiskCache:
+    """Size-bounded on-disk LRU cache of downloaded videos.
+
+    The filesystem is the source of truth: an entry's mtime is its last
+    access time, so several processes can share one cache directory.
+    Downloads are written to a temp file in the same directory and
+    published with an atomic rename, so readers never see partial files.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int = 0):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> Path:
+        """Return the path a published entry for ``key`` lives at."""
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return self.directory / f"{digest}.mp4"
+
+    def get(self, key: str) -> str | None:
+        """Return the cached file for ``key`` and mark it recently used."""
+        path = self.path_for(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        if self._expired(stat.st_mtime, time.time()):
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted between stat and touch
+            self.misses += 1
+            return None
+        self.hits += 1
+        return str(path)
+
+    def temp_path(self, key: str) -> str:
+        """Return a unique temp file path to download ``key`` into."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return str(self.directory / f"{digest}.tmp-{uuid.uuid4().hex}.mp4")
+
+    def publish(self, key: str, temp_file: str) -> str:
+        """Atomically move a finished download into the cache."""
+        path = self.path_for(key)
+        os.replace(temp_file, path)
+        self.evict(keep=path)
+        return str(path)
+
+    def evict(self, keep: Path | None = None) -> None:
+        """Drop expired entries, then least recently used ones over budget."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for path, stat in self._scan():
+                if path != keep and self._expired(stat.st_mtime, now):
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                self._remove(path)
+                total -= size
+
+    def reconcile(self) -> None:
+        """Clean up after a crash: remove stale temp files and re-apply limits."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        for path in self.directory.iterdir():
+            if _ENTRY_PATTERN.match(path.name) or not path.is_file():
+                continue
+            try:
+                if now - path.stat().st_mtime > STALE_TEMP_SECONDS:
+                    path.unlink()
+                    logger.info(f"Removed stale cache temp file: {path.name}")
+            except FileNotFoundError:
+                pass
+        self.evict()
+        logger.info(f"Video cache ready: {self.directory} ({self.size_bytes()} bytes)")
+
+    def size_bytes(self) -> int:
+        """Total size of published entries."""
+        return sum(stat.st_size for _, stat in self._scan())
+
+    def _scan(self):
+        if not self.directory.exists():
+            return
+        for path in self.directory.iterdir():
+            if not _ENTRY_PATTERN.match(path.name):
+                continue
+            try:
+                yield path, path.stat()
+            except FileNotFoundError:
+                continue
+
+    def _expired(self, mtime: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - mtime > self.ttl_seconds
+
+    def _remove(self, path: Path) -> None:
+        try:
+            path.unlink()
+            self.evictions += 1
+        except FileNotFoundError:
+            pass
+
+
+video_cache = (
+    DiskCache(
+        settings.VIDEO_CACHE_DIR,
+        settings.VIDEO_CACHE_MAX_BYTES,
+        settings.VIDEO_CACHE_TTL_SECONDS,
+    )
+    if settings.VIDEO_CACHE_MAX_BYTES > 0
+    else None
+)
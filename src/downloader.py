@@ -1,9 +1,15 @@
 import logging
 import os
+import time
+from typing import NamedTuple
 
 import yt_dlp
 from yt_dlp.utils import DownloadError
 
+from src.config import settings
+from src.disk_cache import DiskCache
+from src.metrics import BYTES, CACHE_REQUESTS, ERRORS, STAGE_SECONDS
+
 logger = logging.getLogger(__name__)
 
 # Telegram bot API limit for file uploads
@@ -14,6 +20,12 @@ DEFAULT_OPTS = {
     'merge_output_format': 'mp4',
     'quiet': True,
     'no_warnings': True,
+    # 'quiet' alone still prints progress bars to the workers' stdout
+    'noprogress': True,
+    # Through the Python API yt-dlp defaults to no retries (the CLI's 10 are
+    # argparse defaults), so a connection cut mid-file failed the download
+    'retries': 3,
+    'fragment_retries': 3,
     # TODO: Workaround temporal para yt-dlp issue #15963 — Twitter GraphQL API
     # devuelve "Dependency: Unspecified". Revertir cuando yt-dlp publique fix.
     # https://github.com/yt-dlp/yt-dlp/issues/15963
@@ -32,38 +44,242 @@ class FileTooLargeError(Exception):
             f"limit of {max_size / 1024 / 1024:.0f}MB"
         )
 
+    def __reduce__(self):
+        # Keep the typed fields when raised across a process boundary
+        return (self.__class__, (self.file_size, self.max_size))
+
+
+class Rendition(NamedTuple):
+    """A format choice made by select_format."""
+
+    format_spec: str
+    height: int | None
+    size: int
+
+
+class _StageTimer:
+    """Times consecutive stages of a yt-dlp run into STAGE_SECONDS.
+
+    Used as a postprocessor hook: once yt-dlp starts post-processing
+    (merging audio and video, fixups) the running stage becomes ``merge``.
+    Moving the finished file into place does not count.
+    """
+
+    def __init__(self):
+        self.stage = None
+        self.started = 0.0
+
+    def start(self, stage: str) -> None:
+        self.stop()
+        self.stage = stage
+        self.started = time.perf_counter()
+
+    def stop(self, error: BaseException | None = None) -> None:
+        if self.stage is None:
+            return
+        STAGE_SECONDS.labels(self.stage).observe(time.perf_counter() - self.started)
+        if error is not None:
+            ERRORS.labels(self.stage, type(error).__name__).inc()
+        self.stage = None
+
+    def postprocessor_hook(self, d: dict) -> None:
+        if d.get('postprocessor') == 'MoveFiles':
+            return
+        if d.get('status') == 'started' and self.stage != 'merge':
+            self.start('merge')
+
+
+def _format_size(fmt: dict, duration: float | None) -> int | None:
+    """Estimate one format's size from filesize, filesize_approx or tbr."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size:
+        tbr = fmt.get('tbr')  # kbit/s
+        duration = fmt.get('duration') or duration
+        if not tbr or not duration:
+            return None
+        size = tbr * 1000 / 8 * duration
+    return int(size)
+
+
+def estimate_size(info: dict) -> int | None:
+    """Estimate the download size in bytes from pre-extracted video info.
+
+    Uses ``filesize``, then ``filesize_approx``, then ``tbr * duration`` of
+    each selected format. Returns None when the size cannot be estimated.
+    """
+    if info.get('entries') is not None:
+        # Multi-video tweets: the largest entry decides
+        sizes = [estimate_size(entry) for entry in info['entries'] if entry]
+        if not sizes or None in sizes:
+            return None
+        return max(sizes)
+
+    total = 0
+    for fmt in info.get('requested_formats') or [info]:
+        size = _format_size(fmt, info.get('duration'))
+        if size is None:
+            return None
+        total += size
+    return total
+
+
+def select_format(info: dict, budget: int) -> Rendition | None:
+    """Pick the highest-quality rendition whose estimated size fits ``budget``.
+
+    Formats with both video and audio are taken as-is; video-only formats
+    are paired with the best audio-only format that still fits. Quality is
+    ranked by height, then bitrate. Formats without a size estimate are
+    skipped. Returns None if nothing fits.
+    """
+    duration = info.get('duration')
+    formats = info.get('formats') or []
+    audios = [
+        (fmt, _format_size(fmt, duration))
+        for fmt in formats
+        if fmt.get('vcodec') == 'none' and fmt.get('acodec') != 'none'
+    ]
+    audios = sorted(
+        ((fmt, size) for fmt, size in audios if size is not None),
+        key=lambda item: item[0].get('abr') or item[0].get('tbr') or 0,
+        reverse=True,
+    )
+
+    best_key, best = None, None
+    for fmt in formats:
+        if fmt.get('vcodec') == 'none':
+            continue
+        size = _format_size(fmt, duration)
+        if size is None:
+            continue
+
+        spec = fmt['format_id']
+        if fmt.get('acodec') == 'none':
+            audio = next(
+                ((a, a_size) for a, a_size in audios if size + a_size <= budget),
+                None,
+            )
+            if audio is None:
+                continue
+            spec = f"{spec}+{audio[0]['format_id']}"
+            size += audio[1]
+
+        if size > budget:
+            continue
+        key = (fmt.get('height') or 0, fmt.get('tbr') or 0)
+        if best_key is None or key > best_key:
+            best_key, best = key, Rendition(spec, fmt.get('height'), size)
+    return best
+
+
+def _fit_to_budget(url: str, info: dict, budget: int) -> Rendition | None:
+    """Decide whether the default selection must be replaced.
+
+    Returns a smaller rendition to download instead, or None to keep the
+    default. Raises FileTooLargeError if nothing can fit MAX_FILE_SIZE.
+    """
+    estimated_size = estimate_size(info)
+    if estimated_size is None or estimated_size <= budget:
+        return None
+
+    rendition = select_format(info, budget)
+    if rendition is not None:
+        logger.info(
+            f"Selected rendition {rendition.format_spec} "
+            f"({rendition.height or '?'}p, ~{rendition.size / 1024 / 1024:.1f} MB) "
+            f"for {url}; default was ~{estimated_size / 1024 / 1024:.1f} MB"
+        )
+        return rendition
+
+    if estimated_size > MAX_FILE_SIZE:
+        logger.info(
+            f"Rejected before download: {url} "
+            f"(~{estimated_size / 1024 / 1024:.1f} MB)"
+        )
+        raise FileTooLargeError(estimated_size)
+    return None
 
-def download_video(url: str, output_filename: str) -> str:
+
+def download_video(
+    url: str, output_filename: str, cache: DiskCache | None = None
+) -> str:
     """Download a video from a supported URL using yt-dlp.
 
     Args:
         url: The URL of the tweet/post containing the video.
         output_filename: Path where the video file will be saved.
+        cache: Optional on-disk cache checked before calling yt-dlp. When
+            given, the video is published into the cache and the cached
+            path is returned instead of ``output_filename``.
 
     Returns:
         The path to the downloaded file.
 
     Raises:
         DownloadError: If the video cannot be downloaded.
-        FileTooLargeError: If the downloaded file exceeds MAX_FILE_SIZE.
+        FileTooLargeError: If the estimated or downloaded size exceeds
+            MAX_FILE_SIZE.
     """
+    if cache is not None:
+        cached = cache.get(url)
+        if cached is not None:
+            logger.info(f"Cache hit for {url}: {cached}")
+            CACHE_REQUESTS.labels("video", "hit").inc()
+            return cached
+        CACHE_REQUESTS.labels("video", "miss").inc()
+        output_filename = cache.temp_path(url)
+
+    timer = _StageTimer()
     opts = {
         **DEFAULT_OPTS,
         'outtmpl': output_filename,
+        'postprocessor_hooks': [timer.postprocessor_hook],
     }
 
-    with yt_dlp.YoutubeDL(opts) as ydl:
-        logger.info(f"Downloading video from: {url}")
-        ydl.download([url])
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            # Phase 1: extract metadata only; pick a rendition that fits the
+            # size budget or reject the video before spending any bandwidth
+            timer.start('extract')
+            info = ydl.extract_info(url, download=False)
+            rendition = _fit_to_budget(url, info, settings.DOWNLOAD_SIZE_BUDGET)
+
+            # Phase 2: download the already-extracted info
+            if rendition is None:
+                logger.info(f"Downloading video from: {url}")
+                timer.start('download')
+                ydl.process_ie_result(info, download=True)
+
+        if rendition is not None:
+            # Drop the default selection so yt-dlp selects again from formats
+            info = {
+                k: v for k, v in info.items()
+                if k not in ('requested_formats', 'requested_downloads')
+            }
+            with yt_dlp.YoutubeDL({**opts, 'format': rendition.format_spec}) as ydl:
+                logger.info(f"Downloading video from: {url}")
+                timer.start('download')
+                ydl.process_ie_result(info, download=True)
+        timer.stop()
+    except Exception as e:
+        timer.stop(error=e)
+        if cache is not None and os.path.exists(output_filename):
+            os.remove(output_filename)
+        raise
 
     if not os.path.exists(output_filename):
+        ERRORS.labels("download", "DownloadError").inc()
         raise DownloadError(f"Download completed but file not found: {output_filename}")
 
     file_size = os.path.getsize(output_filename)
+    BYTES.labels("download").inc(file_size)
     logger.info(f"Downloaded {output_filename} ({file_size / 1024 / 1024:.1f} MB)")
 
+    # Safety net for videos whose size could not be (correctly) estimated
     if file_size > MAX_FILE_SIZE:
         os.remove(output_filename)
+        ERRORS.labels("download", "FileTooLargeError").inc()
         raise FileTooLargeError(file_size)
 
+    if cache is not None:
+        return cache.publish(url, output_filename)
     return output_filename
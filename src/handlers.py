@@ -1,28 +1,55 @@
 import asyncio
+import json
 import logging
 import os
 import re
 import time
 import tempfile
+import uuid
+from contextlib import nullcontext
+from datetime import datetime
 
 from telegram import LabeledPrice, Update
 from telegram.constants import ChatAction
-from telegram.ext import ContextTypes
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import CallbackContext, ContextTypes
+from sqlalchemy.exc import OperationalError
 from yt_dlp.utils import DownloadError, ExtractorError
 
+from src.batcher import download_writer, profile_writer
+from src.concurrency import AdaptiveConcurrency
 from src.config import settings
 from src.db import (
     async_session,
     count_downloads_today,
     create_subscription,
-    delete_download,
-    get_active_subscription,
+    enqueue_job,
     get_or_create_user,
-    has_active_subscription,
-    record_download,
-    reserve_download,
+    get_premium_until,
+    get_user_id,
+    invalidate_cached_video,
+    load_user,
+    read_session,
+    retry_locked,
+    start_download,
 )
+from src.disk_cache import video_cache
 from src.downloader import FileTooLargeError, download_video as dl_video
+from src.jobs import job_worker
+from src.metrics import (
+    BYTES,
+    CACHE_REQUESTS,
+    DOWNLOAD_SLOTS,
+    IN_FLIGHT,
+    REQUEST_SECONDS,
+    STAGE_SECONDS,
+    WRITE_BEHIND,
+    WRITE_BEHIND_DROPPED,
+    stage,
+)
+from src.pool import download_pool
+from src.scheduler import FREE, PREMIUM, PriorityScheduler
+from src.user_cache import CachedUser, user_cache
 
 logger = logging.getLogger(__name__)
 
@@ -30,14 +57,86 @@ TWITTER_URL_PATTERN = re.compile(
     r"https?:\/\/(?:www\.)?(twitter|x|fxtwitter|vxtwitter)\.com\/\w+\/status\/(\d+)"
 )
 
-# Fix 7: Global semaphore — limits total concurrent downloads
-_download_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_DOWNLOADS)
+# Tries of a request's database work while SQLite reports it locked,
+# before the user is asked to try again
+_DB_ATTEMPTS = 5
+_DB_BUSY_MESSAGE = "El servidor esta ocupado. Intenta de nuevo en unos segundos."
+
+# Fix 7: Global admission scheduler — limits total concurrent downloads,
+# admitting premium users first while aging keeps free users from starving
+_download_scheduler = PriorityScheduler(
+    settings.MAX_CONCURRENT_DOWNLOADS,
+    reserved={
+        PREMIUM: settings.PREMIUM_RESERVED_DOWNLOADS,
+        FREE: settings.FREE_RESERVED_DOWNLOADS,
+    },
+    aging_seconds=settings.PRIORITY_AGING_SECONDS,
+)
+
+
+def _download_dir() -> str:
+    """Internal: where downloads are written (the video cache publishes
+    from its own directory)."""
+    if video_cache is not None:
+        return str(video_cache.directory)
+    return tempfile.gettempdir()
+
+
+# Resizes the scheduler's limit at runtime (scheduled by main.py)
+download_concurrency = (
+    AdaptiveConcurrency(
+        _download_scheduler,
+        min_limit=settings.ADAPTIVE_MIN_DOWNLOADS,
+        max_limit=settings.ADAPTIVE_MAX_DOWNLOADS,
+        target_latency=settings.ADAPTIVE_TARGET_LATENCY_SECONDS,
+        max_error_rate=settings.ADAPTIVE_MAX_ERROR_RATE,
+        max_throttle_rate=settings.ADAPTIVE_MAX_THROTTLE_RATE,
+        min_free_bytes=settings.ADAPTIVE_MIN_FREE_DISK_MB * 1024 * 1024,
+        disk_path=_download_dir(),
+    )
+    if settings.ADAPTIVE_CONCURRENCY
+    else None
+)
 
 # Fix 6: Per-user locks — one download at a time per user
 # Use OrderedDict to auto-evict old entries and prevent memory leak
 _user_locks: dict[int, asyncio.Lock] = {}
 _MAX_USER_LOCKS = 1000
 
+# Single-flight: concurrent requests for the same tweet share one download.
+# Entries live until the last waiter has sent the file, so late joiners
+# reuse the finished file instead of downloading it again.
+_inflight_downloads: dict[str, "_SharedDownload"] = {}
+
+# Telegram file_id cache counters — hits re-send without downloading
+_file_id_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _register_metrics() -> None:
+    """Internal: expose the bookkeeping above at ``/metrics``, read at
+    scrape time."""
+    DOWNLOAD_SLOTS.labels("limit", "all").set_function(lambda: _download_scheduler.limit)
+    for tier in (PREMIUM, FREE):
+        for state in ("queued", "running"):
+            DOWNLOAD_SLOTS.labels(state, tier).set_function(
+                lambda tier=tier, state=state: _download_scheduler.stats()[tier][state]
+            )
+    IN_FLIGHT.labels("jobs").set_function(lambda: job_worker.in_flight())
+    IN_FLIGHT.labels("downloads").set_function(lambda: len(_inflight_downloads))
+    CACHE_REQUESTS.labels("file_id", "hit").set_function(lambda: _file_id_cache_stats["hits"])
+    CACHE_REQUESTS.labels("file_id", "miss").set_function(
+        lambda: _file_id_cache_stats["misses"]
+    )
+    CACHE_REQUESTS.labels("user", "hit").set_function(lambda: user_cache.hits)
+    CACHE_REQUESTS.labels("user", "miss").set_function(lambda: user_cache.misses)
+    WRITE_BEHIND.labels("profile").set_function(lambda: profile_writer.pending())
+    WRITE_BEHIND.labels("download").set_function(lambda: download_writer.pending())
+    WRITE_BEHIND_DROPPED.labels("profile").set_function(lambda: profile_writer.failed_items)
+    WRITE_BEHIND_DROPPED.labels("download").set_function(lambda: download_writer.failed_items)
+
+
+_register_metrics()
+
 
 def _get_user_lock(user_id: int) -> asyncio.Lock:
     """Get or create a per-user lock. Evicts old entries if over limit."""
@@ -53,6 +152,70 @@ def _get_user_lock(user_id: int) -> asyncio.Lock:
     return _user_locks[user_id]
 
 
+class _SharedDownload:
+    """A download in flight, shared by every request for the same tweet.
+
+    It waits for a slot at the highest tier among those requests.
+    """
+
+    def __init__(self, tweet_url: str, filename: str, tier: str):
+        self.tweet_url = tweet_url
+        self.filename = filename
+        self.tier = tier
+        self.waiters = 0
+        self.task = asyncio.create_task(self._run())
+        self.task.add_done_callback(self._on_done)
+
+    async def _run(self) -> str:
+        # Fix 1 + 7: Download in the worker pool, bounded by the scheduler
+        waiting_since = time.perf_counter()
+        async with _download_scheduler.slot(self.tier, key=self):
+            STAGE_SECONDS.labels("slot_wait").observe(time.perf_counter() - waiting_since)
+            tracked = download_concurrency.track() if download_concurrency else nullcontext()
+            with tracked:
+                return await download_pool.run(
+                    dl_video, self.tweet_url, self.filename, video_cache
+                )
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        # Failed downloads are dropped right away so the next request retries
+        if task.cancelled() or task.exception() is not None or self.waiters == 0:
+            self._discard()
+
+    def _discard(self) -> None:
+        if _inflight_downloads.get(self.tweet_url) is self:
+            del _inflight_downloads[self.tweet_url]
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+def _join_download(tweet_url: str, tweet_id: str, tier: str) -> _SharedDownload:
+    """Join the in-flight download for a tweet, starting it if needed."""
+    flight = _inflight_downloads.get(tweet_url)
+    if flight is not None and tier == PREMIUM and flight.tier != PREMIUM:
+        # Premium users don't wait at the priority of whoever started it
+        flight.tier = PREMIUM
+        _download_scheduler.promote(flight, PREMIUM)
+    if flight is None:
+        # Fix 3: A file of its own in the temp dir. Sharing only happens in
+        # this process, so a path per tweet could be written (or deleted)
+        # by another shard's download of the same tweet
+        filename = os.path.join(
+            tempfile.gettempdir(), f"video_{tweet_id}_{os.getpid()}_{uuid.uuid4().hex}.mp4"
+        )
+        flight = _SharedDownload(tweet_url, filename, tier)
+        _inflight_downloads[tweet_url] = flight
+    flight.waiters += 1
+    return flight
+
+
+def _leave_download(flight: _SharedDownload) -> None:
+    """Release a shared download; the last waiter deletes the file."""
+    flight.waiters -= 1
+    if flight.waiters == 0 and flight.task.done():
+        flight._discard()
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a welcome message and register the user."""
     tg_user = update.effective_user
@@ -90,15 +253,22 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Show the user their current plan status."""
     tg_user = update.effective_user
 
-    async with async_session() as session:
-        user = await get_or_create_user(
-            session, telegram_id=tg_user.id, username=tg_user.username
-        )
-        downloads_today = await count_downloads_today(session, user.id)
-        subscription = await get_active_subscription(session, user.id)
+    # Read-only pool: known users need no write at all (their profile is
+    # refreshed write-behind)
+    async with read_session() as session:
+        user_id = await get_user_id(session, tg_user.id)
+        if user_id is not None:
+            downloads_today = await count_downloads_today(session, user_id)
+            premium_until = await get_premium_until(session, user_id)
+    if user_id is None:
+        async with async_session() as session:
+            await get_or_create_user(session, **_profile(tg_user))
+        downloads_today, premium_until = 0, None
+    else:
+        await _refresh_profile(tg_user)
 
-    if subscription:
-        expires = subscription.expires_at.strftime("%d/%m/%Y")
+    if premium_until:
+        expires = premium_until.strftime("%d/%m/%Y")
         await update.message.reply_text(
             f"Plan: Premium\n"
             f"Descargas hoy: {downloads_today}\n"
@@ -164,9 +334,7 @@ async def successful_payment_handler(
     tg_user = update.effective_user
 
     async with async_session() as session:
-        user = await get_or_create_user(
-            session, telegram_id=tg_user.id, username=tg_user.username
-        )
+        user = await get_or_create_user(session, **_profile(tg_user))
         subscription = await create_subscription(
             session,
             user_id=user.id,
@@ -174,6 +342,9 @@ async def successful_payment_handler(
             telegram_charge_id=payment.telegram_payment_charge_id,
             duration_days=settings.PREMIUM_DURATION_DAYS,
         )
+    # The cached plan is stale now in this process; other shard workers find
+    # out in start_download, which re-checks the plan before refusing
+    user_cache.invalidate(tg_user.id)
 
     expires = subscription.expires_at.strftime("%d/%m/%Y")
     await update.message.reply_text(
@@ -188,7 +359,12 @@ async def successful_payment_handler(
 
 
 async def download_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Download a video from Twitter/X."""
+    """Queue a video download from Twitter/X.
+
+    The handler only enqueues a durable job; the job worker runs the
+    download, so bursts larger than MAX_CONCURRENT_DOWNLOADS and restarts
+    do not lose requests.
+    """
     message_text = update.message.text
     tg_user = update.effective_user
 
@@ -201,48 +377,94 @@ async def download_video(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     _, tweet_id = match.groups()
     tweet_url = f"https://x.com/i/status/{tweet_id}"
 
-    # Fix 6: Per-user lock — only 1 download at a time per user
-    user_lock = _get_user_lock(tg_user.id)
-    if user_lock.locked():
+    # Fix 6: Only 1 download at a time per user — the jobs table allows a
+    # single queued/running job per user
+    async def enqueue():
+        async with async_session() as session:
+            return await enqueue_job(
+                session,
+                telegram_user_id=tg_user.id,
+                chat_id=update.effective_chat.id,
+                tweet_url=tweet_url,
+                tweet_id=tweet_id,
+                payload=update.to_json(),
+            )
+
+    try:
+        job = await retry_locked(enqueue, attempts=_DB_ATTEMPTS)
+    except OperationalError as e:
+        logger.error(f"Enqueue failed: user_id={tg_user.id} tweet={tweet_id} err={e}")
+        await update.message.reply_text(_DB_BUSY_MESSAGE)
+        return
+    if job is None:
         await update.message.reply_text(
             "Ya tienes una descarga en curso. Espera a que termine."
         )
         return
 
+    job_worker.notify()
+
+
+async def run_job(application, job) -> None:
+    """Run a queued download job by replaying its original update."""
+    update = Update.de_json(json.loads(job.payload), application.bot)
+    tg_user = update.effective_user
+    context = CallbackContext(application, chat_id=job.chat_id, user_id=tg_user.id)
+
+    user_lock = _get_user_lock(tg_user.id)
     async with user_lock:
-        await _process_download(update, context, tg_user, tweet_url, tweet_id)
+        await _process_download(
+            update, context, tg_user, job.tweet_url, job.tweet_id, job_id=job.id
+        )
 
 
-async def _process_download(update, context, tg_user, tweet_url, tweet_id):
+async def _process_download(
+    update, context, tg_user, tweet_url, tweet_id, job_id=None
+):
     """Internal: handle the full download pipeline."""
     start_time = time.monotonic()
 
-    # Get user and check limits
-    async with async_session() as session:
-        user = await get_or_create_user(
-            session, telegram_id=tg_user.id, username=tg_user.username
-        )
-        is_premium = await has_active_subscription(session, user.id)
+    # Get user and check limits (usually from the in-process cache). Cache
+    # hits skip the profile upsert, so profile changes go write-behind
+    await _refresh_profile(tg_user)
 
     # Fix 2: Reserve download slot BEFORE downloading (atomic check+insert)
-    download_record = None
-    if not is_premium:
-        async with async_session() as session:
-            download_record = await reserve_download(
-                session, user.id, tweet_url, settings.FREE_DAILY_LIMIT
+    with stage("db_lookup"):
+        try:
+            user, started = await retry_locked(
+                lambda: _start_download(tg_user, tweet_url, tweet_id, job_id),
+                attempts=_DB_ATTEMPTS,
             )
-            if download_record is None:
-                await update.message.reply_text(
-                    f"Alcanzaste tu limite de {settings.FREE_DAILY_LIMIT} "
-                    f"descargas diarias.\n\n"
-                    f"Usa /subscribe para obtener descargas ilimitadas "
-                    f"por {settings.PREMIUM_PRICE_STARS} Stars/mes."
-                )
-                return
-
-    # Fix 3: Unique filename using tempfile
-    tmp_dir = tempfile.gettempdir()
-    filename = os.path.join(tmp_dir, f"video_{tweet_id}_{tg_user.id}.mp4")
+        except OperationalError as e:
+            logger.error(f"Database busy: user_id={tg_user.id} tweet={tweet_id} err={e}")
+            _request_done("db_busy", start_time)
+            await update.message.reply_text(_DB_BUSY_MESSAGE)
+            return
+    is_premium = user.is_premium()
+    if started.limit_reached:
+        _request_done("limit_reached", start_time)
+        await update.message.reply_text(
+            f"Alcanzaste tu limite de {settings.FREE_DAILY_LIMIT} "
+            f"descargas diarias.\n\n"
+            f"Usa /subscribe para obtener descargas ilimitadas "
+            f"por {settings.PREMIUM_PRICE_STARS} Stars/mes."
+        )
+        return
+    if started.premium_until is not None:
+        # Paid since the plan was cached (possibly in another process)
+        user_cache.invalidate(tg_user.id)
+        is_premium = True
+    download_id = started.download_id
+
+    # Re-send by file_id if this tweet was already uploaded to Telegram
+    if await _send_cached_video(update, context, tweet_id, started.cached):
+        elapsed = _request_done("cached", start_time)
+        logger.info(
+            f"Download OK (cached): user_id={tg_user.id} tweet={tweet_id} "
+            f"time={elapsed:.2f}s premium={is_premium}"
+        )
+        await _finish_download(user.user_id, tweet_url, tweet_id, record=is_premium)
+        return
 
     # Fix 8: Feedback — show typing/uploading action
     await context.bot.send_chat_action(
@@ -250,87 +472,201 @@ async def _process_download(update, context, tg_user, tweet_url, tweet_id):
     )
     status_msg = await update.message.reply_text("Descargando video...")
 
+    # Single-flight: N identical requests cost one download slot and one download
+    flight = _join_download(tweet_url, tweet_id, PREMIUM if is_premium else FREE)
     try:
-        # Fix 1 + 7: Non-blocking download with global semaphore
-        async with _download_semaphore:
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, dl_video, tweet_url, filename)
-
-    except FileTooLargeError as e:
-        logger.warning(
-            f"File too large: user_id={tg_user.id} tweet={tweet_id} "
-            f"size={e.file_size / 1024 / 1024:.1f}MB"
-        )
-        await status_msg.edit_text(
-            f"El video es demasiado grande "
-            f"({e.file_size / 1024 / 1024:.0f}MB). "
-            f"Telegram solo permite hasta 50MB."
-        )
-        # Rollback download reservation for free users
-        if download_record:
-            async with async_session() as session:
-                await delete_download(session, download_record.id)
-        return
+        try:
+            # Cached downloads live in the video cache, not at ``filename``
+            filename = await asyncio.shield(flight.task)
 
-    except (DownloadError, ExtractorError) as e:
-        logger.error(f"Download error: user_id={tg_user.id} tweet={tweet_id} err={e}")
-        await status_msg.edit_text(
-            "Error descargando el video. Verifica que el tweet tiene un video."
-        )
-        if download_record:
-            async with async_session() as session:
-                await delete_download(session, download_record.id)
-        return
+        except FileTooLargeError as e:
+            logger.warning(
+                f"File too large: user_id={tg_user.id} tweet={tweet_id} "
+                f"size={e.file_size / 1024 / 1024:.1f}MB"
+            )
+            await status_msg.edit_text(
+                f"El video es demasiado grande "
+                f"({e.file_size / 1024 / 1024:.0f}MB). "
+                f"Telegram solo permite hasta 50MB."
+            )
+            _request_done("too_large", start_time)
+            # Rollback download reservation for free users
+            if download_id:
+                await _release_download(download_id)
+            return
+
+        except (DownloadError, ExtractorError) as e:
+            logger.error(f"Download error: user_id={tg_user.id} tweet={tweet_id} err={e}")
+            await status_msg.edit_text(
+                "Error descargando el video. Verifica que el tweet tiene un video."
+            )
+            _request_done("download_error", start_time)
+            if download_id:
+                await _release_download(download_id)
+            return
+
+        except Exception as e:
+            logger.error(
+                f"Unexpected error: user_id={tg_user.id} tweet={tweet_id} err={e}"
+            )
+            await status_msg.edit_text("Error inesperado descargando el video.")
+            _request_done("error", start_time)
+            if download_id:
+                await _release_download(download_id)
+            return
+
+        # Send the video to the user
+        sent = None
+        try:
+            file_size = os.path.getsize(filename)
+            await context.bot.send_chat_action(
+                chat_id=update.effective_chat.id, action=ChatAction.UPLOAD_VIDEO
+            )
+            with stage("upload"), open(filename, "rb") as video_file:
+                sent = await context.bot.send_video(
+                    chat_id=update.message.chat_id, video=video_file
+                )
+            BYTES.labels("upload").inc(file_size)
+            await status_msg.delete()
+
+            # Fix 9: Structured logging
+            elapsed = _request_done("ok", start_time)
+            logger.info(
+                f"Download OK: user_id={tg_user.id} tweet={tweet_id} "
+                f"size={file_size / 1024 / 1024:.1f}MB time={elapsed:.1f}s "
+                f"premium={is_premium}"
+            )
+
+        except Exception as e:
+            logger.error(f"Send error: user_id={tg_user.id} tweet={tweet_id} err={e}")
+            await status_msg.edit_text(
+                "Error enviando el video. Puede ser demasiado grande para Telegram."
+            )
+            # Rollback for free users on send failure (and don't trust a
+            # file_id from a send that failed afterwards)
+            sent = None
+            if download_id:
+                await _release_download(download_id)
+            _request_done("send_error", start_time)
+
+    finally:
+        # The last request sharing this download cleans up the file, also
+        # when this one failed or was cancelled while waiting for it
+        with stage("cleanup"):
+            _leave_download(flight)
+
+    # Remember the new file_id and record premium downloads (free users
+    # already reserved above), write-behind
+    await _finish_download(
+        user.user_id,
+        tweet_url,
+        tweet_id,
+        video=getattr(sent, "video", None),
+        record=is_premium,
+    )
+
+
+def _request_done(outcome: str, start_time: float) -> float:
+    """Internal: observe a request's total time by outcome; returns it."""
+    elapsed = time.monotonic() - start_time
+    REQUEST_SECONDS.labels(outcome).observe(elapsed)
+    return elapsed
 
-    except Exception as e:
-        logger.error(
-            f"Unexpected error: user_id={tg_user.id} tweet={tweet_id} err={e}"
+
+def _profile(tg_user) -> dict:
+    """Internal: the profile fields we keep for a Telegram user."""
+    return {
+        "telegram_id": tg_user.id,
+        "username": tg_user.username,
+        "full_name": tg_user.full_name,
+        "language_code": tg_user.language_code,
+    }
+
+
+async def _refresh_profile(tg_user) -> None:
+    """Internal: queue a profile update; only changed fields get written."""
+    await profile_writer.submit(_profile(tg_user), key=tg_user.id)
+
+
+async def _start_download(tg_user, tweet_url, tweet_id, job_id):
+    """Internal: one session for the user lookup (committed on a cache
+    miss), the reservation and the file_id lookup."""
+    async with async_session() as session:
+        user = await user_cache.get(tg_user.id, lambda: _load_user(session, tg_user))
+        started = await start_download(
+            session,
+            user.user_id,
+            user.is_premium(),
+            tweet_url,
+            tweet_id,
+            settings.FREE_DAILY_LIMIT,
+            job_id=job_id,
         )
-        await status_msg.edit_text("Error inesperado descargando el video.")
-        if download_record:
-            async with async_session() as session:
-                await delete_download(session, download_record.id)
-        return
+    return user, started
+
+
+async def _load_user(session, tg_user) -> CachedUser:
+    """Internal: fetch (or register) a user and their premium status.
+
+    Commits before the result is cached: a registration rolled back with
+    a failed ``start_download`` would leave the cache holding a row id
+    SQLite may hand to another user. For known users it only ends a read.
+    """
+    user_id, premium_until = await load_user(session, **_profile(tg_user))
+    await session.commit()
+    return CachedUser(user_id, premium_until)
+
+
+async def _finish_download(user_id, tweet_url, tweet_id, video=None, record=False):
+    """Internal: queue the file_id and the premium download record; they are
+    written in batches, off the request path."""
+    if video is not None:
+        row = {
+            "tweet_id": tweet_id,
+            "file_id": video.file_id,
+            "file_unique_id": video.file_unique_id,
+            "file_size": video.file_size,
+        }
+        await download_writer.submit(("video", row), key=("video", tweet_id))
+    if record:
+        row = {"user_id": user_id, "tweet_url": tweet_url, "created_at": datetime.now()}
+        await download_writer.submit(("record", row))
+
+
+async def _release_download(download_id):
+    """Internal: queue the rollback of a free user's reservation."""
+    await download_writer.submit(("release", download_id), key=("release", download_id))
+
+
+async def _send_cached_video(update, context, tweet_id, cached) -> bool:
+    """Internal: re-send a previously uploaded video by its Telegram file_id.
+
+    Returns True if the video was sent. A file_id rejected by Telegram is
+    invalidated so the caller falls back to a fresh download.
+    """
+    if cached is None:
+        _file_id_cache_stats["misses"] += 1
+        return False
 
-    # Send the video to the user
     try:
-        file_size = os.path.getsize(filename)
         await context.bot.send_chat_action(
             chat_id=update.effective_chat.id, action=ChatAction.UPLOAD_VIDEO
         )
-        with open(filename, "rb") as video_file:
-            await context.bot.send_video(
-                chat_id=update.message.chat_id, video=video_file
-            )
-        await status_msg.delete()
-
-        # Fix 9: Structured logging
-        elapsed = time.monotonic() - start_time
-        logger.info(
-            f"Download OK: user_id={tg_user.id} tweet={tweet_id} "
-            f"size={file_size / 1024 / 1024:.1f}MB time={elapsed:.1f}s "
-            f"premium={is_premium}"
+        await context.bot.send_video(
+            chat_id=update.message.chat_id, video=cached.file_id
         )
+    except BadRequest as e:
+        logger.warning(f"Stale file_id: tweet={tweet_id} err={e}")
+        _file_id_cache_stats["invalidations"] += 1
+        _file_id_cache_stats["misses"] += 1
+        async with async_session() as session:
+            await invalidate_cached_video(session, tweet_id, cached.file_id)
+        return False
+    except TelegramError as e:
+        logger.warning(f"Cached send failed: tweet={tweet_id} err={e}")
+        _file_id_cache_stats["misses"] += 1
+        return False
 
-    except Exception as e:
-        logger.error(f"Send error: user_id={tg_user.id} tweet={tweet_id} err={e}")
-        await status_msg.edit_text(
-            "Error enviando el video. Puede ser demasiado grande para Telegram."
-        )
-        # Rollback for free users on send failure
-        if download_record:
-            async with async_session() as session:
-                await delete_download(session, download_record.id)
-
-    finally:
-        # Always clean up the file
-        if os.path.exists(filename):
-            os.remove(filename)
+    _file_id_cache_stats["hits"] += 1
+    return True
 
-    # Record download for premium users (free users already reserved above)
-    if is_premium:
-        try:
-            async with async_session() as session:
-                await record_download(session, user.id, tweet_url)
-        except Exception as e:
-            logger.error(f"Failed to record download: user_id={tg_user.id} err={e}")
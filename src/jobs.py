@@ -0,0 +1,186 @@
+import asyncio
+import logging
+
+from src.config import settings
+from src.db import (
+    async_session,
+    claim_jobs,
+    finish_job,
+    renew_job_lease,
+    requeue_jobs,
+    retry_locked,
+)
+
+logger = logging.getLogger(__name__)
+
+# Tries of a claim or recovery while SQLite reports the database locked
+_CLAIM_ATTEMPTS = 3
+
+
+class JobWorker:
+    """Runs queued download jobs from the ``jobs`` table.
+
+    Jobs are claimed in batches with a lease; a heartbeat renews the lease
+    while a job runs. Jobs whose lease expired (crashed process) are put
+    back in the queue at startup and periodically while running. Marking
+    a job finished is retried while the database is locked, for as long
+    as the lease holds: a job left ``running`` would be requeued and its
+    video sent again.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        batch_size: int,
+        lease_seconds: int,
+        poll_seconds: float,
+        max_attempts: int,
+    ):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self._process = None
+        self._loop_task: asyncio.Task | None = None
+        self._running: dict[int, asyncio.Task] = {}
+        # Event loop time each running job's lease runs out
+        self._leases: dict[int, float] = {}
+        # Jobs that ran and are being marked finished
+        self._finishing: set[int] = set()
+        self._wakeup = asyncio.Event()
+
+    async def start(self, process) -> None:
+        """Recover expired jobs and start claiming.
+
+        ``process`` is an ``async (job) -> None`` callable that runs a job.
+        """
+        self._process = process
+        recovered = await retry_locked(self._recover, attempts=_CLAIM_ATTEMPTS)
+        if recovered:
+            logger.info(f"Recovered {recovered} jobs with expired leases")
+        self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Stop claiming, let running jobs finish, re-queue the rest."""
+        if self._loop_task is None:
+            return
+        self._loop_task.cancel()
+        await asyncio.gather(self._loop_task, return_exceptions=True)
+        self._loop_task = None
+
+        if self._running:
+            await asyncio.wait(list(self._running.values()), timeout=timeout)
+        # Jobs already being marked finished are let through: requeued,
+        # they would run (and send their video) again
+        unfinished = [job_id for job_id in self._running if job_id not in self._finishing]
+        for job_id in unfinished:
+            self._running[job_id].cancel()
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+        self._running.clear()
+        if unfinished:
+            async with async_session() as session:
+                await requeue_jobs(session, job_ids=unfinished)
+            logger.info(f"Re-queued {len(unfinished)} unfinished jobs")
+
+    def notify(self) -> None:
+        """Wake the worker loop (called right after enqueueing a job)."""
+        self._wakeup.set()
+
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_recovery = loop.time() + self.lease_seconds
+        while True:
+            self._wakeup.clear()
+            claimed = []
+            try:
+                free = self.concurrency - len(self._running)
+                if free > 0:
+                    claimed = await retry_locked(
+                        lambda: self._claim(min(free, self.batch_size)),
+                        attempts=_CLAIM_ATTEMPTS,
+                    )
+                if loop.time() >= next_recovery:
+                    next_recovery = loop.time() + self.lease_seconds
+                    await retry_locked(self._recover, attempts=_CLAIM_ATTEMPTS)
+            except Exception as e:
+                logger.error(f"Job claim failed: err={e}")
+
+            for job in claimed:
+                task = asyncio.create_task(self._execute(job))
+                self._running[job.id] = task
+
+            # Keep going while full batches come back; otherwise wait for a
+            # new job, a finished job or the poll interval
+            if len(claimed) < self.batch_size or len(self._running) >= self.concurrency:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim(self, limit: int) -> list:
+        async with async_session() as session:
+            return await claim_jobs(session, limit, self.lease_seconds)
+
+    async def _recover(self) -> int:
+        async with async_session() as session:
+            return await requeue_jobs(session, max_attempts=self.max_attempts)
+
+    async def _execute(self, job) -> None:
+        loop = asyncio.get_running_loop()
+        self._leases[job.id] = loop.time() + self.lease_seconds
+        # Keeps beating until the job is marked finished
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        error = None
+        try:
+            await self._process(job)
+        except asyncio.CancelledError:
+            heartbeat.cancel()
+            self._leases.pop(job.id, None)
+            raise
+        except Exception as e:
+            logger.error(f"Job failed: job_id={job.id} tweet={job.tweet_id} err={e}")
+            error = str(e) or type(e).__name__
+
+        self._finishing.add(job.id)
+        try:
+            await retry_locked(
+                lambda: self._finish(job.id, error), until=lambda: self._leases[job.id]
+            )
+        except Exception as e:
+            logger.error(f"Failed to finish job: job_id={job.id} err={e}")
+        finally:
+            heartbeat.cancel()
+            self._finishing.discard(job.id)
+            self._leases.pop(job.id, None)
+            self._running.pop(job.id, None)
+            self._wakeup.set()
+
+    async def _finish(self, job_id: int, error: str | None) -> None:
+        async with async_session() as session:
+            await finish_job(session, job_id, error)
+
+    async def _heartbeat(self, job_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            renewed_at = loop.time()
+            try:
+                async with async_session() as session:
+                    await renew_job_lease(session, job_id, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Lease renewal failed: job_id={job_id} err={e}")
+            else:
+                self._leases[job_id] = renewed_at + self.lease_seconds
+
+
+job_worker = JobWorker(
+    concurrency=settings.JOB_WORKER_CONCURRENCY,
+    batch_size=settings.JOB_CLAIM_BATCH,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+    poll_seconds=settings.JOB_POLL_SECONDS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+)
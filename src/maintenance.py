@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from src.config import settings
+from src.db import (
+    async_session,
+    delete_old_downloads,
+    delete_old_jobs,
+    incremental_vacuum,
+    optimize,
+    prune_daily_usage,
+    rollup_download_stats,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseMaintenance:
+    """Periodic upkeep of the database, run by PTB's JobQueue.
+
+    Each run rolls completed days up into ``daily_download_stats``, deletes
+    downloads older than ``retention_days`` and finished jobs older than
+    ``job_retention_days`` in batches of ``batch_size`` rows (pausing
+    between batches so writers get the lock), returns up to
+    ``vacuum_pages`` free pages to the filesystem and refreshes the query
+    planner's statistics. The timings of the last run are kept in
+    ``last_report``.
+    """
+
+    def __init__(
+        self,
+        retention_days: int,
+        job_retention_days: int,
+        batch_size: int,
+        vacuum_pages: int,
+        pause: float = 0.05,
+    ):
+        self.retention_days = retention_days
+        self.job_retention_days = job_retention_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self.runs = 0
+        self.last_report: dict | None = None
+        self._lock = asyncio.Lock()
+
+    async def run(self) -> dict:
+        """Run every maintenance step once and return the report."""
+        async with self._lock:
+            started = time.perf_counter()
+            now = datetime.now()
+            # A day is complete once the write-behind stragglers are in
+            complete_before = (now - timedelta(hours=1)).date()
+            report = {}
+
+            t0 = time.perf_counter()
+            async with async_session() as session:
+                report["days_rolled_up"] = await rollup_download_stats(session, complete_before)
+            report["rollup_ms"] = _ms_since(t0)
+
+            t0 = time.perf_counter()
+            report["usage_rows_deleted"] = 0
+            report["downloads_deleted"] = 0
+            report["delete_batches"] = 0
+            if self.retention_days > 0:
+                # Never delete what hasn't been rolled up
+                before = min(now.date() - timedelta(days=self.retention_days), complete_before)
+                report["usage_rows_deleted"], _ = await self._in_batches(prune_daily_usage, before)
+                deleted, batches = await self._in_batches(delete_old_downloads, before)
+                report["downloads_deleted"] = deleted
+                report["delete_batches"] = batches
+            report["jobs_deleted"] = 0
+            if self.job_retention_days > 0:
+                before = now - timedelta(days=self.job_retention_days)
+                report["jobs_deleted"], _ = await self._in_batches(delete_old_jobs, before)
+            report["delete_ms"] = _ms_since(t0)
+
+            t0 = time.perf_counter()
+            report["pages_vacuumed"] = await self._vacuum()
+            report["vacuum_ms"] = _ms_since(t0)
+
+            t0 = time.perf_counter()
+            async with async_session() as session:
+                await optimize(session)
+            report["optimize_ms"] = _ms_since(t0)
+
+            report["total_ms"] = _ms_since(started)
+            self.runs += 1
+            self.last_report = report
+            logger.info(f"Database maintenance finished: {report}")
+            return report
+
+    async def run_job(self, context) -> None:
+        """JobQueue callback."""
+        try:
+            await self.run()
+        except Exception as e:
+            logger.error(f"Database maintenance failed: {e}")
+
+    async def _in_batches(self, delete_batch, before: date | datetime) -> tuple[int, int]:
+        """Call ``delete_batch`` until a batch comes back short; returns the
+        rows deleted and the number of batches."""
+        deleted = batches = 0
+        while True:
+            async with async_session() as session:
+                count = await delete_batch(session, before, self.batch_size)
+            deleted += count
+            batches += 1
+            if count < self.batch_size:
+                return deleted, batches
+            await asyncio.sleep(self.pause)
+
+    async def _vacuum(self) -> int:
+        freed = 0
+        while freed < self.vacuum_pages:
+            pages = min(self.batch_size, self.vacuum_pages - freed)
+            async with async_session() as session:
+                count = await incremental_vacuum(session, pages)
+            freed += count
+            if count < pages:
+                break
+            await asyncio.sleep(self.pause)
+        return freed
+
+
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+db_maintenance = DatabaseMaintenance(
+    retention_days=settings.DOWNLOAD_RETENTION_DAYS,
+    job_retention_days=settings.JOB_RETENTION_DAYS,
+    batch_size=settings.MAINTENANCE_BATCH_SIZE,
+    vacuum_pages=settings.MAINTENANCE_VACUUM_PAGES,
+)
@@ -0,0 +1,343 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histograms; the last bucket is +Inf
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+# Observations made in a download worker process, shipped back with the
+# result (see capture() and replay())
+_captured: list | None = None
+
+
+class _Metric:
+    """A metric family: one value (or histogram) per label combination."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The child for one combination of label values."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child(key))
+        return child
+
+    def samples(self):
+        """``(suffix, labels, value)`` for every child, in exposition order."""
+        for key, child in sorted(self._children.items()):
+            yield from child.samples(dict(zip(self.labelnames, key)))
+
+    def _new_child(self, key):
+        raise NotImplementedError
+
+
+class _Value:
+    """A counter or gauge child. ``set_function`` makes it read its value
+    from existing bookkeeping at scrape time instead."""
+
+    def __init__(self, metric: _Metric, key: tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+        self._value = 0.0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if _captured is not None:
+            _captured.append((self._metric.name, self._key, "inc", amount))
+            return
+        with self._lock:
+            self._value += amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function) -> None:
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            return float(self._function())
+        return self._value
+
+    def samples(self, labels: dict):
+        try:
+            value = self.get()
+        except Exception as e:
+            logger.warning(f"Metric {self._metric.name}{self._key} unavailable: {e}")
+            return
+        yield "", labels, value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self, key):
+        return _Value(self, key)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self, key):
+        return _Value(self, key)
+
+
+class _Buckets:
+    """A histogram child: cumulative bucket counts, sum and count."""
+
+    def __init__(self, metric: "Histogram", key: tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+        self._counts = [0] * (len(metric.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if _captured is not None:
+            _captured.append((self._metric.name, self._key, "observe", value))
+            return
+        with self._lock:
+            self._counts[bisect_left(self._metric.buckets, value)] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def sum(self) -> float:
+        return self._sum
+
+    def samples(self, labels: dict):
+        cumulative = 0
+        for bound, count in zip((*self._metric.buckets, math.inf), self._counts):
+            cumulative += count
+            yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+        yield "_sum", labels, self._sum
+        yield "_count", labels, cumulative
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self, key):
+        return _Buckets(self, key)
+
+
+class Registry:
+    """The metrics exposed at ``/metrics``."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> _Metric:
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """The Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(
+                    f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def replay(self, events: list) -> None:
+        """Apply observations captured in another process."""
+        for name, key, method, value in events:
+            getattr(self._metrics[name].labels(*key), method)(value)
+
+    def _add(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+@contextmanager
+def capture():
+    """Record counter increments and histogram observations made in the
+    block in a list instead of applying them, so a worker process can send
+    them back to be replayed by the bot's registry."""
+    global _captured
+    events = []
+    previous, _captured = _captured, events
+    try:
+        yield events
+    finally:
+        _captured = previous
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsServer:
+    """Minimal HTTP server answering ``GET /metrics`` on the bot's loop.
+
+    Meant to listen on a local address for a Prometheus scraper; anything
+    else gets a 404.
+    """
+
+    def __init__(self, registry: Registry, host: str, port: int):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> None:
+        if self._server is not None:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Metrics server listening on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Skip the headers; the request has no body we care about
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            method, path, *_ = request.decode("latin-1").split() or ("", "")
+            if method == "GET" and path.split("?")[0] == "/metrics":
+                status = "200 OK"
+                body = self.registry.render().encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+registry = Registry()
+
+# Pipeline stages: db_lookup, slot_wait, extract, download, merge, upload,
+# cleanup (extract/download/merge are timed in the download worker)
+STAGE_SECONDS = registry.histogram(
+    "dl_video_stage_seconds", "Time spent in each download pipeline stage.", ("stage",)
+)
+REQUEST_SECONDS = registry.histogram(
+    "dl_video_request_seconds", "Download requests end to end, by outcome.", ("outcome",)
+)
+ERRORS = registry.counter(
+    "dl_video_errors_total", "Failed pipeline stages by exception class.", ("stage", "error")
+)
+BYTES = registry.counter(
+    "dl_video_bytes_total", "Video bytes downloaded by yt-dlp and uploaded to Telegram.",
+    ("direction",),
+)
+CACHE_REQUESTS = registry.counter(
+    "dl_video_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result")
+)
+DOWNLOAD_SLOTS = registry.gauge(
+    "dl_video_download_slots", "Download admission: slot limit, queued and running by tier.",
+    ("state", "tier"),
+)
+CONCURRENCY_CHANGES = registry.counter(
+    "dl_video_concurrency_changes_total",
+    "Download slot limit changes made by the adaptive controller.",
+    ("direction", "reason"),
+)
+IN_FLIGHT = registry.gauge(
+    "dl_video_in_flight", "Work in progress: running jobs and distinct tweets downloading.",
+    ("kind",),
+)
+WRITE_BEHIND = registry.gauge(
+    "dl_video_write_behind_pending", "Writes buffered by each write-behind batcher.", ("writer",)
+)
+WRITE_BEHIND_DROPPED = registry.counter(
+    "dl_video_write_behind_dropped_total",
+    "Buffered writes dropped after their batch kept failing.",
+    ("writer",),
+)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage into STAGE_SECONDS; a failure also counts its
+    exception class in ERRORS."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.labels(name, type(e).__name__).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
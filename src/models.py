@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import BigInteger, ForeignKey, String, func
+from sqlalchemy import DDL, BigInteger, ForeignKey, Index, String, Text, event, func, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -17,6 +17,9 @@ class User(Base):
     full_name: Mapped[str | None] = mapped_column(String, nullable=True)
     is_bot: Mapped[bool] = mapped_column(default=False)
     language_code: Mapped[str | None] = mapped_column(String, nullable=True)
+    # End of the paid plan, kept by create_subscription so tier checks
+    # read this row instead of the subscriptions table
+    premium_until: Mapped[datetime | None] = mapped_column(nullable=True)
     created_at: Mapped[datetime] = mapped_column(default=func.now())
 
     subscriptions: Mapped[list["Subscription"]] = relationship(
@@ -32,6 +35,10 @@ class User(Base):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # Active-subscription lookups: user_id = ? AND expires_at > now
+        Index("ix_subscriptions_user_expires", "user_id", "expires_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
@@ -49,6 +56,12 @@ class Subscription(Base):
 
 class Download(Base):
     __tablename__ = "downloads"
+    __table_args__ = (
+        # A user's downloads by time: user_id = ? AND created_at in [a, b)
+        Index("ix_downloads_user_created", "user_id", "created_at"),
+        # Retention: the oldest downloads first (see src/maintenance.py)
+        Index("ix_downloads_created", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
@@ -59,3 +72,111 @@ class Download(Base):
 
     def __repr__(self) -> str:
         return f"<Download(user_id={self.user_id}, url={self.tweet_url})>"
+
+
+class DailyUsage(Base):
+    """Downloads per user and day, so quota checks don't count history."""
+
+    __tablename__ = "daily_usage"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(default=0, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<DailyUsage(user_id={self.user_id}, day={self.day}, count={self.count})>"
+
+
+# daily_usage follows inserts and deletes on downloads inside the same
+# statement, so a reservation is a single INSERT (see db.reserve_download)
+DAILY_USAGE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_downloads_count_usage
+    AFTER INSERT ON downloads
+    BEGIN
+        INSERT INTO daily_usage (user_id, day, count)
+        VALUES (NEW.user_id, date(NEW.created_at), 1)
+        ON CONFLICT (user_id, day) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_downloads_release_usage
+    AFTER DELETE ON downloads
+    BEGIN
+        UPDATE daily_usage SET count = count - 1
+        WHERE user_id = OLD.user_id AND day = date(OLD.created_at) AND count > 0;
+    END
+    """,
+)
+
+for _trigger in DAILY_USAGE_TRIGGERS:
+    event.listen(Base.metadata, "after_create", DDL(_trigger))
+
+
+class DailyDownloadStats(Base):
+    """Downloads per day, kept after the raw rows pass the retention window."""
+
+    __tablename__ = "daily_download_stats"
+
+    day: Mapped[date] = mapped_column(primary_key=True)
+    downloads: Mapped[int] = mapped_column(nullable=False)
+    # Distinct users who downloaded that day
+    users: Mapped[int] = mapped_column(nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<DailyDownloadStats(day={self.day}, downloads={self.downloads})>"
+
+
+class CachedVideo(Base):
+    __tablename__ = "cached_videos"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    tweet_id: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    file_id: Mapped[str] = mapped_column(String, nullable=False)
+    file_unique_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    file_size: Mapped[int | None] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<CachedVideo(tweet_id={self.tweet_id}, file_id={self.file_id})>"
+
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # At most one active job per user, enforced by the database so it
+        # holds across processes
+        Index(
+            "ix_jobs_one_active_per_user",
+            "telegram_user_id",
+            unique=True,
+            sqlite_where=text("state IN ('queued', 'running')"),
+        ),
+        Index("ix_jobs_state_id", "state", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    telegram_user_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    tweet_url: Mapped[str] = mapped_column(String, nullable=False)
+    tweet_id: Mapped[str] = mapped_column(String, nullable=False)
+    # The originating Update as JSON, replayed by the worker
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    state: Mapped[str] = mapped_column(String, default=JOB_QUEUED)
+    attempts: Mapped[int] = mapped_column(default=0)
+    lease_until: Mapped[datetime | None] = mapped_column(nullable=True)
+    # Reservation made by this job, released if the job is recovered
+    download_id: Mapped[int | None] = mapped_column(nullable=True)
+    error: Mapped[str | None] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(default=func.now(), onupdate=func.now())
+
+    def __repr__(self) -> str:
+        return f"<Job(id={self.id}, tweet_id={self.tweet_id}, state={self.state})>"
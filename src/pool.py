@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from yt_dlp.utils import DownloadError
+
+from src.config import settings
+from src.downloader import FileTooLargeError
+from src.metrics import capture, registry
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerError(Exception):
+    """Any other exception raised in a download worker, as its class name
+    and message (the exception itself may not survive pickling)."""
+
+
+def _init_worker() -> None:
+    """Runs once per worker process: pay yt-dlp's import cost up front."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+    import yt_dlp
+    from yt_dlp.extractor import gen_extractor_classes
+
+    # Load the extractor registry now rather than on the first job
+    gen_extractor_classes()
+    logger.info(f"Download worker ready (yt-dlp {yt_dlp.version.__version__})")
+
+
+def _call_in_worker(fn, *args):
+    """Run ``fn`` in a worker and make its errors safe to send back.
+
+    Returns ``(result, error, metrics)``: the metrics ``fn`` recorded are
+    sent back even when it fails, to be replayed in the bot's registry.
+    yt-dlp's DownloadError carries the original ``exc_info`` (including a
+    traceback), which cannot be pickled, so it is rebuilt from its message;
+    anything else comes back as a WorkerError.
+    """
+    with capture() as events:
+        try:
+            return fn(*args), None, events
+        except FileTooLargeError as e:
+            return None, e, events
+        except DownloadError as e:
+            return None, DownloadError(str(e)), events
+        except Exception as e:
+            return None, WorkerError(f"{type(e).__name__}: {e}"), events
+
+
+class DownloadPool:
+    """Dedicated process pool that runs yt-dlp off the bot's event loop.
+
+    Until ``start()`` is called (or with ``executor="thread"``) jobs fall
+    back to asyncio's default thread executor.
+    """
+
+    def __init__(self, executor: str, max_workers: int, max_jobs_per_worker: int):
+        self.executor = executor
+        self.max_workers = max_workers
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._pool: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self.executor != "process" or self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            # max_tasks_per_child requires a non-fork start method
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            max_tasks_per_child=self.max_jobs_per_worker or None,
+        )
+        logger.info(
+            f"Download pool started: workers={self.max_workers} "
+            f"max_jobs_per_worker={self.max_jobs_per_worker}"
+        )
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn, *args):
+        """Run ``fn(*args)`` in the pool and return its result."""
+        loop = asyncio.get_running_loop()
+        if self._pool is None:
+            return await loop.run_in_executor(None, fn, *args)
+        result, error, events = await loop.run_in_executor(
+            self._pool, _call_in_worker, fn, *args
+        )
+        registry.replay(events)
+        if error is not None:
+            raise error
+        return result
+
+
+download_pool = DownloadPool(
+    executor=settings.DOWNLOAD_EXECUTOR,
+    max_workers=settings.DOWNLOAD_WORKERS or (
+        settings.ADAPTIVE_MAX_DOWNLOADS
+        if settings.ADAPTIVE_CONCURRENCY
+        else settings.MAX_CONCURRENT_DOWNLOADS
+    ),
+    max_jobs_per_worker=settings.DOWNLOAD_WORKER_MAX_JOBS,
+)
@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+PREMIUM = "premium"
+FREE = "free"
+TIERS = (PREMIUM, FREE)
+
+# A fresh premium request outranks a free one by one "aging period"
+_BASE_PRIORITY = {PREMIUM: 1.0, FREE: 0.0}
+
+
+class _Waiter:
+    def __init__(self, tier: str, seq: int, future: asyncio.Future, key=None):
+        self.tier = tier
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.future = future
+        self.key = key
+
+
+class PriorityScheduler:
+    """Priority admission control for downloads (premium > free).
+
+    Waiters are admitted by priority, where a waiter's priority grows by 1
+    for every ``aging_seconds`` it has waited, so free users are never
+    starved (an ``aging_seconds`` of 0 turns aging off: premium always goes
+    first). ``reserved`` guarantees each tier a number of slots the other
+    tiers cannot take, even under a flood of higher-priority requests.
+    Reservations are capped below the limit (see ``_cap_reservations``).
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        reserved: dict[str, int] | None = None,
+        aging_seconds: float = 30.0,
+    ):
+        self.limit = limit
+        self.reserved = reserved or {}
+        self.aging_seconds = aging_seconds
+        self._reserved = self._cap_reservations()
+        if self._reserved != {tier: self.reserved.get(tier, 0) for tier in TIERS}:
+            logger.warning(
+                f"Download slot reservations {self.reserved} capped to {self._reserved} "
+                f"for a limit of {limit}"
+            )
+        self._running = {tier: 0 for tier in TIERS}
+        self._waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._admitted = {tier: 0 for tier in TIERS}
+        self._wait_total = {tier: 0.0 for tier in TIERS}
+        self._wait_max = {tier: 0.0 for tier in TIERS}
+
+    @asynccontextmanager
+    async def slot(self, tier: str, key=None):
+        """Hold a download slot for ``tier`` for the duration of the block.
+
+        While it waits, ``promote(key, ...)`` can raise its tier.
+        """
+        tier = await self.acquire(tier, key)
+        try:
+            yield
+        finally:
+            self.release(tier)
+
+    async def acquire(self, tier: str, key=None) -> str:
+        """Wait for a slot; returns the tier it was admitted as."""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(tier, next(self._seq), loop.create_future(), key)
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted, but cancelled before the slot could be used
+                self.release(waiter.tier)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        return waiter.tier
+
+    def release(self, tier: str) -> None:
+        self._running[tier] -= 1
+        self._dispatch()
+
+    def promote(self, key, tier: str) -> None:
+        """Raise the tier of the requests waiting under ``key`` (a premium
+        user joined a download a free user started)."""
+        for waiter in self._waiters:
+            if waiter.key == key and _BASE_PRIORITY[tier] > _BASE_PRIORITY[waiter.tier]:
+                waiter.tier = tier
+        self._dispatch()
+
+    def set_limit(self, limit: int) -> None:
+        """Resize the slot limit at runtime. A larger limit admits waiters
+        right away; a smaller one takes effect as running downloads finish."""
+        self.limit = limit
+        self._reserved = self._cap_reservations()
+        self._dispatch()
+
+    def stats(self) -> dict[str, dict]:
+        """Queue depth, running count and wait times (seconds) per tier."""
+        now = time.monotonic()
+        stats = {}
+        for tier in TIERS:
+            queued = [w for w in self._waiters if w.tier == tier]
+            admitted = self._admitted[tier]
+            stats[tier] = {
+                "queued": len(queued),
+                "running": self._running[tier],
+                "admitted": admitted,
+                "avg_wait": self._wait_total[tier] / admitted if admitted else 0.0,
+                "max_wait": self._wait_max[tier],
+                "oldest_wait": max((now - w.enqueued_at for w in queued), default=0.0),
+            }
+        return stats
+
+    def _priority(self, waiter: _Waiter, now: float) -> float:
+        if self.aging_seconds <= 0:
+            return _BASE_PRIORITY[waiter.tier]
+        aged = (now - waiter.enqueued_at) / self.aging_seconds
+        return _BASE_PRIORITY[waiter.tier] + aged
+
+    def _cap_reservations(self) -> dict[str, int]:
+        """The reservations in effect, their sum kept below the limit
+        (premium's first). A tier is only admitted while the free slots
+        exceed what the other tiers are owed, so with a limit of 1 and both
+        tiers reserving 1 nobody would ever be admitted."""
+        capped = {}
+        for tier in TIERS:
+            others = sum(capped.values())
+            capped[tier] = max(0, min(self.reserved.get(tier, 0), self.limit - 1 - others))
+        return capped
+
+    def _admissible(self, tier: str) -> bool:
+        free_slots = self.limit - sum(self._running.values())
+        # Slots still owed to other tiers' reservations are off limits
+        owed = sum(
+            max(0, self._reserved[other] - self._running[other])
+            for other in TIERS
+            if other != tier
+        )
+        return free_slots > owed
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        ranked = sorted(
+            self._waiters, key=lambda w: (-self._priority(w, now), w.seq)
+        )
+        for waiter in ranked:
+            if waiter.future.done() or not self._admissible(waiter.tier):
+                continue
+            self._waiters.remove(waiter)
+            waited = now - waiter.enqueued_at
+            self._running[waiter.tier] += 1
+            self._admitted[waiter.tier] += 1
+            self._wait_total[waiter.tier] += waited
+            self._wait_max[waiter.tier] = max(self._wait_max[waiter.tier], waited)
+            waiter.future.set_result(None)
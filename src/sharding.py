@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+
+from telegram import Bot, Update
+from telegram.ext import Application, Updater
+
+logger = logging.getLogger(__name__)
+
+# Sent to a worker's queue to make it shut down
+_STOP = None
+
+# How often the dispatcher checks that every worker is still alive
+_HEALTH_CHECK_SECONDS = 1.0
+
+
+def shard_for(user_id: int | None, shards: int) -> int:
+    """Shard that owns a user; updates without a user go to shard 0."""
+    if user_id is None:
+        return 0
+    return user_id % shards
+
+
+class ShardPool:
+    """N worker processes, each running its own bot application.
+
+    Every update is routed to the worker that owns its ``effective_user``,
+    so all updates of one user are handled by the same process and the
+    per-user locks in ``src.handlers`` keep working. State shared between
+    users (quotas, jobs, subscriptions) lives in the database.
+
+    ``build`` must be a picklable callable (e.g. a module-level function or
+    ``functools.partial`` of one) taking an ``ApplicationBuilder`` and
+    returning a ready ``Application``.
+
+    A worker that dies is restarted on the same queue by ``check``, up to
+    ``max_restarts`` times in total; after that ``check`` raises, so the
+    bot fails instead of silently dropping a shard's users.
+    """
+
+    def __init__(self, build, shards: int, queue_size: int = 0, max_restarts: int = 5):
+        self.build = build
+        self.shards = shards
+        self.queue_size = queue_size
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = []
+        self._processes = []
+
+    def start(self) -> None:
+        for index in range(self.shards):
+            shard_queue = self._context.Queue(maxsize=self.queue_size)
+            self._queues.append(shard_queue)
+            self._processes.append(self._spawn(index, shard_queue))
+        logger.info(f"Started {self.shards} shard workers")
+
+    def check(self) -> None:
+        """Restart workers that exited; raise once the restart budget is spent."""
+        for index, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            if self.restarts >= self.max_restarts:
+                raise RuntimeError(
+                    f"Shard {process.name} exited (code {process.exitcode}) after "
+                    f"{self.restarts} restarts"
+                )
+            self.restarts += 1
+            logger.error(f"Shard {process.name} exited (code {process.exitcode}), restarting")
+            self._processes[index] = self._spawn(index, self._queues[index])
+
+    async def route(self, update: Update) -> None:
+        """Hand an update to the worker that owns its user."""
+        user = update.effective_user
+        shard_queue = self._queues[shard_for(user.id if user else None, self.shards)]
+        data = update.to_json()
+        try:
+            shard_queue.put_nowait(data)
+        except queue.Full:
+            # Back-pressure: wait for the shard without blocking the loop
+            await asyncio.get_running_loop().run_in_executor(None, shard_queue.put, data)
+
+    def _spawn(self, index: int, shard_queue):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, shard_queue, self.build),
+            name=f"shard-{index}",
+        )
+        process.start()
+        return process
+
+    def stop(self, timeout: float = 60.0) -> None:
+        """Ask every worker to finish its updates and exit."""
+        for shard_queue in self._queues:
+            shard_queue.put(_STOP)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Shard {process.name} did not stop, terminating")
+                process.terminate()
+        self._queues.clear()
+        self._processes.clear()
+
+
+def _worker_main(index: int, shard_queue, build) -> None:
+    """Entry point of a shard worker process."""
+    # Ctrl-C reaches the whole process group; the dispatcher coordinates
+    # shutdown through the queue instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        format=f"%(asctime)s - shard-{index} - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(_serve_worker(shard_queue, build, index))
+
+
+async def _serve_worker(shard_queue, build, index: int = 0) -> None:
+    application = build(Application.builder().updater(None))
+    # Lets post_init run once-per-bot work (e.g. maintenance) in one shard
+    application.bot_data["shard"] = index
+    loop = asyncio.get_running_loop()
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, shard_queue.get)
+                if data is _STOP:
+                    break
+                update = Update.de_json(json.loads(data), application.bot)
+                await application.update_queue.put(update)
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+async def run_dispatcher(
+    token: str,
+    pool: ShardPool,
+    webhook_options: dict | None = None,
+    allowed_updates: list[str] | None = None,
+) -> None:
+    """Fetch updates (polling or webhook) and route them to the shards.
+
+    Runs until SIGINT or SIGTERM, or until a worker keeps dying (see
+    ``ShardPool.check``).
+    """
+    update_queue: asyncio.Queue = asyncio.Queue()
+    updater = Updater(Bot(token), update_queue)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    pool.start()
+    try:
+        async with updater:
+            if webhook_options:
+                await updater.start_webhook(
+                    allowed_updates=allowed_updates, **webhook_options
+                )
+            else:
+                await updater.start_polling(allowed_updates=allowed_updates)
+
+            stopped = asyncio.create_task(stop.wait())
+            next_update = None
+            while not stop.is_set():
+                if next_update is None:
+                    next_update = asyncio.create_task(update_queue.get())
+                done, _ = await asyncio.wait(
+                    {next_update, stopped},
+                    timeout=_HEALTH_CHECK_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                pool.check()
+                if next_update in done:
+                    await pool.route(next_update.result())
+                    next_update = None
+            if next_update is not None:
+                next_update.cancel()
+            await updater.stop()
+
+            # Route whatever was fetched before the updater stopped
+            while not update_queue.empty():
+                await pool.route(update_queue.get_nowait())
+    finally:
+        await loop.run_in_executor(None, pool.stop)
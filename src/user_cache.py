@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+
+from src.config import settings
+
+
+class CachedUser(NamedTuple):
+    user_id: int
+    # End of the latest active subscription, None for free users
+    premium_until: datetime | None
+
+    def is_premium(self) -> bool:
+        return self.premium_until is not None and self.premium_until > datetime.now()
+
+
+class UserCache:
+    """Bounded LRU + TTL cache of ``telegram_id -> CachedUser``.
+
+    Saves the user lookup and the subscription query on the hot path.
+    Concurrent misses for the same user share one load. ``premium_until``
+    is compared with the clock on every read, so an expiring subscription
+    takes effect without waiting for the TTL; new payments must call
+    ``invalidate``. That only reaches this process, so a free entry may
+    be stale: ``start_download`` re-checks the plan before refusing.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[int, tuple[float, CachedUser]] = OrderedDict()
+        self._loading: dict[int, asyncio.Future] = {}
+        # Bumped by invalidate() so loads that started before it don't store
+        self._epoch = 0
+
+    async def get(self, telegram_id: int, load) -> CachedUser:
+        """Return the cached entry, or await ``load()`` and cache its result."""
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return value
+            del self._entries[telegram_id]
+        self.misses += 1
+
+        pending = self._loading.get(telegram_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        epoch = self._epoch
+        task = asyncio.ensure_future(load())
+        self._loading[telegram_id] = task
+        try:
+            value = await asyncio.shield(task)
+        finally:
+            if self._loading.get(telegram_id) is task:
+                del self._loading[telegram_id]
+        if epoch == self._epoch:
+            self._store(telegram_id, value)
+        return value
+
+    def invalidate(self, telegram_id: int) -> None:
+        """Drop a user's entry (e.g. after a payment changed their plan)."""
+        self._epoch += 1
+        self.invalidations += 1
+        self._entries.pop(telegram_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _store(self, telegram_id: int, value: CachedUser) -> None:
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        self._entries[telegram_id] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
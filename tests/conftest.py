@@ -63,6 +63,7 @@ def mock_update_factory():
             effective_chat=chat,
             message=message,
             pre_checkout_query=None,
+            to_json=lambda: "{}",
         )
 
     return _make_update
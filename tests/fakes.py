@@ -0,0 +1,597 @@
+"""Local stand-ins for the services the bot talks to, shared by the tests
+and the benchmarks, so neither needs network access.
+
+``FakeTelegramServer`` answers the Telegram Bot API over HTTP, and
+``FakeBotRequest`` plugs into PTB as an in-process request backend.
+
+``MediaServer`` runs the real downloader offline. It serves the same video
+three ways, as yt-dlp's generic extractor finds them:
+
+- ``/progressive.mp4``: one file with audio and video (Range requests work,
+  so interrupted downloads can resume)
+- ``/hls/master.m3u8``: an HLS master playlist with a muxed variant, and a
+  video-only variant with a separate audio rendition, all in segments
+- ``/dash/manifest.mpd``: a DASH manifest with separate video and audio
+  adaptation sets, each split into segments
+
+Payloads are real media when built with ffmpeg (``MediaFiles.generate``),
+otherwise deterministic filler bytes of the requested size, which is
+enough to exercise fetching but not merging.
+
+Faults are injected per request: ``bandwidth`` throttles every response
+(bytes/s), ``throttle_share`` of requests get a 429, and ``drop_share`` of
+media responses are cut off halfway through.
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from telegram.request import BaseRequest
+
+BOT_USER = {
+    "id": 123456,
+    "is_bot": True,
+    "first_name": "Bench",
+    "username": "bench_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+# Methods that answer with a Message object
+_MESSAGE_METHODS = {"sendMessage", "sendVideo", "editMessageText", "sendInvoice"}
+
+
+class FakeTelegramServer:
+    """Minimal stand-in for the Telegram Bot API, for tests and benchmarks.
+
+    Answers getMe/setWebhook/getUpdates and records every outgoing call.
+    Point the bot at it with ``Application.builder().base_url(server.base_url)``.
+    ``on_call(method, params)`` is invoked from the server thread for every
+    call other than getUpdates.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, on_call=None):
+        self.on_call = on_call
+        self.calls: list[tuple[float, str, dict]] = []
+        self._updates: list[dict] = []
+        self._cond = threading.Condition()
+        self._message_id = 0
+        self._closed = False
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self) -> "FakeTelegramServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def push_update(self, update: dict) -> None:
+        """Queue an update for the next getUpdates long poll."""
+        with self._cond:
+            self._updates.append(update)
+            self._cond.notify_all()
+
+    def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        with self._cond:
+            while True:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+                if self._updates:
+                    batch = self._updates[: int(params.get("limit") or 100)]
+                    return batch
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    return []
+                self._cond.wait(remaining)
+
+    def _answer(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return self._get_updates(params)
+
+        self.calls.append((time.perf_counter(), method, params))
+        if self.on_call is not None:
+            self.on_call(method, params)
+        if method in _MESSAGE_METHODS:
+            with self._cond:
+                self._message_id += 1
+                message_id = self._message_id
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *_args):
+                pass
+
+            def do_GET(self):
+                self._handle(b"")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self._handle(self.rfile.read(length))
+
+            def _handle(self, body: bytes):
+                url = urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                content_type = self.headers.get("Content-Type", "")
+                if body and content_type.startswith("application/json"):
+                    params.update(json.loads(body))
+                elif body and content_type.startswith("application/x-www-form-urlencoded"):
+                    params.update(
+                        {k: v[-1] for k, v in parse_qs(body.decode()).items()}
+                    )
+
+                payload = json.dumps({"ok": True, "result": server._answer(method, params)})
+                data = payload.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def _decode(value: str):
+    """PTB sends strings as-is and everything else JSON-encoded."""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class FakeBotRequest(BaseRequest):
+    """In-process stand-in for the Bot API, plugged in as PTB's request backend.
+
+    Use it with ``Application.builder().request(fake).get_updates_request(fake)``:
+    the bot serializes every call as usual but nothing goes over the
+    network. Uploading a file to sendVideo takes ``upload_latency`` seconds
+    plus its size over ``upload_mbps``; re-sends by file_id only the
+    latency. ``on_call(method, params)`` is invoked for every call.
+    """
+
+    def __init__(self, upload_latency: float = 0.0, upload_mbps: float = 0.0, on_call=None):
+        self.upload_latency = upload_latency
+        self.upload_mbps = upload_mbps
+        self.on_call = on_call
+        self.calls: dict[str, int] = {}
+        self.uploaded_bytes = 0
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, **_timeouts):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = {}
+        if request_data is not None:
+            params = {k: _decode(v) for k, v in request_data.json_parameters.items()}
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+        if endpoint == "sendVideo":
+            size = 0
+            if request_data is not None and request_data.contains_files:
+                size = sum(len(part[1]) for part in request_data.multipart_data.values())
+                self.uploaded_bytes += size
+            delay = self.upload_latency
+            if self.upload_mbps:
+                delay += size * 8 / (self.upload_mbps * 1_000_000)
+            await asyncio.sleep(delay)
+
+        if self.on_call is not None:
+            self.on_call(endpoint, params)
+        payload = {"ok": True, "result": self._answer(endpoint, params)}
+        return 200, json.dumps(payload).encode()
+
+    def _answer(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method not in _MESSAGE_METHODS:
+            return True
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+            "text": params.get("text", ""),
+        }
+        if method == "sendVideo":
+            message["video"] = {
+                "file_id": f"F{self._message_id}",
+                "file_unique_id": f"U{self._message_id}",
+                "width": 1280,
+                "height": 720,
+                "duration": 30,
+            }
+        return message
+
+
+# Media server
+
+CHUNK = 64 * 1024
+
+
+@dataclass
+class MediaFiles:
+    """The bytes behind the three layouts."""
+
+    progressive: bytes
+    muxed_segments: list[bytes]
+    video_segments: list[bytes]
+    audio_segments: list[bytes]
+    segment_seconds: float
+    real: bool
+    # Files of an ffmpeg-made DASH presentation (real media only)
+    dash: dict[str, bytes] | None = None
+
+    @classmethod
+    def filler(cls, size: int, segments: int = 10, audio_share: float = 0.1) -> "MediaFiles":
+        """``size`` bytes of filler, split between video and audio segments."""
+        audio = int(size * audio_share)
+        video = size - audio
+        return cls(
+            progressive=_filler(size),
+            muxed_segments=[_filler(size // segments, i) for i in range(segments)],
+            video_segments=[_filler(video // segments, i) for i in range(segments)],
+            audio_segments=[_filler(audio // segments, i) for i in range(segments)],
+            segment_seconds=2.0,
+            real=False,
+        )
+
+    @classmethod
+    def generate(cls, seconds: int = 20, segments: int = 10, height: int = 720) -> "MediaFiles":
+        """Real H.264/AAC media from ffmpeg's test sources. HLS segments are
+        independently decodable MPEG-TS (muxed, video) and ADTS (audio)
+        chunks; DASH is ffmpeg's own fragmented-MP4 presentation."""
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg not found")
+        segment_seconds = seconds / segments
+        with tempfile.TemporaryDirectory(prefix="dl-video-media-") as tmp:
+            source = [
+                "-f", "lavfi", "-i", f"testsrc2=size={height * 16 // 9}x{height}:rate=30",
+                "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+                "-t", str(seconds),
+            ]
+            codecs = ["-c:v", "libx264", "-preset", "veryfast", "-g", "30", "-c:a", "aac"]
+            _run([ffmpeg, "-y", *source, *codecs, "-movflags", "+faststart", f"{tmp}/av.mp4"])
+            _run([
+                ffmpeg, "-y", "-i", f"{tmp}/av.mp4", "-map", "0", "-c", "copy",
+                "-f", "segment", "-segment_time", str(segment_seconds), f"{tmp}/m%03d.ts",
+            ])
+            _run([
+                ffmpeg, "-y", "-i", f"{tmp}/av.mp4", "-map", "0:v", "-c", "copy",
+                "-f", "segment", "-segment_time", str(segment_seconds), f"{tmp}/v%03d.ts",
+            ])
+            _run([
+                ffmpeg, "-y", "-i", f"{tmp}/av.mp4", "-map", "0:a", "-c", "copy",
+                "-f", "segment", "-segment_time", str(segment_seconds), f"{tmp}/a%03d.aac",
+            ])
+            os.mkdir(f"{tmp}/dash")
+            _run([
+                ffmpeg, "-y", "-i", f"{tmp}/av.mp4", "-map", "0:v", "-map", "0:a",
+                "-c", "copy", "-f", "dash", "-seg_duration", str(segment_seconds),
+                "-use_template", "1", "-use_timeline", "0",
+                "-adaptation_sets", "id=0,streams=v id=1,streams=a",
+                f"{tmp}/dash/manifest.mpd",
+            ])
+            names = sorted(os.listdir(tmp))
+            return cls(
+                progressive=_read(f"{tmp}/av.mp4"),
+                muxed_segments=[_read(f"{tmp}/{n}") for n in names if n.startswith("m")],
+                video_segments=[_read(f"{tmp}/{n}") for n in names if n.startswith("v")],
+                audio_segments=[_read(f"{tmp}/{n}") for n in names if n.startswith("a")],
+                segment_seconds=segment_seconds,
+                real=True,
+                dash={n: _read(f"{tmp}/dash/{n}") for n in os.listdir(f"{tmp}/dash")},
+            )
+
+
+def _filler(size: int, seed: int = 0) -> bytes:
+    block = random.Random(seed).randbytes(min(size, CHUNK))
+    return (block * (size // len(block) + 1))[:size] if block else b""
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as fp:
+        return fp.read()
+
+
+def _run(command: list[str]) -> None:
+    subprocess.run(command, check=True, capture_output=True)
+
+
+class MediaServer:
+    """Threaded HTTP server for ``MediaFiles`` with fault injection.
+
+    ``stats`` counts requests, 429s, dropped responses, bytes sent and the
+    peak number of requests served at once (fragment concurrency).
+    """
+
+    def __init__(
+        self,
+        media: MediaFiles,
+        bandwidth: int = 0,
+        throttle_share: float = 0.0,
+        drop_share: float = 0.0,
+        seed: int = 1,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.media = media
+        self.bandwidth = bandwidth
+        self.throttle_share = throttle_share
+        self.drop_share = drop_share
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._active = 0
+        self.stats = {}
+        self.reset_stats()
+        self._routes = self._build_routes()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, layout: str) -> str:
+        """URL of ``progressive``, ``hls`` or ``dash``."""
+        paths = {
+            "progressive": "/progressive.mp4",
+            "hls": "/hls/master.m3u8",
+            "dash": "/dash/manifest.mpd",
+        }
+        return self.base_url + paths[layout]
+
+    def start(self) -> "MediaServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = {
+                "requests": 0,
+                "throttled": 0,
+                "dropped": 0,
+                "bytes_sent": 0,
+                "max_concurrent": 0,
+            }
+
+    def _build_routes(self) -> dict[str, tuple[str, bytes]]:
+        media = self.media
+        routes = {"/progressive.mp4": ("video/mp4", media.progressive)}
+        audio_ext, audio_mime = (".aac", "audio/aac") if media.real else (".ts", "video/mp2t")
+        for kind, segments, ext, mime in (
+            ("muxed", media.muxed_segments, ".ts", "video/mp2t"),
+            ("video", media.video_segments, ".ts", "video/mp2t"),
+            ("audio", media.audio_segments, audio_ext, audio_mime),
+        ):
+            for i, data in enumerate(segments):
+                routes[f"/hls/{kind}/{i}{ext}"] = (mime, data)
+                if kind != "muxed" and media.dash is None:
+                    routes[f"/dash/{kind}/{i}.m4s"] = (mime, data)
+            routes[f"/hls/{kind}.m3u8"] = (
+                "application/vnd.apple.mpegurl",
+                _media_playlist(kind, len(segments), ext, media.segment_seconds).encode(),
+            )
+        routes["/hls/master.m3u8"] = ("application/vnd.apple.mpegurl", _master_playlist(media))
+        if media.dash is None:
+            routes["/dash/manifest.mpd"] = ("application/dash+xml", _dash_manifest(media))
+        else:
+            for name, data in media.dash.items():
+                mime = "application/dash+xml" if name.endswith(".mpd") else "video/mp4"
+                routes[f"/dash/{name}"] = (mime, data)
+        return routes
+
+    def _roll(self, share: float) -> bool:
+        with self._lock:
+            return share > 0 and self._rng.random() < share
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_args):
+                pass
+
+            def do_HEAD(self):
+                self._serve(body=False)
+
+            def do_GET(self):
+                self._serve(body=True)
+
+            def _serve(self, body: bool):
+                with server._lock:
+                    server.stats["requests"] += 1
+                    server._active += 1
+                    server.stats["max_concurrent"] = max(
+                        server.stats["max_concurrent"], server._active
+                    )
+                try:
+                    self._respond(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with server._lock:
+                        server._active -= 1
+
+            def _respond(self, body: bool):
+                route = server._routes.get(self.path.split("?")[0])
+                if route is None:
+                    self.send_error(404)
+                    return
+                if server._roll(server.throttle_share):
+                    server._count("throttled")
+                    self.send_response(429)
+                    self.send_header("Retry-After", "1")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                content_type, data = route
+                start, end = 0, len(data) - 1
+                status = 200
+                ranged = self.headers.get("Range", "")
+                if ranged.startswith("bytes="):
+                    first, _, last = ranged[len("bytes="):].partition("-")
+                    start = int(first or 0)
+                    end = min(int(last), end) if last else end
+                    status = 206
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                self.end_headers()
+                if not body:
+                    return
+
+                payload = memoryview(data)[start:end + 1]
+                if content_type.startswith(("video/", "audio/")) and server._roll(
+                    server.drop_share
+                ):
+                    # Send half, then drop the connection
+                    server._count("dropped")
+                    payload = payload[: len(payload) // 2]
+                    self.close_connection = True
+                    self._write(payload)
+                    self.connection.shutdown(2)
+                    return
+                self._write(payload)
+
+            def _write(self, payload: memoryview):
+                for offset in range(0, len(payload), CHUNK):
+                    chunk = payload[offset:offset + CHUNK]
+                    self.wfile.write(chunk)
+                    server._count("bytes_sent", len(chunk))
+                    if server.bandwidth:
+                        time.sleep(len(chunk) / server.bandwidth)
+
+        return Handler
+
+
+def _media_playlist(kind: str, segments: int, ext: str, seconds: float) -> str:
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{int(seconds + 0.999)}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for i in range(segments):
+        lines += [f"#EXTINF:{seconds:.3f},", f"{kind}/{i}{ext}"]
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def _bandwidth(segments: list[bytes], seconds: float) -> int:
+    """Average bits/s of a track."""
+    return int(sum(len(s) for s in segments) * 8 / (len(segments) * seconds)) or 1
+
+
+def _master_playlist(media: MediaFiles) -> bytes:
+    muxed = _bandwidth(media.muxed_segments, media.segment_seconds)
+    video = _bandwidth(media.video_segments, media.segment_seconds)
+    audio = _bandwidth(media.audio_segments, media.segment_seconds)
+    return (
+        "#EXTM3U\n"
+        "#EXT-X-VERSION:3\n"
+        '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="English",LANGUAGE="en",'
+        'DEFAULT=YES,AUTOSELECT=YES,URI="audio.m3u8"\n'
+        f'#EXT-X-STREAM-INF:BANDWIDTH={video + audio},RESOLUTION=1280x720,'
+        f'CODECS="avc1.64001f,mp4a.40.2",AUDIO="aud"\n'
+        "video.m3u8\n"
+        f'#EXT-X-STREAM-INF:BANDWIDTH={muxed},RESOLUTION=1280x720,'
+        f'CODECS="avc1.64001f,mp4a.40.2"\n'
+        "muxed.m3u8\n"
+    ).encode()
+
+
+def _dash_manifest(media: MediaFiles) -> bytes:
+    duration = media.segment_seconds * len(media.video_segments)
+    scale = 1000
+    segment = int(media.segment_seconds * scale)
+
+    def adaptation(kind, mime, codecs, segments, extra):
+        return (
+            f'    <AdaptationSet mimeType="{mime}" segmentAlignment="true">\n'
+            f'      <Representation id="{kind}" codecs="{codecs}" '
+            f'bandwidth="{_bandwidth(segments, media.segment_seconds)}" {extra}>\n'
+            f'        <SegmentTemplate media="{kind}/$Number$.m4s" startNumber="0" '
+            f'timescale="{scale}" duration="{segment}"/>\n'
+            f"      </Representation>\n"
+            f"    </AdaptationSet>\n"
+        )
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" '
+        f'mediaPresentationDuration="PT{duration:.3f}S" minBufferTime="PT2S" '
+        'profiles="urn:mpeg:dash:profile:isoff-on-demand:2011">\n'
+        "  <Period>\n"
+        + adaptation(
+            "video", "video/mp4", "avc1.64001f", media.video_segments,
+            'width="1280" height="720" frameRate="30"',
+        )
+        + adaptation("audio", "audio/mp4", "mp4a.40.2", media.audio_segments,
+                     'audioSamplingRate="44100"')
+        + "  </Period>\n"
+        "</MPD>\n"
+    ).encode()
@@ -0,0 +1,110 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+from sqlalchemy.exc import OperationalError
+
+import src.batcher as batcher_module
+from src.batcher import WriteBehindBatcher
+
+
+def _batcher(flush, max_batch=3, max_delay=0.05, max_pending=100):
+    return WriteBehindBatcher("test", flush, max_batch, max_delay, max_pending)
+
+
+async def test_flushes_after_delay():
+    flush = AsyncMock()
+    batcher = _batcher(flush)
+    batcher.start()
+
+    await batcher.submit("a")
+    await batcher.submit("b")
+    assert flush.await_count == 0
+    await asyncio.sleep(0.15)
+
+    flush.assert_awaited_once_with(["a", "b"])
+    await batcher.stop()
+
+
+async def test_full_batch_flushes_without_waiting_for_delay():
+    flush = AsyncMock()
+    batcher = _batcher(flush, max_batch=2, max_delay=10)
+    batcher.start()
+
+    await batcher.submit("a")
+    await batcher.submit("b")
+    await asyncio.sleep(0.01)
+
+    flush.assert_awaited_once_with(["a", "b"])
+    await batcher.stop()
+
+
+async def test_keyed_items_coalesce_to_latest():
+    flush = AsyncMock()
+    batcher = _batcher(flush, max_batch=10)
+
+    await batcher.submit({"v": 1}, key=7)
+    await batcher.submit("other")
+    await batcher.submit({"v": 2}, key=7)
+    await batcher.stop()
+
+    flush.assert_awaited_once_with(["other", {"v": 2}])
+
+
+async def test_submit_flushes_when_pending_is_full():
+    flush = AsyncMock()
+    batcher = _batcher(flush, max_batch=10, max_pending=2)
+
+    for item in "abc":
+        await batcher.submit(item)
+
+    flush.assert_awaited_once_with(["a", "b"])
+    assert batcher.pending() == 1
+
+
+async def test_stats_track_batches_and_failures():
+    flush = AsyncMock(side_effect=[None, RuntimeError("locked")])
+    batcher = _batcher(flush, max_batch=2)
+
+    for item in "abcd":
+        await batcher.submit(item)
+    await batcher.flush()
+    stats = batcher.stats()
+
+    assert stats["flushes"] == 1
+    assert stats["flushed_items"] == 2
+    assert stats["failed_items"] == 2
+    assert stats["max_batch_size"] == 2
+    assert stats["batch_sizes"] == {"le_1": 0, "le_10": 1, "le_100": 0, "le_1000": 0, "le_inf": 0}
+    assert stats["pending"] == 0
+
+
+async def test_locked_batch_is_retried_not_dropped():
+    locked = OperationalError("INSERT", {}, Exception("database is locked"))
+    flush = AsyncMock(side_effect=[locked, None])
+    batcher = _batcher(flush, max_batch=2)
+
+    await batcher.submit({"release": 7}, key=("release", 7))
+    await batcher.submit("record")
+    await batcher.flush()
+
+    assert flush.await_count == 2
+    assert flush.await_args.args[0] == [{"release": 7}, "record"]
+    assert batcher.stats()["failed_items"] == 0
+    assert batcher.stats()["flushed_items"] == 2
+
+
+async def test_download_events_flush_grouped_by_kind(monkeypatch):
+    finish = AsyncMock()
+    monkeypatch.setattr(batcher_module, "finish_downloads", finish)
+    record = {"user_id": 1, "tweet_url": "u", "created_at": None}
+    video = {"tweet_id": "5", "file_id": "F", "file_unique_id": None, "file_size": None}
+
+    await batcher_module._flush_downloads(
+        [("release", 7), ("record", record), ("video", video), ("release", 8)]
+    )
+
+    assert finish.await_args.kwargs == {
+        "records": [record],
+        "released_ids": [7, 8],
+        "videos": [video],
+    }
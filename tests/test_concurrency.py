@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+
+import pytest
+from yt_dlp.utils import DownloadError
+
+import src.concurrency as concurrency
+from src.concurrency import AdaptiveConcurrency, is_throttled
+from src.downloader import FileTooLargeError
+from src.metrics import CONCURRENCY_CHANGES
+from src.scheduler import FREE, PREMIUM, PriorityScheduler
+
+
+_adaptive = functools.partial(
+    AdaptiveConcurrency,
+    min_limit=1,
+    max_limit=10,
+    target_latency=10.0,
+    max_error_rate=0.2,
+    max_throttle_rate=0.05,
+    min_free_bytes=0,
+    min_samples=5,
+)
+
+
+def _controller(limit=8, **overrides):
+    return _adaptive(PriorityScheduler(limit, reserved={PREMIUM: 1, FREE: 1}), **overrides)
+
+
+def _downloads(controller, count, error=None, seconds=0.0):
+    for _ in range(count):
+        with pytest.raises(type(error)) if error is not None else nullcontext():
+            with controller.track():
+                time.sleep(seconds)
+                if error is not None:
+                    raise error
+
+
+async def _saturate(scheduler) -> asyncio.Task:
+    """Take every slot and leave one request waiting for another."""
+    await scheduler.acquire(PREMIUM)
+    for _ in range(scheduler.limit - 1):
+        await scheduler.acquire(FREE)
+    waiter = asyncio.create_task(scheduler.acquire(FREE))
+    await asyncio.sleep(0)
+    return waiter
+
+
+def test_is_throttled_matches_429s():
+    assert is_throttled(DownloadError("ERROR: HTTP Error 429: Too Many Requests"))
+    assert not is_throttled(DownloadError("ERROR: HTTP Error 404: Not Found"))
+
+
+def test_min_limit_keeps_reserved_slots_and_a_shared_one():
+    controller = _controller(limit=1, min_limit=1, max_limit=5)
+
+    assert controller.min_limit == 3
+    assert controller.scheduler.limit == 3
+
+
+@pytest.mark.asyncio
+async def test_grows_by_one_only_while_downloads_wait():
+    controller = _controller()
+    _downloads(controller, 10)
+
+    assert controller.adjust() == 8
+
+    waiter = await _saturate(controller.scheduler)
+    before = CONCURRENCY_CHANGES.labels("up", "saturated").get()
+
+    assert controller.adjust() == 9
+    assert CONCURRENCY_CHANGES.labels("up", "saturated").get() == before + 1
+    await waiter
+
+
+@pytest.mark.asyncio
+async def test_growth_stops_at_max_limit():
+    controller = _controller(limit=10)
+    waiter = await _saturate(controller.scheduler)
+
+    assert controller.adjust() == 10
+    waiter.cancel()
+
+
+def test_throttling_halves_the_limit():
+    controller = _controller()
+    _downloads(controller, 9)
+    _downloads(controller, 1, DownloadError("ERROR: HTTP Error 429: Too Many Requests"))
+    before = CONCURRENCY_CHANGES.labels("down", "throttled").get()
+
+    assert controller.adjust() == 4
+    assert controller.last_window["throttle_rate"] == 0.1
+    assert CONCURRENCY_CHANGES.labels("down", "throttled").get() == before + 1
+
+
+def test_errors_halve_the_limit_down_to_min():
+    controller = _controller(limit=5, min_limit=3)
+    _downloads(controller, 3)
+    _downloads(controller, 2, DownloadError("ERROR: Unsupported URL"))
+
+    assert controller.adjust() == 3
+    _downloads(controller, 5, DownloadError("ERROR: Unsupported URL"))
+    assert controller.adjust() == 3
+
+
+def test_too_large_files_count_as_successful_downloads():
+    controller = _controller()
+    _downloads(controller, 5, FileTooLargeError(60 * 1024 * 1024))
+
+    assert controller.adjust() == 8
+    assert controller.last_window["error_rate"] == 0.0
+
+
+def test_slow_median_halves_the_limit():
+    controller = _controller(target_latency=0.001)
+    _downloads(controller, 5, seconds=0.005)
+
+    assert controller.adjust() == 4
+
+
+def test_few_samples_are_not_judged():
+    controller = _controller()
+    _downloads(controller, 1, DownloadError("ERROR: HTTP Error 429: Too Many Requests"))
+
+    assert controller.adjust() == 8
+
+
+def test_low_free_disk_halves_the_limit(monkeypatch):
+    usage = namedtuple("usage", "total used free")
+    monkeypatch.setattr(
+        concurrency.shutil, "disk_usage", lambda path: usage(100, 99, 1024 * 1024)
+    )
+    controller = _controller(min_free_bytes=1024 * 1024 * 1024)
+
+    assert controller.adjust() == 4
+    assert controller.last_window["free_mb"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shrinking_leaves_running_downloads_alone():
+    controller = _controller(limit=6, target_latency=0.001)
+    waiter = await _saturate(controller.scheduler)
+    _downloads(controller, 5, seconds=0.005)
+
+    assert controller.adjust() == 3
+    assert controller.scheduler.stats()[FREE]["running"] == 5
+    controller.scheduler.release(FREE)
+    controller.scheduler.release(FREE)
+    await asyncio.sleep(0)
+    # 4 running against a limit of 3: the waiter stays queued
+    assert controller.scheduler.stats()[FREE]["queued"] == 1
+
+    controller.scheduler.release(FREE)
+    controller.scheduler.release(FREE)
+    await waiter
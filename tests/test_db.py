@@ -1,18 +1,47 @@
+import asyncio
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 
 import pytest
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from src.db import (
+    _MIGRATIONS,
+    apply_pragmas,
+    claim_jobs,
     count_downloads_today,
     create_subscription,
     delete_download,
-    get_active_subscription,
+    enqueue_job,
+    finish_downloads,
+    finish_job,
+    get_cached_video,
     get_or_create_user,
+    get_premium_until,
     has_active_subscription,
+    incremental_vacuum,
+    invalidate_cached_video,
+    load_user,
+    migrate,
     record_download,
+    requeue_jobs,
     reserve_download,
+    save_cached_video,
+    start_download,
+    update_user_profiles,
+)
+from src.models import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    Base,
+    DailyUsage,
+    Download,
+    Job,
+    Subscription,
 )
-from src.models import Download, Subscription
 
 
 @pytest.mark.asyncio
@@ -47,6 +76,55 @@ async def test_get_or_create_user_updates_existing_user(db_session):
     assert second.language_code == "en"
 
 
+@pytest.mark.asyncio
+async def test_get_or_create_user_keeps_fields_passed_as_none(db_session):
+    await get_or_create_user(
+        db_session, telegram_id=1014, username="u14", full_name="Full", language_code="es"
+    )
+
+    user = await get_or_create_user(db_session, telegram_id=1014)
+
+    assert (user.username, user.full_name, user.language_code) == ("u14", "Full", "es")
+
+
+async def _total_changes(session) -> int:
+    return (await session.execute(text("SELECT total_changes()"))).scalar()
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_user_skips_write_when_profile_unchanged(db_session):
+    await get_or_create_user(db_session, telegram_id=1015, username="u15", full_name="Full")
+    before = await _total_changes(db_session)
+
+    await get_or_create_user(db_session, telegram_id=1015, username="u15", full_name="Full")
+    await get_or_create_user(db_session, telegram_id=1015, username="u15")
+    unchanged = await _total_changes(db_session)
+    await get_or_create_user(db_session, telegram_id=1015, username="renamed")
+
+    assert unchanged == before
+    assert await _total_changes(db_session) == before + 1
+
+
+@pytest.mark.asyncio
+async def test_update_user_profiles_upserts_in_one_batch(db_session):
+    await get_or_create_user(db_session, telegram_id=1016, username="old", full_name="Keep")
+
+    await update_user_profiles(
+        db_session,
+        [
+            {"telegram_id": 1016, "username": "new", "full_name": None, "language_code": "en"},
+            {"telegram_id": 1017, "username": "fresh", "full_name": "F", "language_code": None},
+        ],
+    )
+
+    updated = await get_or_create_user(db_session, telegram_id=1016)
+    created = await get_or_create_user(db_session, telegram_id=1017)
+    assert (updated.username, updated.full_name, updated.language_code) == ("new", "Keep", "en")
+    assert (created.username, created.full_name) == ("fresh", "F")
+    # Local time, like every other timestamp (SQLite's now() is UTC)
+    assert abs(created.created_at - datetime.now()) < timedelta(minutes=1)
+
+
 @pytest.mark.asyncio
 async def test_count_downloads_today_returns_zero_without_downloads(db_session):
     user = await get_or_create_user(db_session, telegram_id=1003, username="u3")
@@ -59,19 +137,155 @@ async def test_count_downloads_today_returns_zero_without_downloads(db_session):
 @pytest.mark.asyncio
 async def test_count_downloads_today_counts_only_today(db_session):
     user = await get_or_create_user(db_session, telegram_id=1004, username="u4")
-    today_download = Download(user_id=user.id, tweet_url="https://x.com/i/status/1")
-    yesterday_download = Download(
-        user_id=user.id,
-        tweet_url="https://x.com/i/status/2",
-        created_at=datetime.now() - timedelta(days=1),
-    )
-    db_session.add(today_download)
-    db_session.add(yesterday_download)
+    today = datetime.now().date()
+    db_session.add(DailyUsage(user_id=user.id, day=today, count=2))
+    db_session.add(DailyUsage(user_id=user.id, day=today - timedelta(days=1), count=5))
     await db_session.commit()
 
     count = await count_downloads_today(db_session, user.id)
 
-    assert count == 1
+    assert count == 2
+
+
+@pytest.mark.asyncio
+async def test_reserve_and_record_download_update_daily_usage(db_session):
+    user = await get_or_create_user(db_session, telegram_id=1010, username="u10")
+
+    await reserve_download(db_session, user.id, "https://x.com/i/status/1", 3)
+    await record_download(db_session, user.id, "https://x.com/i/status/2")
+
+    usage = await db_session.get(DailyUsage, (user.id, datetime.now().date()))
+    assert usage.count == 2
+
+
+@pytest.mark.asyncio
+async def test_reserve_download_with_zero_limit_reserves_nothing(db_session):
+    user = await get_or_create_user(db_session, telegram_id=1011, username="u11")
+
+    assert await reserve_download(db_session, user.id, "https://x.com/i/status/1", 0) is None
+    assert await count_downloads_today(db_session, user.id) == 0
+
+
+@pytest.mark.asyncio
+async def test_apply_pragmas_tunes_every_pooled_connection(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'pragmas.db'}"
+    writer = create_async_engine(url, pool_size=2)
+    reader = create_async_engine(url, pool_size=2)
+    apply_pragmas(writer, {"synchronous": "NORMAL", "cache_size": -4096})
+    apply_pragmas(reader, {"temp_store": "MEMORY"}, query_only=True)
+    async with writer.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # Two connections checked out at once: both were configured
+    async with writer.connect() as first, writer.connect() as second:
+        for conn in (first, second):
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1
+            assert (await conn.execute(text("PRAGMA cache_size"))).scalar() == -4096
+    async with reader.connect() as conn:
+        assert (await conn.execute(text("PRAGMA temp_store"))).scalar() == 2
+        assert (await conn.execute(select(func.count()).select_from(Job))).scalar() == 0
+        with pytest.raises(OperationalError):
+            await conn.execute(text("DELETE FROM jobs"))
+    await writer.dispose()
+    await reader.dispose()
+
+
+@pytest.mark.asyncio
+async def test_incremental_vacuum_returns_free_pages(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'vacuum.db'}")
+    async with engine.begin() as conn:
+        await conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        await conn.run_sync(Base.metadata.create_all)
+        rows = [
+            {
+                "telegram_user_id": i,
+                "chat_id": i,
+                "tweet_url": f"https://x.com/i/status/{i}",
+                "tweet_id": str(i),
+                "payload": "x" * 2000,
+            }
+            for i in range(200)
+        ]
+        await conn.execute(insert(Job), rows)
+        await conn.execute(text("DELETE FROM jobs"))
+    session = async_sessionmaker(bind=engine)()
+
+    freed = await incremental_vacuum(session, 10)
+    freed += await incremental_vacuum(session, 10_000)
+
+    assert freed > 10
+    assert (await session.execute(text("PRAGMA freelist_count"))).scalar() == 0
+    await session.close()
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_migrate_adds_indexes_to_existing_database(db_engine):
+    async with db_engine.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_downloads_user_created"))
+        await conn.execute(text("DROP INDEX ix_subscriptions_user_expires"))
+        await conn.execute(text("DROP INDEX ix_downloads_created"))
+        await conn.execute(text("PRAGMA user_version = 0"))
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, telegram_id, is_bot, created_at) "
+                "VALUES (1, 1, 0, CURRENT_TIMESTAMP)"
+            )
+        )
+        for created_at in ("2026-01-01 10:00:00", "2026-01-01 23:00:00", "2026-01-02 01:00:00"):
+            await conn.execute(
+                text(
+                    "INSERT INTO downloads (user_id, tweet_url, created_at) "
+                    f"VALUES (1, 'https://x.com/i/status/1', '{created_at}')"
+                )
+            )
+
+        version = await conn.run_sync(migrate)
+        indexes = (
+            await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+        ).scalars().all()
+        usage = (
+            await conn.execute(text("SELECT day, count FROM daily_usage ORDER BY day"))
+        ).all()
+        # Running again on an up-to-date database is a no-op
+        assert await conn.run_sync(migrate) == version
+
+    assert version == len(_MIGRATIONS)
+    assert {
+        "ix_downloads_user_created",
+        "ix_subscriptions_user_expires",
+        "ix_downloads_created",
+    } <= set(indexes)
+    assert usage == [("2026-01-01", 2), ("2026-01-02", 1)]
+
+
+@pytest.mark.asyncio
+async def test_migrate_backfills_premium_until(db_engine):
+    async with db_engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE users DROP COLUMN premium_until"))
+        await conn.execute(text("PRAGMA user_version = 4"))
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, telegram_id, is_bot, created_at) "
+                "VALUES (1, 1, 0, CURRENT_TIMESTAMP), (2, 2, 0, CURRENT_TIMESTAMP)"
+            )
+        )
+        for days in (-20, 12):
+            await conn.execute(
+                insert(Subscription),
+                {
+                    "user_id": 1,
+                    "expires_at": datetime.now() + timedelta(days=days),
+                    "stars_paid": 250,
+                    "telegram_charge_id": f"c{days}",
+                },
+            )
+
+        await conn.run_sync(migrate)
+        rows = (await conn.execute(text("SELECT id, premium_until FROM users ORDER BY id"))).all()
+        latest = (await conn.execute(text("SELECT max(expires_at) FROM subscriptions"))).scalar()
+
+    assert rows == [(1, latest), (2, None)]
 
 
 @pytest.mark.asyncio
@@ -88,8 +302,7 @@ async def test_reserve_download_creates_record_when_under_limit(db_session):
 async def test_reserve_download_returns_none_when_limit_reached(db_session):
     user = await get_or_create_user(db_session, telegram_id=1006, username="u6")
     for i in range(3):
-        db_session.add(Download(user_id=user.id, tweet_url=f"https://x.com/i/status/{i}"))
-    await db_session.commit()
+        await record_download(db_session, user.id, f"https://x.com/i/status/{i}")
 
     download = await reserve_download(db_session, user.id, "https://x.com/i/status/99", 3)
 
@@ -109,6 +322,36 @@ async def test_reserve_download_respects_limit_across_multiple_calls(db_session)
     assert third is None
 
 
+@pytest.mark.asyncio
+async def test_reserve_download_never_exceeds_limit_under_contention(tmp_path):
+    # Separate engines stand in for separate bot processes sharing the file
+    url = f"sqlite+aiosqlite:///{tmp_path / 'stress.db'}"
+    engines = [create_async_engine(url, connect_args={"timeout": 30}) for _ in range(4)]
+    async with engines[0].begin() as conn:
+        await conn.execute(text("PRAGMA journal_mode=WAL"))
+        await conn.run_sync(Base.metadata.create_all)
+    makers = [async_sessionmaker(bind=e, expire_on_commit=False) for e in engines]
+    async with makers[0]() as session:
+        user = await get_or_create_user(session, telegram_id=1012, username="u12")
+    limit = 25
+
+    async def reserve(i: int):
+        async with makers[i % len(makers)]() as session:
+            return await reserve_download(session, user.id, f"https://x.com/i/status/{i}", limit)
+
+    try:
+        results = await asyncio.gather(*(reserve(i) for i in range(300)))
+        async with makers[0]() as session:
+            used = await count_downloads_today(session, user.id)
+            rows = await session.scalar(select(func.count(Download.id)))
+    finally:
+        for e in engines:
+            await e.dispose()
+
+    assert sum(r is not None for r in results) == limit
+    assert used == rows == limit
+
+
 @pytest.mark.asyncio
 async def test_delete_download_removes_existing_record(db_session):
     user = await get_or_create_user(db_session, telegram_id=1008, username="u8")
@@ -125,6 +368,65 @@ async def test_delete_download_ignores_missing_id(db_session):
     await delete_download(db_session, 999999)
 
 
+@pytest.mark.asyncio
+async def test_get_premium_until_returns_latest_active_expiry(db_session):
+    user = await get_or_create_user(db_session, telegram_id=1013, username="u13")
+    assert await get_premium_until(db_session, user.id) is None
+
+    first = await create_subscription(db_session, user.id, 250, "c1", duration_days=10)
+    second = await create_subscription(db_session, user.id, 250, "c2", duration_days=30)
+
+    assert await get_premium_until(db_session, user.id) == second.expires_at
+    assert second.expires_at > first.expires_at
+
+
+@pytest.mark.asyncio
+async def test_create_subscription_renewal_extends_current_plan(db_session):
+    user = await get_or_create_user(db_session, telegram_id=1016, username="u16")
+
+    first = await create_subscription(db_session, user.id, 250, "c1", duration_days=30)
+    renewal = await create_subscription(db_session, user.id, 250, "c2", duration_days=30)
+
+    assert renewal.starts_at == first.expires_at
+    assert renewal.expires_at == first.expires_at + timedelta(days=30)
+    await db_session.refresh(user)
+    assert user.premium_until == renewal.expires_at
+
+
+@pytest.mark.asyncio
+async def test_create_subscription_after_expiry_starts_now(db_session):
+    user = await get_or_create_user(db_session, telegram_id=1017, username="u17")
+    user.premium_until = datetime.now() - timedelta(days=3)
+    await db_session.commit()
+
+    subscription = await create_subscription(db_session, user.id, 250, "c1", duration_days=30)
+
+    assert subscription.starts_at > datetime.now() - timedelta(minutes=1)
+    assert await get_premium_until(db_session, user.id) == subscription.expires_at
+
+
+@pytest.mark.asyncio
+async def test_create_subscription_rejects_unknown_user(db_session):
+    with pytest.raises(ValueError):
+        await create_subscription(db_session, 999_999, 250, "c1")
+
+
+@pytest.mark.asyncio
+async def test_create_subscription_gives_up_when_plan_keeps_changing(db_session, monkeypatch):
+    user = await get_or_create_user(db_session, telegram_id=1012, username="u12")
+    execute = db_session.execute
+
+    async def lose_every_race(stmt, *args, **kwargs):
+        if stmt.is_dml:
+            return SimpleNamespace(rowcount=0)
+        return await execute(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(db_session, "execute", lose_every_race)
+
+    with pytest.raises(RuntimeError):
+        await create_subscription(db_session, user.id, 250, "c1")
+
+
 @pytest.mark.asyncio
 async def test_has_active_subscription_false_without_subscription(db_session):
     user = await get_or_create_user(db_session, telegram_id=1009, username="u9")
@@ -162,51 +464,6 @@ async def test_has_active_subscription_false_with_expired_subscription(db_sessio
     assert await has_active_subscription(db_session, user.id) is False
 
 
-@pytest.mark.asyncio
-async def test_get_active_subscription_returns_latest_active(db_session):
-    user = await get_or_create_user(db_session, telegram_id=1012, username="u12")
-    older = Subscription(
-        user_id=user.id,
-        starts_at=datetime.now() - timedelta(days=5),
-        expires_at=datetime.now() + timedelta(days=2),
-        stars_paid=250,
-        telegram_charge_id="older",
-    )
-    newer = Subscription(
-        user_id=user.id,
-        starts_at=datetime.now() - timedelta(days=1),
-        expires_at=datetime.now() + timedelta(days=5),
-        stars_paid=250,
-        telegram_charge_id="newer",
-    )
-    db_session.add(older)
-    db_session.add(newer)
-    await db_session.commit()
-
-    active = await get_active_subscription(db_session, user.id)
-
-    assert active is not None
-    assert active.telegram_charge_id == "newer"
-
-
-@pytest.mark.asyncio
-async def test_get_active_subscription_returns_none_when_all_expired(db_session):
-    user = await get_or_create_user(db_session, telegram_id=1013, username="u13")
-    expired = Subscription(
-        user_id=user.id,
-        starts_at=datetime.now() - timedelta(days=10),
-        expires_at=datetime.now() - timedelta(days=2),
-        stars_paid=250,
-        telegram_charge_id="old",
-    )
-    db_session.add(expired)
-    await db_session.commit()
-
-    active = await get_active_subscription(db_session, user.id)
-
-    assert active is None
-
-
 @pytest.mark.asyncio
 async def test_create_subscription_sets_expected_fields(db_session):
     user = await get_or_create_user(db_session, telegram_id=1014, username="u14")
@@ -234,3 +491,207 @@ async def test_record_download_creates_download(db_session):
     assert download.id is not None
     assert download.user_id == user.id
     assert download.tweet_url == "https://x.com/i/status/999"
+
+
+@pytest.mark.asyncio
+async def test_save_cached_video_replaces_existing_file_id(db_session):
+    await save_cached_video(db_session, "123", file_id="first")
+    await save_cached_video(db_session, "123", file_id="second", file_size=10)
+
+    cached = await get_cached_video(db_session, "123")
+
+    assert cached.file_id == "second"
+    assert cached.file_size == 10
+
+
+@pytest.mark.asyncio
+async def test_invalidate_cached_video_keeps_newer_file_id(db_session):
+    await save_cached_video(db_session, "456", file_id="fresh")
+
+    await invalidate_cached_video(db_session, "456", "stale")
+    assert await get_cached_video(db_session, "456") is not None
+
+    await invalidate_cached_video(db_session, "456", "fresh")
+    assert await get_cached_video(db_session, "456") is None
+
+
+async def _enqueue(session, telegram_user_id, tweet_id="1"):
+    return await enqueue_job(
+        session,
+        telegram_user_id=telegram_user_id,
+        chat_id=telegram_user_id,
+        tweet_url=f"https://x.com/i/status/{tweet_id}",
+        tweet_id=tweet_id,
+        payload="{}",
+    )
+
+
+@pytest.mark.asyncio
+async def test_enqueue_job_allows_one_active_job_per_user(db_session):
+    first = await _enqueue(db_session, 2001)
+    first_id, first_state = first.id, first.state
+    second = await _enqueue(db_session, 2001, "2")
+    other_user = await _enqueue(db_session, 2002)
+
+    assert first_state == JOB_QUEUED
+    assert second is None
+    assert other_user is not None
+
+    await finish_job(db_session, first_id)
+    assert await _enqueue(db_session, 2001, "3") is not None
+
+
+@pytest.mark.asyncio
+async def test_claim_jobs_leases_oldest_first_once(db_session):
+    jobs = [await _enqueue(db_session, 2010 + i) for i in range(3)]
+
+    claimed = await claim_jobs(db_session, limit=2, lease_seconds=60)
+    rest = await claim_jobs(db_session, limit=5, lease_seconds=60)
+
+    assert [job.id for job in claimed] == [jobs[0].id, jobs[1].id]
+    assert all(job.state == JOB_RUNNING and job.attempts == 1 for job in claimed)
+    assert [job.id for job in rest] == [jobs[2].id]
+    assert await claim_jobs(db_session, limit=5, lease_seconds=60) == []
+
+
+@pytest.mark.asyncio
+async def test_requeue_jobs_recovers_expired_lease_and_releases_reservation(db_session):
+    user = await get_or_create_user(db_session, telegram_id=2020, username="u2020")
+    job = await _enqueue(db_session, 2020)
+    await claim_jobs(db_session, limit=1, lease_seconds=-1)
+    await start_download(
+        db_session, user.id, False, job.tweet_url, job.tweet_id, daily_limit=3, job_id=job.id
+    )
+
+    recovered = await requeue_jobs(db_session)
+
+    job = await db_session.get(Job, job.id, populate_existing=True)
+    assert recovered == 1
+    assert job.state == JOB_QUEUED
+    assert job.download_id is None
+    assert await count_downloads_today(db_session, user.id) == 0
+
+
+@pytest.mark.asyncio
+async def test_requeue_jobs_fails_jobs_out_of_attempts(db_session):
+    job = await _enqueue(db_session, 2030)
+    await claim_jobs(db_session, limit=1, lease_seconds=-1)
+
+    await requeue_jobs(db_session, max_attempts=1)
+
+    job = await db_session.get(Job, job.id, populate_existing=True)
+    assert job.state == JOB_FAILED
+
+
+@pytest.mark.asyncio
+async def test_requeue_jobs_by_id_ignores_live_lease(db_session):
+    job = await _enqueue(db_session, 2040)
+    await claim_jobs(db_session, limit=1, lease_seconds=60)
+
+    assert await requeue_jobs(db_session) == 0
+    assert await requeue_jobs(db_session, job_ids=[job.id]) == 1
+
+
+@pytest.mark.asyncio
+async def test_load_user_registers_user_with_premium_status(db_session):
+    user_id, premium_until = await load_user(db_session, telegram_id=3001, username="u3001")
+    await db_session.commit()
+    assert premium_until is None
+
+    subscription = await create_subscription(db_session, user_id, "charge-3001", 100, 30)
+
+    assert await load_user(db_session, telegram_id=3001) == (user_id, subscription.expires_at)
+
+
+@pytest.mark.asyncio
+async def test_start_download_reserves_links_job_and_finds_cached_video(db_session):
+    user = await get_or_create_user(db_session, telegram_id=3010, username="u3010")
+    job = await _enqueue(db_session, 3010, "77")
+    await save_cached_video(db_session, "77", file_id="FILE77")
+    before = await _total_changes(db_session)
+
+    started = await start_download(
+        db_session, user.id, False, job.tweet_url, "77", daily_limit=1, job_id=job.id
+    )
+
+    job = await db_session.get(Job, job.id, populate_existing=True)
+    assert started.limit_reached is False
+    assert started.cached.file_id == "FILE77"
+    assert job.download_id == started.download_id
+    assert await count_downloads_today(db_session, user.id) == 1
+    # Reservation, its daily_usage row and the job link; nothing else
+    assert await _total_changes(db_session) == before + 3
+
+    again = await start_download(db_session, user.id, False, job.tweet_url, "77", daily_limit=1)
+    assert again == (None, True, None, None)
+
+
+@pytest.mark.asyncio
+async def test_start_download_premium_user_reserves_nothing(db_session):
+    user = await get_or_create_user(db_session, telegram_id=3020, username="u3020")
+
+    started = await start_download(
+        db_session, user.id, True, "https://x.com/i/status/1", "1", daily_limit=0
+    )
+
+    assert started == (None, False, None, None)
+    assert await count_downloads_today(db_session, user.id) == 0
+
+
+@pytest.mark.asyncio
+async def test_start_download_rechecks_plan_before_refusing(db_session):
+    user = await get_or_create_user(db_session, telegram_id=3021, username="u3021")
+    subscription = await create_subscription(db_session, user.id, 250, "c3021")
+
+    # The caller's cached plan still says free, and the free limit is used up
+    started = await start_download(
+        db_session, user.id, False, "https://x.com/i/status/1", "1", daily_limit=0
+    )
+
+    assert started == (None, False, None, subscription.expires_at)
+
+
+@pytest.mark.asyncio
+async def test_finish_downloads_replaces_cached_file_id_and_records(db_session):
+    user = await get_or_create_user(db_session, telegram_id=3030, username="u3030")
+    await save_cached_video(db_session, "88", file_id="OLD")
+    url = "https://x.com/i/status/88"
+
+    await finish_downloads(
+        db_session,
+        records=[{"user_id": user.id, "tweet_url": url, "created_at": datetime.now()}],
+        videos=[{"tweet_id": "88", "file_id": "NEW", "file_unique_id": "U88", "file_size": 5}],
+    )
+    await finish_downloads(db_session)
+
+    cached = await get_cached_video(db_session, "88")
+    assert (cached.file_id, cached.file_unique_id, cached.file_size) == ("NEW", "U88", 5)
+    assert await count_downloads_today(db_session, user.id) == 1
+
+
+@pytest.mark.asyncio
+async def test_finish_downloads_applies_a_batch_in_one_commit(db_session):
+    user = await get_or_create_user(db_session, telegram_id=3040, username="u3040")
+    reservations = [
+        await reserve_download(db_session, user.id, f"https://x.com/i/status/{i}", 5)
+        for i in range(2)
+    ]
+    yesterday = datetime.now() - timedelta(days=1)
+
+    await finish_downloads(
+        db_session,
+        records=[
+            {"user_id": user.id, "tweet_url": "https://x.com/i/status/9", "created_at": yesterday},
+            {"user_id": user.id, "tweet_url": "https://x.com/i/status/8", "created_at": datetime.now()},
+        ],
+        released_ids=[r.id for r in reservations],
+        videos=[
+            {"tweet_id": "91", "file_id": "A", "file_unique_id": None, "file_size": None},
+            {"tweet_id": "92", "file_id": "B", "file_unique_id": "UB", "file_size": 2},
+        ],
+    )
+
+    assert await count_downloads_today(db_session, user.id) == 1
+    past = await db_session.get(DailyUsage, (user.id, yesterday.date()))
+    assert past.count == 1
+    assert (await get_cached_video(db_session, "92")).file_size == 2
@@ -0,0 +1,74 @@
+import os
+import time
+
+from src.disk_cache import STALE_TEMP_SECONDS, DiskCache
+
+
+def _publish(cache, key, size):
+    temp = cache.temp_path(key)
+    with open(temp, "wb") as fp:
+        fp.write(b"x" * size)
+    return cache.publish(key, temp)
+
+
+def _age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_get_returns_none_on_miss(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+
+    assert cache.get("https://x.com/i/status/1") is None
+    assert cache.misses == 1
+
+
+def test_publish_then_get_hits(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+
+    path = _publish(cache, "https://x.com/i/status/1", 10)
+
+    assert cache.get("https://x.com/i/status/1") == path
+    assert cache.hits == 1
+    assert [p.name for p in tmp_path.iterdir()] == [os.path.basename(path)]
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=25)
+    first = _publish(cache, "a", 10)
+    second = _publish(cache, "b", 10)
+    _age(first, 20)
+    _age(second, 10)
+    cache.get("a")  # "a" becomes most recently used
+
+    _publish(cache, "c", 10)
+
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+    assert cache.evictions == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100, ttl_seconds=60)
+    path = _publish(cache, "a", 10)
+    _age(path, 120)
+
+    assert cache.get("a") is None
+    assert not os.path.exists(path)
+
+
+def test_reconcile_removes_stale_temp_files_only(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    published = _publish(cache, "a", 10)
+    stale = cache.temp_path("b")
+    fresh = cache.temp_path("c")
+    for temp in (stale, fresh):
+        with open(temp, "wb") as fp:
+            fp.write(b"partial")
+    _age(stale, STALE_TEMP_SECONDS + 1)
+
+    cache.reconcile()
+
+    assert os.path.exists(published)
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
@@ -4,6 +4,18 @@ import pytest
 from yt_dlp.utils import DownloadError
 
 import src.downloader as downloader
+from src.disk_cache import DiskCache
+from src.metrics import capture
+from tests.fakes import MediaFiles, MediaServer
+
+
+@pytest.fixture
+def media_files():
+    return MediaFiles.filler(256 * 1024, segments=4)
+
+
+def _serve(media, **faults):
+    return MediaServer(media, **faults).start()
 
 
 def test_download_video_success(monkeypatch, tmp_path):
@@ -19,7 +31,10 @@ def test_download_video_success(monkeypatch, tmp_path):
         def __exit__(self, exc_type, exc, tb):
             return False
 
-        def download(self, _urls):
+        def extract_info(self, _url, download=False):
+            return {}
+
+        def process_ie_result(self, _info, download=True):
             output_file.write_bytes(b"ok")
 
     monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
@@ -43,7 +58,10 @@ def test_download_video_raises_when_file_missing(monkeypatch, tmp_path):
         def __exit__(self, exc_type, exc, tb):
             return False
 
-        def download(self, _urls):
+        def extract_info(self, _url, download=False):
+            return {}
+
+        def process_ie_result(self, _info, download=True):
             return None
 
     monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
@@ -65,7 +83,10 @@ def test_download_video_propagates_download_error(monkeypatch, tmp_path):
         def __exit__(self, exc_type, exc, tb):
             return False
 
-        def download(self, _urls):
+        def extract_info(self, _url, download=False):
+            return {}
+
+        def process_ie_result(self, _info, download=True):
             raise DownloadError("boom")
 
     monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
@@ -87,7 +108,10 @@ def test_download_video_raises_file_too_large_and_deletes_file(monkeypatch, tmp_
         def __exit__(self, exc_type, exc, tb):
             return False
 
-        def download(self, _urls):
+        def extract_info(self, _url, download=False):
+            return {}
+
+        def process_ie_result(self, _info, download=True):
             output_file.write_bytes(b"small")
 
     monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
@@ -113,7 +137,10 @@ def test_download_video_passes_expected_ydl_options(monkeypatch, tmp_path):
         def __exit__(self, exc_type, exc, tb):
             return False
 
-        def download(self, _urls):
+        def extract_info(self, _url, download=False):
+            return {}
+
+        def process_ie_result(self, _info, download=True):
             Path(output_file).write_bytes(b"ok")
 
     monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
@@ -125,3 +152,230 @@ def test_download_video_passes_expected_ydl_options(monkeypatch, tmp_path):
     assert captured_opts["quiet"] is True
     assert captured_opts["no_warnings"] is True
     assert "bestvideo" in captured_opts["format"]
+
+
+def test_download_video_cache_hit_skips_yt_dlp(monkeypatch, tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=1024)
+    temp = cache.temp_path("https://x.com/i/status/789")
+    Path(temp).write_bytes(b"cached")
+    cached_path = cache.publish("https://x.com/i/status/789", temp)
+
+    class FakeYDL:
+        def __init__(self, opts):
+            raise AssertionError("yt-dlp should not be called on a cache hit")
+
+    monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
+
+    result = downloader.download_video(
+        "https://x.com/i/status/789", str(tmp_path / "video.mp4"), cache
+    )
+
+    assert result == cached_path
+
+
+def test_download_video_publishes_into_cache(monkeypatch, tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=1024)
+
+    class FakeYDL:
+        def __init__(self, opts):
+            self.opts = opts
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def extract_info(self, _url, download=False):
+            return {}
+
+        def process_ie_result(self, _info, download=True):
+            Path(self.opts["outtmpl"]).write_bytes(b"ok")
+
+    monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
+
+    result = downloader.download_video(
+        "https://x.com/i/status/790", str(tmp_path / "video.mp4"), cache
+    )
+
+    assert result == str(cache.path_for("https://x.com/i/status/790"))
+    assert Path(result).read_bytes() == b"ok"
+    assert not (tmp_path / "video.mp4").exists()
+
+
+def test_download_video_rejects_oversized_estimate_before_downloading(monkeypatch, tmp_path):
+    output_file = tmp_path / "video.mp4"
+    downloaded = []
+
+    class FakeYDL:
+        def __init__(self, opts):
+            self.opts = opts
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def extract_info(self, _url, download=False):
+            return {"filesize": downloader.MAX_FILE_SIZE + 1}
+
+        def process_ie_result(self, _info, download=True):
+            downloaded.append(True)
+
+    monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
+
+    with pytest.raises(downloader.FileTooLargeError) as exc_info:
+        downloader.download_video("https://x.com/i/status/123", str(output_file))
+
+    assert exc_info.value.file_size == downloader.MAX_FILE_SIZE + 1
+    assert downloaded == []
+
+
+def test_estimate_size_prefers_filesize_then_approx_then_bitrate():
+    assert downloader.estimate_size({"filesize": 10, "filesize_approx": 99}) == 10
+    assert downloader.estimate_size({"filesize_approx": 20}) == 20
+    # 800 kbit/s for 10 seconds = 1,000,000 bytes
+    assert downloader.estimate_size({"tbr": 800, "duration": 10}) == 1_000_000
+    assert downloader.estimate_size({"duration": 10}) is None
+
+
+def test_estimate_size_sums_merged_formats():
+    info = {
+        "duration": 10,
+        "requested_formats": [{"filesize": 100}, {"tbr": 8}],
+    }
+
+    assert downloader.estimate_size(info) == 100 + 10_000
+
+
+def test_estimate_size_uses_largest_playlist_entry():
+    info = {"entries": [{"filesize": 5}, {"filesize": 50}]}
+
+    assert downloader.estimate_size(info) == 50
+
+
+def _formats():
+    return [
+        {"format_id": "audio", "vcodec": "none", "acodec": "mp4a", "abr": 128, "filesize": 1_000},
+        {"format_id": "360", "vcodec": "avc1", "acodec": "mp4a", "height": 360, "filesize": 5_000},
+        {"format_id": "720v", "vcodec": "avc1", "acodec": "none", "height": 720, "filesize": 8_000},
+        {"format_id": "1080", "vcodec": "avc1", "acodec": "mp4a", "height": 1080, "filesize": 20_000},
+    ]
+
+
+def test_select_format_picks_highest_quality_under_budget():
+    rendition = downloader.select_format({"formats": _formats()}, budget=10_000)
+
+    assert rendition == downloader.Rendition("720v+audio", 720, 9_000)
+
+
+def test_select_format_falls_back_to_smaller_progressive():
+    rendition = downloader.select_format({"formats": _formats()}, budget=6_000)
+
+    assert rendition == downloader.Rendition("360", 360, 5_000)
+
+
+def test_select_format_returns_none_when_nothing_fits():
+    assert downloader.select_format({"formats": _formats()}, budget=100) is None
+
+
+def test_download_video_downloads_smaller_rendition_when_default_too_big(monkeypatch, tmp_path):
+    output_file = tmp_path / "video.mp4"
+    monkeypatch.setattr(downloader.settings, "DOWNLOAD_SIZE_BUDGET", 10_000)
+    formats_used = []
+
+    class FakeYDL:
+        def __init__(self, opts):
+            self.opts = opts
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def extract_info(self, _url, download=False):
+            return {
+                "formats": _formats(),
+                "requested_formats": [_formats()[3]],
+                "filesize": 20_000,
+            }
+
+        def process_ie_result(self, info, download=True):
+            assert "requested_formats" not in info
+            formats_used.append(self.opts["format"])
+            output_file.write_bytes(b"ok")
+
+    monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
+
+    downloader.download_video("https://x.com/i/status/123", str(output_file))
+
+    assert formats_used == ["720v+audio"]
+
+
+def test_download_video_times_extract_download_and_merge(monkeypatch, tmp_path):
+    output_file = tmp_path / "video.mp4"
+
+    class FakeYDL:
+        def __init__(self, opts):
+            self.opts = opts
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
+
+        def extract_info(self, _url, download=False):
+            return {}
+
+        def process_ie_result(self, _info, download=True):
+            output_file.write_bytes(b"video")
+            for hook in self.opts["postprocessor_hooks"]:
+                hook({"status": "started", "postprocessor": "Merger"})
+
+    monkeypatch.setattr(downloader.yt_dlp, "YoutubeDL", FakeYDL)
+
+    with capture() as events:
+        downloader.download_video("https://x.com/i/status/901", str(output_file))
+
+    stages = [key[0] for name, key, _, _ in events if name == "dl_video_stage_seconds"]
+    assert stages == ["extract", "download", "merge"]
+    assert ("dl_video_bytes_total", ("download",), "inc", 5) in events
+
+
+def test_download_video_fetches_progressive_mp4_from_local_server(media_files, tmp_path):
+    server = _serve(media_files)
+    try:
+        with capture() as events:
+            result = downloader.download_video(server.url("progressive"), str(tmp_path / "v.mp4"))
+    finally:
+        server.stop()
+
+    assert Path(result).read_bytes() == media_files.progressive
+    stages = {key[0] for name, key, _, _ in events if name == "dl_video_stage_seconds"}
+    assert stages == {"extract", "download"}
+
+
+def test_download_video_fetches_hls_segments_from_local_server(media_files, tmp_path):
+    server = _serve(media_files)
+    try:
+        result = downloader.download_video(server.url("hls"), str(tmp_path / "v.mp4"))
+    finally:
+        server.stop()
+
+    # Without an m4a audio track the format spec falls back to the muxed variant
+    assert Path(result).read_bytes() == b"".join(media_files.muxed_segments)
+
+
+def test_download_video_resumes_dropped_connection(media_files, tmp_path):
+    # Seed 10 drops the second media response: the download, not extraction
+    server = _serve(media_files, drop_share=0.5, seed=10)
+    try:
+        result = downloader.download_video(server.url("progressive"), str(tmp_path / "v.mp4"))
+    finally:
+        server.stop()
+
+    assert server.stats["dropped"] == 1
+    assert Path(result).read_bytes() == media_files.progressive
@@ -1,30 +1,95 @@
 import asyncio
+import json
+import os
+import threading
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from types import SimpleNamespace
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from sqlalchemy.exc import OperationalError
+from telegram.error import BadRequest
 from yt_dlp.utils import DownloadError
 
 import src.handlers as handlers
+from src.concurrency import AdaptiveConcurrency
+from src.db import DownloadStart
 from src.downloader import FileTooLargeError
+from src.metrics import BYTES, REQUEST_SECONDS, STAGE_SECONDS
+from src.scheduler import FREE, PREMIUM, PriorityScheduler
+from src.user_cache import CachedUser, UserCache
 
 
 @pytest.fixture(autouse=True)
 def clear_user_locks():
     handlers._user_locks.clear()
+    handlers._inflight_downloads.clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_user_cache(monkeypatch):
+    cache = UserCache(max_entries=100, ttl_seconds=60)
+    monkeypatch.setattr(handlers, "user_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def patch_profile_writer(monkeypatch):
+    writer = SimpleNamespace(submit=AsyncMock())
+    monkeypatch.setattr(handlers, "profile_writer", writer)
+    return writer
+
+
+@pytest.fixture(autouse=True)
+def patch_download_writer(monkeypatch):
+    writer = SimpleNamespace(submit=AsyncMock())
+    monkeypatch.setattr(handlers, "download_writer", writer)
+    return writer
+
+
+def submitted_events(writer) -> list[tuple[str, object]]:
+    return [c.args[0] for c in writer.submit.await_args_list]
+
+
+@pytest.fixture(autouse=True)
+def disable_video_cache(monkeypatch):
+    monkeypatch.setattr(handlers, "video_cache", None)
+
+
+@pytest.fixture(autouse=True)
+def patch_file_id_cache(monkeypatch):
+    monkeypatch.setattr(handlers, "invalidate_cached_video", AsyncMock())
+
+
+def patch_download_db(
+    monkeypatch, user_id, premium=False, download_id=None, limit_reached=False, cached=None
+):
+    """Patch the download pipeline's units of work."""
+    premium_until = datetime.now() + timedelta(days=1) if premium else None
+    monkeypatch.setattr(handlers, "load_user", AsyncMock(return_value=(user_id, premium_until)))
+    monkeypatch.setattr(
+        handlers,
+        "start_download",
+        AsyncMock(return_value=DownloadStart(download_id, limit_reached, cached)),
+    )
+
+
+def locked() -> OperationalError:
+    return OperationalError("INSERT", {}, Exception("database is locked"))
 
 
 @pytest.fixture
 def patch_async_session(monkeypatch):
-    fake_session = SimpleNamespace()
+    fake_session = SimpleNamespace(commit=AsyncMock())
 
     @asynccontextmanager
     async def _session_cm():
         yield fake_session
 
     monkeypatch.setattr(handlers, "async_session", _session_cm)
+    monkeypatch.setattr(handlers, "read_session", _session_cm)
     return fake_session
 
 
@@ -61,15 +126,33 @@ async def test_status_command_free_user(
 ):
     update = mock_update_factory(text="/status")
     context = mock_context_factory()
-    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock(return_value=SimpleNamespace(id=10)))
+    monkeypatch.setattr(handlers, "get_user_id", AsyncMock(return_value=10))
+    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock())
     monkeypatch.setattr(handlers, "count_downloads_today", AsyncMock(return_value=1))
-    monkeypatch.setattr(handlers, "get_active_subscription", AsyncMock(return_value=None))
+    monkeypatch.setattr(handlers, "get_premium_until", AsyncMock(return_value=None))
 
     await handlers.status_command(update, context)
 
     text = update.message.reply_text.await_args.args[0]
     assert "Plan: Gratis" in text
     assert "Restantes: 2" in text
+    handlers.get_or_create_user.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_status_command_registers_unknown_user(
+    monkeypatch, patch_async_session, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(text="/status", user_id=556)
+    context = mock_context_factory()
+    monkeypatch.setattr(handlers, "get_user_id", AsyncMock(return_value=None))
+    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock())
+
+    await handlers.status_command(update, context)
+
+    assert handlers.get_or_create_user.await_args.kwargs["telegram_id"] == 556
+    text = update.message.reply_text.await_args.args[0]
+    assert f"Descargas hoy: 0/{handlers.settings.FREE_DAILY_LIMIT}" in text
 
 
 @pytest.mark.asyncio
@@ -78,16 +161,17 @@ async def test_status_command_premium_user(
 ):
     update = mock_update_factory(text="/status")
     context = mock_context_factory()
-    sub = SimpleNamespace(expires_at=datetime.now() + timedelta(days=3))
-    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock(return_value=SimpleNamespace(id=10)))
+    premium_until = datetime.now() + timedelta(days=3)
+    monkeypatch.setattr(handlers, "get_user_id", AsyncMock(return_value=10))
     monkeypatch.setattr(handlers, "count_downloads_today", AsyncMock(return_value=7))
-    monkeypatch.setattr(handlers, "get_active_subscription", AsyncMock(return_value=sub))
+    monkeypatch.setattr(handlers, "get_premium_until", AsyncMock(return_value=premium_until))
 
     await handlers.status_command(update, context)
 
     text = update.message.reply_text.await_args.args[0]
     assert "Plan: Premium" in text
     assert "Ilimitado" in text
+    assert premium_until.strftime("%d/%m/%Y") in text
 
 
 @pytest.mark.asyncio
@@ -177,6 +261,27 @@ async def test_successful_payment_handler_creates_subscription_and_replies(
     assert "Premium" in text
 
 
+@pytest.mark.asyncio
+async def test_successful_payment_handler_invalidates_cached_plan(
+    monkeypatch, patch_async_session, fresh_user_cache, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(text="paid", user_id=102)
+    update.message.successful_payment = SimpleNamespace(
+        total_amount=250, telegram_payment_charge_id="charge124"
+    )
+    await fresh_user_cache.get(102, AsyncMock(return_value=CachedUser(11, None)))
+    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock(return_value=SimpleNamespace(id=11)))
+    monkeypatch.setattr(
+        handlers,
+        "create_subscription",
+        AsyncMock(return_value=SimpleNamespace(expires_at=datetime.now() + timedelta(days=30))),
+    )
+
+    await handlers.successful_payment_handler(update, mock_context_factory())
+
+    assert fresh_user_cache.stats()["size"] == 0
+
+
 @pytest.mark.asyncio
 async def test_download_video_rejects_invalid_url(mock_update_factory, mock_context_factory):
     update = mock_update_factory(text="hola")
@@ -187,86 +292,207 @@ async def test_download_video_rejects_invalid_url(mock_update_factory, mock_cont
     update.message.reply_text.assert_awaited_once_with("No es un link de Twitter/X valido.")
 
 
+@pytest.fixture
+def patch_job_worker(monkeypatch):
+    worker = SimpleNamespace(notify=MagicMock())
+    monkeypatch.setattr(handlers, "job_worker", worker)
+    return worker
+
+
 @pytest.mark.asyncio
-async def test_download_video_normalizes_url_and_calls_process(
-    monkeypatch, mock_update_factory, mock_context_factory
+async def test_download_video_normalizes_url_and_enqueues_job(
+    monkeypatch, patch_async_session, patch_job_worker, mock_update_factory, mock_context_factory
 ):
     update = mock_update_factory(text="https://twitter.com/someone/status/123456")
     context = mock_context_factory()
-    process = AsyncMock()
-    monkeypatch.setattr(handlers, "_process_download", process)
+    enqueue = AsyncMock(return_value=SimpleNamespace(id=1))
+    monkeypatch.setattr(handlers, "enqueue_job", enqueue)
 
     await handlers.download_video(update, context)
 
-    process.assert_awaited_once()
-    args = process.await_args.args
-    assert args[3] == "https://x.com/i/status/123456"
-    assert args[4] == "123456"
+    enqueue.assert_awaited_once()
+    kwargs = enqueue.await_args.kwargs
+    assert kwargs["tweet_url"] == "https://x.com/i/status/123456"
+    assert kwargs["tweet_id"] == "123456"
+    assert kwargs["telegram_user_id"] == update.effective_user.id
+    patch_job_worker.notify.assert_called_once()
+    update.message.reply_text.assert_not_awaited()
 
 
 @pytest.mark.asyncio
 async def test_download_video_blocks_if_user_already_downloading(
-    monkeypatch, mock_update_factory, mock_context_factory
+    monkeypatch, patch_async_session, patch_job_worker, mock_update_factory, mock_context_factory
 ):
-    update1 = mock_update_factory(user_id=808, text="https://x.com/a/status/1")
-    update2 = mock_update_factory(user_id=808, text="https://x.com/a/status/2")
+    update = mock_update_factory(user_id=808, text="https://x.com/a/status/2")
     context = mock_context_factory()
-    started = asyncio.Event()
-    release = asyncio.Event()
+    monkeypatch.setattr(handlers, "enqueue_job", AsyncMock(return_value=None))
 
-    async def fake_process(*_args, **_kwargs):
-        started.set()
-        await release.wait()
+    await handlers.download_video(update, context)
 
-    monkeypatch.setattr(handlers, "_process_download", fake_process)
+    update.message.reply_text.assert_awaited_once_with(
+        "Ya tienes una descarga en curso. Espera a que termine."
+    )
+    patch_job_worker.notify.assert_not_called()
 
-    first = asyncio.create_task(handlers.download_video(update1, context))
-    await started.wait()
-    await handlers.download_video(update2, context)
-    release.set()
-    await first
 
-    update2.message.reply_text.assert_awaited_once_with(
-        "Ya tienes una descarga en curso. Espera a que termine."
+@pytest.mark.asyncio
+async def test_download_video_retries_enqueue_while_database_is_locked(
+    monkeypatch, patch_async_session, patch_job_worker, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(text="https://x.com/a/status/3")
+    context = mock_context_factory()
+    enqueue = AsyncMock(side_effect=[locked(), SimpleNamespace(id=1)])
+    monkeypatch.setattr(handlers, "enqueue_job", enqueue)
+
+    await handlers.download_video(update, context)
+
+    assert enqueue.await_count == 2
+    patch_job_worker.notify.assert_called_once()
+    update.message.reply_text.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_download_video_asks_to_retry_when_database_stays_locked(
+    monkeypatch, patch_async_session, patch_job_worker, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(text="https://x.com/a/status/4")
+    context = mock_context_factory()
+    monkeypatch.setattr(handlers, "enqueue_job", AsyncMock(side_effect=locked()))
+    monkeypatch.setattr(handlers, "_DB_ATTEMPTS", 2)
+
+    await handlers.download_video(update, context)
+
+    update.message.reply_text.assert_awaited_once_with(handlers._DB_BUSY_MESSAGE)
+    patch_job_worker.notify.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_job_replays_update_under_user_lock(monkeypatch):
+    payload = {
+        "update_id": 1,
+        "message": {
+            "message_id": 10,
+            "date": 0,
+            "chat": {"id": 809, "type": "private"},
+            "from": {"id": 809, "is_bot": False, "first_name": "Ana"},
+            "text": "https://x.com/a/status/3",
+        },
+    }
+    job = SimpleNamespace(
+        id=5,
+        chat_id=809,
+        tweet_url="https://x.com/i/status/3",
+        tweet_id="3",
+        payload=json.dumps(payload),
     )
+    application = SimpleNamespace(bot=MagicMock())
+    seen = {}
+
+    async def fake_process(update, context, tg_user, tweet_url, tweet_id, job_id=None):
+        seen.update(
+            locked=handlers._get_user_lock(809).locked(),
+            user_id=tg_user.id,
+            chat_id=update.effective_chat.id,
+            tweet_url=tweet_url,
+            job_id=job_id,
+        )
+
+    monkeypatch.setattr(handlers, "_process_download", fake_process)
+
+    await handlers.run_job(application, job)
+
+    assert seen == {
+        "locked": True,
+        "user_id": 809,
+        "chat_id": 809,
+        "tweet_url": "https://x.com/i/status/3",
+        "job_id": 5,
+    }
 
 
 @pytest.mark.asyncio
 async def test_process_download_free_user_limit_reached(
-    monkeypatch, patch_async_session, mock_update_factory, mock_context_factory
+    monkeypatch, patch_async_session, patch_download_writer, patch_profile_writer, mock_update_factory, mock_context_factory
 ):
     update = mock_update_factory(user_id=901)
     context = mock_context_factory()
-    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock(return_value=SimpleNamespace(id=42)))
-    monkeypatch.setattr(handlers, "has_active_subscription", AsyncMock(return_value=False))
-    monkeypatch.setattr(handlers, "reserve_download", AsyncMock(return_value=None))
+    patch_download_db(monkeypatch, 42, limit_reached=True)
 
     await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/1", "1")
 
     text = update.message.reply_text.await_args.args[0]
     assert "Alcanzaste tu limite" in text
+    patch_download_writer.submit.assert_not_awaited()
+    profile, = patch_profile_writer.submit.await_args.args
+    assert profile["telegram_id"] == 901
+    assert patch_profile_writer.submit.await_args.kwargs == {"key": 901}
 
 
 @pytest.mark.asyncio
-async def test_process_download_free_user_success(
-    monkeypatch, tmp_path, patch_async_session, mock_update_factory, mock_context_factory
+async def test_process_download_stale_free_plan_downloads_as_premium(
+    monkeypatch, tmp_path, fresh_user_cache, patch_async_session, patch_download_writer,
+    mock_update_factory, mock_context_factory
 ):
-    update = mock_update_factory(user_id=902)
+    update = mock_update_factory(user_id=914)
     status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
     update.message.reply_text = AsyncMock(return_value=status_msg)
     context = mock_context_factory()
-    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock(return_value=SimpleNamespace(id=43)))
-    monkeypatch.setattr(handlers, "has_active_subscription", AsyncMock(return_value=False))
+    patch_download_db(monkeypatch, 54)
+    # Paid through another process: start_download found the plan in the row
+    premium_until = datetime.now() + timedelta(days=30)
     monkeypatch.setattr(
-        handlers, "reserve_download", AsyncMock(return_value=SimpleNamespace(id=777))
+        handlers,
+        "start_download",
+        AsyncMock(return_value=DownloadStart(None, False, None, premium_until)),
     )
-    monkeypatch.setattr(handlers, "delete_download", AsyncMock())
-    monkeypatch.setattr(handlers, "record_download", AsyncMock())
     monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: str(tmp_path))
 
-    def fake_dl(_url, filename):
+    def fake_dl(_url, filename, _cache=None):
+        with open(filename, "wb") as fp:
+            fp.write(b"video")
+        return filename
+
+    monkeypatch.setattr(handlers, "dl_video", fake_dl)
+
+    await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/14", "14")
+
+    context.bot.send_video.assert_awaited_once()
+    assert fresh_user_cache.invalidations == 1
+    assert [kind for kind, _ in submitted_events(patch_download_writer)] == ["video", "record"]
+
+
+@pytest.mark.asyncio
+async def test_process_download_commits_registration_before_caching_user(
+    monkeypatch, fresh_user_cache, patch_async_session, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=915)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 55)
+    handlers.start_download.side_effect = TimeoutError("database is locked")
+
+    with pytest.raises(TimeoutError):
+        await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/15", "15")
+
+    # The cached id belongs to a committed row, even though start_download failed
+    patch_async_session.commit.assert_awaited_once()
+    assert fresh_user_cache.stats()["size"] == 1
+
+
+@pytest.mark.asyncio
+async def test_process_download_free_user_success(
+    monkeypatch, tmp_path, patch_async_session, patch_download_writer, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=902)
+    status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+    update.message.reply_text = AsyncMock(return_value=status_msg)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 43, download_id=777)
+    monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: str(tmp_path))
+
+    def fake_dl(_url, filename, _cache=None):
         with open(filename, "wb") as fp:
             fp.write(b"video")
+        return filename
 
     monkeypatch.setattr(handlers, "dl_video", fake_dl)
 
@@ -274,83 +500,388 @@ async def test_process_download_free_user_success(
 
     context.bot.send_video.assert_awaited_once()
     status_msg.delete.assert_awaited_once()
-    handlers.delete_download.assert_not_awaited()
-    handlers.record_download.assert_not_awaited()
+    assert [kind for kind, _ in submitted_events(patch_download_writer)] == ["video"]
+    args = handlers.start_download.await_args.args
+    assert args[1:4] == (43, False, "https://x.com/i/status/2")
+
+
+@pytest.mark.asyncio
+async def test_process_download_records_stage_metrics(
+    monkeypatch, tmp_path, patch_async_session, patch_download_writer, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=912)
+    status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+    update.message.reply_text = AsyncMock(return_value=status_msg)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 52, download_id=790)
+    monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: str(tmp_path))
+
+    def fake_dl(_url, filename, _cache=None):
+        with open(filename, "wb") as fp:
+            fp.write(b"video")
+        return filename
+
+    monkeypatch.setattr(handlers, "dl_video", fake_dl)
+    stages = ("db_lookup", "slot_wait", "upload", "cleanup")
+    before = {name: STAGE_SECONDS.labels(name).count() for name in stages}
+    ok_before = REQUEST_SECONDS.labels("ok").count()
+    uploaded_before = BYTES.labels("upload").get()
+
+    await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/12", "12")
+
+    for name in stages:
+        assert STAGE_SECONDS.labels(name).count() == before[name] + 1
+    assert REQUEST_SECONDS.labels("ok").count() == ok_before + 1
+    assert BYTES.labels("upload").get() == uploaded_before + 5
 
 
 @pytest.mark.asyncio
 async def test_process_download_rolls_back_on_download_error(
-    monkeypatch, patch_async_session, mock_update_factory, mock_context_factory
+    monkeypatch, patch_async_session, patch_download_writer, mock_update_factory, mock_context_factory
 ):
     update = mock_update_factory(user_id=903)
     status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
     update.message.reply_text = AsyncMock(return_value=status_msg)
     context = mock_context_factory()
-    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock(return_value=SimpleNamespace(id=44)))
-    monkeypatch.setattr(handlers, "has_active_subscription", AsyncMock(return_value=False))
-    monkeypatch.setattr(
-        handlers, "reserve_download", AsyncMock(return_value=SimpleNamespace(id=778))
-    )
-    monkeypatch.setattr(handlers, "delete_download", AsyncMock())
+    patch_download_db(monkeypatch, 44, download_id=778)
 
-    def fake_dl(_url, _filename):
+    def fake_dl(_url, _filename, _cache=None):
         raise DownloadError("boom")
 
     monkeypatch.setattr(handlers, "dl_video", fake_dl)
 
     await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/3", "3")
 
-    handlers.delete_download.assert_awaited_once()
+    assert submitted_events(patch_download_writer) == [("release", 778)]
     status_msg.edit_text.assert_awaited_once()
 
 
 @pytest.mark.asyncio
-async def test_process_download_rolls_back_on_file_too_large(
+async def test_process_download_reports_throttled_download_to_concurrency_control(
     monkeypatch, patch_async_session, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=913)
+    status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+    update.message.reply_text = AsyncMock(return_value=status_msg)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 53, download_id=791)
+    scheduler = PriorityScheduler(5)
+    controller = AdaptiveConcurrency(scheduler, 1, 10, 60, 0.2, 0.05, 0)
+    monkeypatch.setattr(handlers, "_download_scheduler", scheduler)
+    monkeypatch.setattr(handlers, "download_concurrency", controller)
+
+    def fake_dl(_url, _filename, _cache=None):
+        raise DownloadError("ERROR: HTTP Error 429: Too Many Requests")
+
+    monkeypatch.setattr(handlers, "dl_video", fake_dl)
+
+    await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/13", "13")
+
+    controller.adjust()
+    assert controller.last_window["downloads"] == 1
+    assert controller.last_window["throttle_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_process_download_rolls_back_on_file_too_large(
+    monkeypatch, patch_async_session, patch_download_writer, mock_update_factory, mock_context_factory
 ):
     update = mock_update_factory(user_id=904)
     status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
     update.message.reply_text = AsyncMock(return_value=status_msg)
     context = mock_context_factory()
-    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock(return_value=SimpleNamespace(id=45)))
-    monkeypatch.setattr(handlers, "has_active_subscription", AsyncMock(return_value=False))
-    monkeypatch.setattr(
-        handlers, "reserve_download", AsyncMock(return_value=SimpleNamespace(id=779))
-    )
-    monkeypatch.setattr(handlers, "delete_download", AsyncMock())
+    patch_download_db(monkeypatch, 45, download_id=779)
 
-    def fake_dl(_url, _filename):
+    def fake_dl(_url, _filename, _cache=None):
         raise FileTooLargeError(60 * 1024 * 1024)
 
     monkeypatch.setattr(handlers, "dl_video", fake_dl)
 
     await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/4", "4")
 
-    handlers.delete_download.assert_awaited_once()
+    assert submitted_events(patch_download_writer) == [("release", 779)]
     status_msg.edit_text.assert_awaited_once()
 
 
 @pytest.mark.asyncio
 async def test_process_download_premium_records_download(
-    monkeypatch, tmp_path, patch_async_session, mock_update_factory, mock_context_factory
+    monkeypatch, tmp_path, patch_async_session, patch_download_writer, mock_update_factory, mock_context_factory
 ):
     update = mock_update_factory(user_id=905)
     status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
     update.message.reply_text = AsyncMock(return_value=status_msg)
     context = mock_context_factory()
-    monkeypatch.setattr(handlers, "get_or_create_user", AsyncMock(return_value=SimpleNamespace(id=46)))
-    monkeypatch.setattr(handlers, "has_active_subscription", AsyncMock(return_value=True))
-    monkeypatch.setattr(handlers, "reserve_download", AsyncMock())
-    monkeypatch.setattr(handlers, "record_download", AsyncMock())
+    patch_download_db(monkeypatch, 46, premium=True)
     monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: str(tmp_path))
 
-    def fake_dl(_url, filename):
+    def fake_dl(_url, filename, _cache=None):
         with open(filename, "wb") as fp:
             fp.write(b"video")
+        return filename
 
     monkeypatch.setattr(handlers, "dl_video", fake_dl)
 
     await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/5", "5")
 
-    handlers.reserve_download.assert_not_awaited()
-    handlers.record_download.assert_awaited_once()
+    assert handlers.start_download.await_args.args[2] is True
+    (kind, row), = [e for e in submitted_events(patch_download_writer) if e[0] == "record"]
+    assert (row["user_id"], row["tweet_url"]) == (46, "https://x.com/i/status/5")
+
+
+@pytest.mark.asyncio
+async def test_process_download_cache_hit_skips_download(
+    monkeypatch, patch_async_session, patch_download_writer, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=906)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 47, premium=True, cached=SimpleNamespace(file_id="FILE123"))
+    dl = AsyncMock()
+    monkeypatch.setattr(handlers, "dl_video", dl)
+
+    await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/6", "6")
+
+    dl.assert_not_called()
+    context.bot.send_video.assert_awaited_once()
+    assert context.bot.send_video.await_args.kwargs["video"] == "FILE123"
+    assert [kind for kind, _ in submitted_events(patch_download_writer)] == ["record"]
+
+
+@pytest.mark.asyncio
+async def test_process_download_stale_file_id_invalidates_and_downloads(
+    monkeypatch, tmp_path, patch_async_session, patch_download_writer, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=907)
+    status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+    update.message.reply_text = AsyncMock(return_value=status_msg)
+    context = mock_context_factory()
+    uploaded = SimpleNamespace(
+        video=SimpleNamespace(file_id="NEW", file_unique_id="U", file_size=5)
+    )
+    context.bot.send_video = AsyncMock(
+        side_effect=[BadRequest("Wrong file identifier"), uploaded]
+    )
+    patch_download_db(monkeypatch, 48, premium=True, cached=SimpleNamespace(file_id="OLD"))
+    monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: str(tmp_path))
+
+    def fake_dl(_url, filename, _cache=None):
+        with open(filename, "wb") as fp:
+            fp.write(b"video")
+        return filename
+
+    monkeypatch.setattr(handlers, "dl_video", fake_dl)
+
+    await handlers._process_download(update, context, update.effective_user, "https://x.com/i/status/7", "7")
+
+    handlers.invalidate_cached_video.assert_awaited_once()
+    assert handlers.invalidate_cached_video.await_args.args[1:] == ("7", "OLD")
+    assert context.bot.send_video.await_count == 2
+    events = submitted_events(patch_download_writer)
+    video = {"tweet_id": "7", "file_id": "NEW", "file_unique_id": "U", "file_size": 5}
+    assert ("video", video) in events
+
+
+@pytest.mark.asyncio
+async def test_process_download_coalesces_concurrent_requests(
+    monkeypatch, tmp_path, patch_async_session, mock_update_factory, mock_context_factory
+):
+    updates = [mock_update_factory(user_id=910 + i, chat_id=910 + i) for i in range(3)]
+    for update in updates:
+        status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+        update.message.reply_text = AsyncMock(return_value=status_msg)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 49, premium=True)
+    monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: str(tmp_path))
+    calls = []
+
+    def fake_dl(_url, filename, _cache=None):
+        calls.append(filename)
+        time.sleep(0.1)
+        with open(filename, "wb") as fp:
+            fp.write(b"video")
+        return filename
+
+    monkeypatch.setattr(handlers, "dl_video", fake_dl)
+
+    await asyncio.gather(
+        *(
+            handlers._process_download(
+                update, context, update.effective_user, "https://x.com/i/status/8", "8"
+            )
+            for update in updates
+        )
+    )
+
+    assert len(calls) == 1
+    assert context.bot.send_video.await_count == 3
+    sent_chats = {c.kwargs["chat_id"] for c in context.bot.send_video.await_args_list}
+    assert sent_chats == {910, 911, 912}
+    assert list(tmp_path.iterdir()) == []
+    assert handlers._inflight_downloads == {}
+
+
+@pytest.mark.asyncio
+async def test_process_download_cancelled_while_waiting_leaves_the_download(
+    monkeypatch, tmp_path, patch_async_session, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=915)
+    update.message.reply_text = AsyncMock(
+        return_value=SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+    )
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 51, premium=True)
+    monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: str(tmp_path))
+    release = threading.Event()
+
+    def fake_dl(_url, filename, _cache=None):
+        release.wait(5)
+        with open(filename, "wb") as fp:
+            fp.write(b"video")
+        return filename
+
+    monkeypatch.setattr(handlers, "dl_video", fake_dl)
+
+    request = asyncio.create_task(
+        handlers._process_download(
+            update, context, update.effective_user, "https://x.com/i/status/10", "10"
+        )
+    )
+    while not handlers._inflight_downloads:
+        await asyncio.sleep(0.01)
+    flight = handlers._inflight_downloads["https://x.com/i/status/10"]
+    request.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await request
+    release.set()
+    await asyncio.wait_for(asyncio.gather(flight.task, return_exceptions=True), 5)
+
+    assert flight.waiters == 0
+    assert handlers._inflight_downloads == {}
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_process_download_gives_every_flight_its_own_file(
+    monkeypatch, tmp_path, patch_async_session, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=916)
+    update.message.reply_text = AsyncMock(
+        return_value=SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+    )
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 52, premium=True)
+    monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: str(tmp_path))
+    calls = []
+
+    def fake_dl(_url, filename, _cache=None):
+        calls.append(filename)
+        with open(filename, "wb") as fp:
+            fp.write(b"video")
+        return filename
+
+    monkeypatch.setattr(handlers, "dl_video", fake_dl)
+
+    for _ in range(2):
+        await handlers._process_download(
+            update, context, update.effective_user, "https://x.com/i/status/13", "13"
+        )
+
+    assert len(set(calls)) == 2
+    assert all(f"_{os.getpid()}_" in filename for filename in calls)
+
+
+@pytest.mark.asyncio
+async def test_premium_request_raises_the_tier_of_a_shared_download(monkeypatch):
+    scheduler = PriorityScheduler(limit=1)
+    monkeypatch.setattr(handlers, "_download_scheduler", scheduler)
+    await scheduler.acquire(FREE)
+
+    flight = handlers._join_download("https://x.com/i/status/14", "14", FREE)
+    await asyncio.sleep(0)
+    assert scheduler.stats()[FREE]["queued"] == 1
+
+    assert handlers._join_download("https://x.com/i/status/14", "14", PREMIUM) is flight
+    assert flight.tier == PREMIUM
+    assert scheduler.stats()[PREMIUM]["queued"] == 1
+
+    flight.task.cancel()
+    await asyncio.gather(flight.task, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_process_download_coalesced_failure_reaches_every_waiter(
+    monkeypatch, patch_async_session, patch_download_writer, mock_update_factory, mock_context_factory
+):
+    updates = [mock_update_factory(user_id=920 + i) for i in range(2)]
+    status_msgs = []
+    for update in updates:
+        status_msg = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+        status_msgs.append(status_msg)
+        update.message.reply_text = AsyncMock(return_value=status_msg)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 50, download_id=780)
+    calls = []
+
+    def fake_dl(_url, _filename, _cache=None):
+        calls.append(1)
+        time.sleep(0.1)
+        raise DownloadError("boom")
+
+    monkeypatch.setattr(handlers, "dl_video", fake_dl)
+
+    await asyncio.gather(
+        *(
+            handlers._process_download(
+                update, context, update.effective_user, "https://x.com/i/status/9", "9"
+            )
+            for update in updates
+        )
+    )
+
+    assert len(calls) == 1
+    assert submitted_events(patch_download_writer) == [("release", 780)] * 2
+    for status_msg in status_msgs:
+        status_msg.edit_text.assert_awaited_once()
+    assert handlers._inflight_downloads == {}
+
+
+def test_download_dir_follows_the_video_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(handlers.tempfile, "gettempdir", lambda: "/tmp/downloads")
+    assert handlers._download_dir() == "/tmp/downloads"
+
+    monkeypatch.setattr(handlers, "video_cache", SimpleNamespace(directory=tmp_path / "cache"))
+    assert handlers._download_dir() == str(tmp_path / "cache")
+
+
+@pytest.mark.asyncio
+async def test_process_download_retries_lookup_while_database_is_locked(
+    monkeypatch, patch_async_session, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=930)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 60)
+    handlers.start_download.side_effect = [locked(), DownloadStart(None, True, None)]
+
+    await handlers._process_download(
+        update, context, update.effective_user, "https://x.com/i/status/11", "11"
+    )
+
+    assert handlers.start_download.await_count == 2
+    assert update.message.reply_text.await_args.args[0].startswith("Alcanzaste")
+
+
+@pytest.mark.asyncio
+async def test_process_download_asks_to_retry_when_database_stays_locked(
+    monkeypatch, patch_async_session, mock_update_factory, mock_context_factory
+):
+    update = mock_update_factory(user_id=931)
+    context = mock_context_factory()
+    patch_download_db(monkeypatch, 61)
+    handlers.start_download.side_effect = locked()
+    monkeypatch.setattr(handlers, "_DB_ATTEMPTS", 2)
+
+    await handlers._process_download(
+        update, context, update.effective_user, "https://x.com/i/status/12", "12"
+    )
+
+    update.message.reply_text.assert_awaited_once_with(handlers._DB_BUSY_MESSAGE)
+    context.bot.send_video.assert_not_awaited()
@@ -0,0 +1,160 @@
+import asyncio
+import functools
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import src.jobs as jobs
+from src.db import enqueue_job
+from src.models import JOB_DONE, JOB_FAILED, JOB_QUEUED, Base, Job
+
+
+@pytest_asyncio.fixture
+async def session_factory(monkeypatch, tmp_path):
+    # A file database of its own: the worker's background tasks keep using
+    # connections, which the shared in-memory StaticPool engine can't take
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    monkeypatch.setattr(jobs, "async_session", factory)
+    yield factory
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def workers(session_factory):
+    """Builds workers that are stopped before the database goes away."""
+    created = []
+    worker = functools.partial(
+        jobs.JobWorker,
+        concurrency=2, batch_size=2, lease_seconds=60, poll_seconds=0.01, max_attempts=3,
+    )
+
+    def make(**overrides):
+        created.append(worker(**overrides))
+        return created[-1]
+
+    yield make
+    for worker in created:
+        await worker.stop(timeout=0.01)
+
+
+async def _enqueue(factory, telegram_user_id):
+    async with factory() as session:
+        return await enqueue_job(
+            session,
+            telegram_user_id=telegram_user_id,
+            chat_id=telegram_user_id,
+            tweet_url=f"https://x.com/i/status/{telegram_user_id}",
+            tweet_id=str(telegram_user_id),
+            payload="{}",
+        )
+
+
+async def _states(factory):
+    async with factory() as session:
+        result = await session.execute(select(Job.id, Job.state, Job.error).order_by(Job.id))
+        return result.all()
+
+
+async def _wait_for(predicate, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not await predicate():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_worker_runs_queued_jobs(session_factory, workers):
+    for user_id in (1, 2, 3):
+        await _enqueue(session_factory, user_id)
+    processed = []
+
+    async def process(job):
+        processed.append(job.telegram_user_id)
+
+    worker = workers()
+    await worker.start(process)
+
+    async def all_done():
+        return all(state == JOB_DONE for _, state, _ in await _states(session_factory))
+
+    await _wait_for(all_done)
+    await worker.stop()
+
+    assert sorted(processed) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_worker_marks_failed_jobs(session_factory, workers):
+    await _enqueue(session_factory, 10)
+
+    async def process(_job):
+        raise RuntimeError("kaboom")
+
+    worker = workers()
+    await worker.start(process)
+
+    async def failed():
+        return (await _states(session_factory))[0][1] == JOB_FAILED
+
+    await _wait_for(failed)
+    await worker.stop()
+
+    assert (await _states(session_factory))[0][2] == "kaboom"
+
+
+@pytest.mark.asyncio
+async def test_worker_stop_requeues_unfinished_jobs(session_factory, workers):
+    await _enqueue(session_factory, 20)
+    started = asyncio.Event()
+
+    async def process(_job):
+        started.set()
+        await asyncio.Event().wait()
+
+    worker = workers()
+    await worker.start(process)
+    await asyncio.wait_for(started.wait(), 2.0)
+    await worker.stop(timeout=0.01)
+
+    assert (await _states(session_factory))[0][1] == JOB_QUEUED
+
+
+@pytest.mark.asyncio
+async def test_worker_retries_finishing_a_job_while_the_database_is_locked(
+    monkeypatch, session_factory, workers
+):
+    await _enqueue(session_factory, 30)
+    finish_job = jobs.finish_job
+    failures = [OperationalError("UPDATE jobs", {}, Exception("database is locked"))]
+
+    async def flaky_finish_job(session, job_id, error=None):
+        if failures:
+            raise failures.pop()
+        await finish_job(session, job_id, error)
+
+    monkeypatch.setattr(jobs, "finish_job", flaky_finish_job)
+    processed = []
+
+    async def process(job):
+        processed.append(job.id)
+
+    # A lease short enough that a job left running would be requeued
+    worker = workers(lease_seconds=1)
+    await worker.start(process)
+
+    async def done():
+        return (await _states(session_factory))[0][1] == JOB_DONE
+
+    await _wait_for(done)
+    await worker.stop()
+
+    assert failures == []
+    assert len(processed) == 1
+    assert (await _states(session_factory))[0][1] == JOB_DONE
@@ -0,0 +1,127 @@
+import pytest
+from telegram.ext import Application
+
+import main
+from src.concurrency import AdaptiveConcurrency
+from src.scheduler import PriorityScheduler
+
+
+def test_build_application_registers_handlers():
+    application = main.build_application()
+
+    assert len(application.handlers[0]) == 7
+
+
+def test_build_application_bounds_update_queue(monkeypatch):
+    monkeypatch.setattr(main.settings, "UPDATE_QUEUE_SIZE", 50)
+    monkeypatch.setattr(main.settings, "CONCURRENT_UPDATES", 8)
+
+    application = main.build_application(Application.builder())
+
+    assert application.update_queue.maxsize == 50
+    assert application.concurrent_updates == 8
+
+
+def test_main_uses_webhook_when_url_configured(monkeypatch):
+    calls = {}
+
+    class FakeApplication:
+        def run_webhook(self, **kwargs):
+            calls["webhook"] = kwargs
+
+        def run_polling(self, **kwargs):
+            calls["polling"] = kwargs
+
+    monkeypatch.setattr(main, "build_application", lambda: FakeApplication())
+    monkeypatch.setattr(main.settings, "WEBHOOK_URL", "https://bot.example.com/")
+    monkeypatch.setattr(main.settings, "WEBHOOK_SECRET_TOKEN", "s3cret")
+
+    main.main()
+
+    assert "polling" not in calls
+    assert calls["webhook"]["webhook_url"] == "https://bot.example.com/telegram"
+    assert calls["webhook"]["secret_token"] == "s3cret"
+    assert calls["webhook"]["max_connections"] == main.settings.WEBHOOK_MAX_CONNECTIONS
+
+
+def test_main_runs_sharded_dispatcher_when_workers_configured(monkeypatch):
+    calls = {}
+
+    async def fake_run_dispatcher(token, pool, webhook_options, allowed_updates):
+        calls["pool"] = pool
+        calls["webhook"] = webhook_options
+
+    async def fake_prepare_database():
+        calls["database"] = "pool" not in calls
+
+    monkeypatch.setattr(main, "run_dispatcher", fake_run_dispatcher)
+    monkeypatch.setattr(main, "prepare_database", fake_prepare_database)
+    monkeypatch.setattr(main.settings, "SHARD_WORKERS", 4)
+    monkeypatch.setattr(main.settings, "WEBHOOK_URL", "")
+
+    main.main()
+
+    assert calls["pool"].shards == 4
+    assert calls["pool"].build is main.build_application
+    assert calls["webhook"] is None
+    # Once, before the workers start
+    assert calls["database"] is True
+
+
+def test_schedule_maintenance_adds_repeating_job():
+    application = main.build_application(Application.builder())
+
+    main.schedule_maintenance(application)
+
+    (job,) = application.job_queue.get_jobs_by_name("db-maintenance")
+    assert job.callback == main.db_maintenance.run_job
+
+
+def test_schedule_maintenance_only_in_first_shard():
+    application = main.build_application(Application.builder())
+    application.bot_data["shard"] = 2
+
+    main.schedule_maintenance(application)
+
+    assert application.job_queue.get_jobs_by_name("db-maintenance") == ()
+
+
+def test_schedule_concurrency_control_only_when_adaptive(monkeypatch):
+    application = main.build_application(Application.builder())
+    main.schedule_concurrency_control(application)
+    assert application.job_queue.get_jobs_by_name("download-concurrency") == ()
+
+    controller = AdaptiveConcurrency(PriorityScheduler(5), 1, 10, 60, 0.2, 0.05, 0)
+    monkeypatch.setattr(main, "download_concurrency", controller)
+    application.bot_data["shard"] = 2
+    main.schedule_concurrency_control(application)
+
+    (job,) = application.job_queue.get_jobs_by_name("download-concurrency")
+    assert job.callback == controller.run_job
+
+
+@pytest.mark.asyncio
+async def test_metrics_server_listens_per_shard_and_stops(monkeypatch):
+    started = []
+
+    class FakeServer:
+        def __init__(self, registry, host, port):
+            self.port = port
+
+        async def start(self):
+            started.append(self.port)
+
+        async def stop(self):
+            started.remove(self.port)
+
+    monkeypatch.setattr(main, "MetricsServer", FakeServer)
+    monkeypatch.setattr(main.settings, "METRICS_PORT", 9100)
+    monkeypatch.setattr(main.download_pool, "shutdown", lambda: None)
+    application = main.build_application(Application.builder())
+    application.bot_data["shard"] = 2
+
+    await main.start_metrics_server(application)
+    assert started == [9102]
+
+    await main.post_shutdown(application)
+    assert started == []
@@ -0,0 +1,150 @@
+import functools
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import src.maintenance as maintenance
+from src.db import get_or_create_user
+from src.models import JOB_DONE, JOB_QUEUED, DailyDownloadStats, DailyUsage, Download, Job
+
+
+@pytest.fixture
+def session_factory(monkeypatch, db_engine):
+    factory = async_sessionmaker(bind=db_engine, expire_on_commit=False)
+    monkeypatch.setattr(maintenance, "async_session", factory)
+    return factory
+
+
+_maintenance = functools.partial(
+    maintenance.DatabaseMaintenance,
+    retention_days=90, job_retention_days=7, batch_size=2, vacuum_pages=100, pause=0,
+)
+
+
+async def _seed_downloads(factory, days_ago: list[int]):
+    async with factory() as session:
+        users = [
+            (await get_or_create_user(session, telegram_id=5000 + i, username=f"u{i}")).id
+            for i in range(2)
+        ]
+        now = datetime.now()
+        rows = [
+            {
+                "user_id": users[i % 2],
+                "tweet_url": f"https://x.com/i/status/{i}",
+                "created_at": now - timedelta(days=days),
+            }
+            for i, days in enumerate(days_ago)
+        ]
+        await session.execute(insert(Download), rows)
+        await session.commit()
+
+
+async def _stats(factory):
+    async with factory() as session:
+        rows = await session.execute(
+            select(DailyDownloadStats.day, DailyDownloadStats.downloads, DailyDownloadStats.users)
+        )
+        return {day: (downloads, users) for day, downloads, users in rows}
+
+
+@pytest.mark.asyncio
+async def test_run_rolls_up_and_deletes_old_downloads_in_batches(session_factory):
+    await _seed_downloads(session_factory, [100, 100, 100, 95, 0])
+    today = datetime.now().date()
+
+    report = await _maintenance().run()
+
+    stats = await _stats(session_factory)
+    assert stats[today - timedelta(days=100)] == (3, 2)
+    assert stats[today - timedelta(days=95)] == (1, 1)
+    assert today not in stats
+    assert report["days_rolled_up"] >= 2
+    assert report["downloads_deleted"] == 4
+    assert report["delete_batches"] == 3
+    async with session_factory() as session:
+        assert await session.scalar(select(func.count()).select_from(Download)) == 1
+        usage = (await session.execute(select(DailyUsage.day, DailyUsage.count))).all()
+    # The old days' counters are gone; today's quota is untouched
+    assert usage == [(today, 1)]
+
+
+@pytest.mark.asyncio
+async def test_run_twice_keeps_rolled_up_stats(session_factory):
+    await _seed_downloads(session_factory, [100, 100, 3])
+    job = _maintenance()
+    await job.run()
+    stats = await _stats(session_factory)
+
+    report = await job.run()
+
+    assert report["days_rolled_up"] == 0
+    assert report["downloads_deleted"] == 0
+    assert await _stats(session_factory) == stats
+    assert job.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_run_with_zero_retention_keeps_downloads(session_factory):
+    await _seed_downloads(session_factory, [400, 100])
+
+    report = await _maintenance(retention_days=0).run()
+
+    assert report["downloads_deleted"] == 0
+    assert len(await _stats(session_factory)) == 2
+
+
+@pytest.mark.asyncio
+async def test_run_deletes_only_old_finished_jobs(session_factory):
+    old = datetime.now() - timedelta(days=30)
+    rows = [
+        {"state": JOB_DONE, "updated_at": old},
+        {"state": JOB_DONE, "updated_at": datetime.now()},
+        {"state": JOB_QUEUED, "updated_at": old},
+    ]
+    async with session_factory() as session:
+        for i, row in enumerate(rows):
+            session.add(
+                Job(
+                    telegram_user_id=i,
+                    chat_id=i,
+                    tweet_url="https://x.com/i/status/1",
+                    tweet_id="1",
+                    payload="{}",
+                    **row,
+                )
+            )
+        await session.commit()
+
+    report = await _maintenance().run()
+
+    assert report["jobs_deleted"] == 1
+    async with session_factory() as session:
+        assert await session.scalar(select(func.count()).select_from(Job)) == 2
+
+
+@pytest.mark.asyncio
+async def test_run_reports_timings(session_factory):
+    job = _maintenance()
+
+    report = await job.run()
+
+    for key in ("rollup_ms", "delete_ms", "vacuum_ms", "optimize_ms", "total_ms"):
+        assert report[key] >= 0
+    assert job.last_report == report
+
+
+@pytest.mark.asyncio
+async def test_run_job_logs_failures(monkeypatch, caplog):
+    job = _maintenance()
+
+    async def broken():
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr(job, "run", broken)
+
+    await job.run_job(context=None)
+
+    assert "Database maintenance failed: disk I/O error" in caplog.text
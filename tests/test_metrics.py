@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from src.metrics import ERRORS, STAGE_SECONDS, MetricsServer, Registry, capture, stage
+
+
+def test_render_counters_gauges_and_histograms():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("outcome",))
+    depth = registry.gauge("queue_depth", "Queued.")
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    requests.labels("ok").inc()
+    requests.labels("ok").inc(2)
+    depth.labels().set(4)
+    for value in (0.05, 0.5, 3.0):
+        latency.labels().observe(value)
+
+    text = registry.render()
+
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{outcome="ok"} 3' in text
+    assert "queue_depth 4" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_sum 3.55" in text
+    assert "latency_seconds_count 3" in text
+
+
+def test_set_function_reads_at_scrape_time_and_skips_failures():
+    registry = Registry()
+    gauge = registry.gauge("pending", "Pending.", ("writer",))
+    pending = {"profile": 1}
+    gauge.labels("profile").set_function(lambda: pending["profile"])
+    gauge.labels("broken").set_function(lambda: 1 / 0)
+    pending["profile"] = 7
+
+    text = registry.render()
+
+    assert 'pending{writer="profile"} 7' in text
+    assert "broken" not in text
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("errors_total", "Errors.", ("error",)).labels('a"b\\c').inc()
+
+    assert 'errors_total{error="a\\"b\\\\c"} 1' in registry.render()
+
+
+def test_capture_defers_observations_for_replay():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", ("stage",))
+
+    with capture() as events:
+        latency.labels("extract").observe(0.2)
+    assert latency.labels("extract").count() == 0
+
+    registry.replay(events)
+
+    assert latency.labels("extract").count() == 1
+
+
+def test_stage_times_and_counts_failures():
+    before = STAGE_SECONDS.labels("test_stage").count()
+
+    with pytest.raises(KeyError):
+        with stage("test_stage"):
+            raise KeyError("x")
+
+    assert STAGE_SECONDS.labels("test_stage").count() == before + 1
+    assert ERRORS.labels("test_stage", "KeyError").get() >= 1
+
+
+async def _get(port: int, path: str) -> tuple[str, str]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = (await reader.read()).decode()
+    writer.close()
+    head, body = response.split("\r\n\r\n", 1)
+    return head.splitlines()[0], body
+
+
+@pytest.mark.asyncio
+async def test_server_serves_metrics_and_404s_elsewhere():
+    registry = Registry()
+    registry.counter("hits_total", "Hits.").labels().inc()
+    server = MetricsServer(registry, "127.0.0.1", 0)
+    await server.start()
+    try:
+        status, body = await _get(server.port, "/metrics")
+        missing, _ = await _get(server.port, "/")
+    finally:
+        await server.stop()
+
+    assert status == "HTTP/1.1 200 OK"
+    assert "hits_total 1" in body
+    assert missing == "HTTP/1.1 404 Not Found"
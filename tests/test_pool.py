@@ -0,0 +1,115 @@
+import os
+
+import pytest
+from yt_dlp.utils import DownloadError
+
+from src.downloader import FileTooLargeError
+from src.pool import DownloadPool, WorkerError
+
+
+def _return_pid(value):
+    return value, os.getpid()
+
+
+def _raise_too_large():
+    raise FileTooLargeError(60 * 1024 * 1024)
+
+
+def _raise_download_error():
+    try:
+        raise ValueError("upstream")
+    except ValueError:
+        import sys
+
+        raise DownloadError("boom", exc_info=sys.exc_info())
+
+
+@pytest.fixture
+def process_pool():
+    pool = DownloadPool(executor="process", max_workers=1, max_jobs_per_worker=1)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_falls_back_to_threads_when_not_started():
+    pool = DownloadPool(executor="process", max_workers=1, max_jobs_per_worker=1)
+
+    value, pid = await pool.run(_return_pid, "ok")
+
+    assert value == "ok"
+    assert pid == os.getpid()
+
+
+@pytest.mark.asyncio
+async def test_thread_executor_never_starts_processes():
+    pool = DownloadPool(executor="thread", max_workers=1, max_jobs_per_worker=1)
+    pool.start()
+
+    _, pid = await pool.run(_return_pid, "ok")
+
+    assert pid == os.getpid()
+
+
+@pytest.mark.asyncio
+async def test_run_in_process_and_recycle_worker(process_pool):
+    value, first_pid = await process_pool.run(_return_pid, "ok")
+    _, second_pid = await process_pool.run(_return_pid, "ok")
+
+    assert value == "ok"
+    assert first_pid != os.getpid()
+    assert first_pid != second_pid
+
+
+@pytest.mark.asyncio
+async def test_file_too_large_keeps_fields_across_processes(process_pool):
+    with pytest.raises(FileTooLargeError) as exc_info:
+        await process_pool.run(_raise_too_large)
+
+    assert exc_info.value.file_size == 60 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_download_error_crosses_process_boundary(process_pool):
+    with pytest.raises(DownloadError, match="boom"):
+        await process_pool.run(_raise_download_error)
+
+
+def _observe_stage():
+    from src.metrics import STAGE_SECONDS
+
+    STAGE_SECONDS.labels("pool_test").observe(0.1)
+    raise FileTooLargeError(60 * 1024 * 1024)
+
+
+@pytest.mark.asyncio
+async def test_worker_metrics_are_replayed_even_on_failure(process_pool):
+    from src.metrics import STAGE_SECONDS
+
+    with pytest.raises(FileTooLargeError):
+        await process_pool.run(_observe_stage)
+
+    assert STAGE_SECONDS.labels("pool_test").count() == 1
+
+
+def _observe_stage_then_crash():
+    import threading
+
+    from src.metrics import STAGE_SECONDS
+
+    STAGE_SECONDS.labels("pool_crash_test").observe(0.1)
+    # Not picklable, like many exceptions from inside yt-dlp
+    error = RuntimeError("crash")
+    error.lock = threading.Lock()
+    raise error
+
+
+@pytest.mark.asyncio
+async def test_unexpected_worker_errors_keep_their_metrics(process_pool):
+    from src.metrics import STAGE_SECONDS
+
+    with pytest.raises(WorkerError, match="RuntimeError: crash"):
+        await process_pool.run(_observe_stage_then_crash)
+
+    assert STAGE_SECONDS.labels("pool_crash_test").count() == 1
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from src.scheduler import FREE, PREMIUM, PriorityScheduler
+
+
+async def _queue(scheduler, tier, order):
+    async with scheduler.slot(tier):
+        order.append(tier)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_admits_immediately_under_limit():
+    scheduler = PriorityScheduler(limit=2)
+
+    await scheduler.acquire(FREE)
+    await scheduler.acquire(PREMIUM)
+
+    stats = scheduler.stats()
+    assert stats[FREE]["running"] == 1
+    assert stats[PREMIUM]["running"] == 1
+
+
+@pytest.mark.asyncio
+async def test_premium_waiters_go_before_earlier_free_waiters():
+    scheduler = PriorityScheduler(limit=1, aging_seconds=1000)
+    order = []
+    await scheduler.acquire(FREE)
+    free_task = asyncio.create_task(_queue(scheduler, FREE, order))
+    await _settle()
+    premium_task = asyncio.create_task(_queue(scheduler, PREMIUM, order))
+    await _settle()
+
+    assert scheduler.stats()[FREE]["queued"] == 1
+    assert scheduler.stats()[PREMIUM]["queued"] == 1
+
+    scheduler.release(FREE)
+    await asyncio.gather(free_task, premium_task)
+
+    assert order == [PREMIUM, FREE]
+
+
+@pytest.mark.asyncio
+async def test_aging_lets_old_free_waiters_win():
+    scheduler = PriorityScheduler(limit=1, aging_seconds=0.01)
+    order = []
+    await scheduler.acquire(FREE)
+    free_task = asyncio.create_task(_queue(scheduler, FREE, order))
+    await asyncio.sleep(0.05)
+    premium_task = asyncio.create_task(_queue(scheduler, PREMIUM, order))
+    await _settle()
+
+    scheduler.release(FREE)
+    await asyncio.gather(free_task, premium_task)
+
+    assert order == [FREE, PREMIUM]
+
+
+@pytest.mark.asyncio
+async def test_zero_aging_keeps_premium_first():
+    scheduler = PriorityScheduler(limit=1, aging_seconds=0)
+    order = []
+    await scheduler.acquire(FREE)
+    free_task = asyncio.create_task(_queue(scheduler, FREE, order))
+    await asyncio.sleep(0.05)
+    premium_task = asyncio.create_task(_queue(scheduler, PREMIUM, order))
+    await _settle()
+
+    scheduler.release(FREE)
+    await asyncio.gather(free_task, premium_task)
+
+    assert order == [PREMIUM, FREE]
+
+
+@pytest.mark.asyncio
+async def test_promote_raises_a_waiting_request_and_releases_its_slot():
+    scheduler = PriorityScheduler(limit=1, aging_seconds=1000)
+    order = []
+    await scheduler.acquire(FREE)
+    promoted = asyncio.create_task(scheduler.acquire(FREE, key="flight"))
+    await _settle()
+    free_task = asyncio.create_task(_queue(scheduler, FREE, order))
+    await _settle()
+
+    scheduler.promote("flight", PREMIUM)
+    assert scheduler.stats()[PREMIUM]["queued"] == 1
+    scheduler.release(FREE)
+
+    assert await promoted == PREMIUM
+    assert scheduler.stats()[PREMIUM]["running"] == 1
+    scheduler.release(PREMIUM)
+    await free_task
+    assert order == [FREE]
+
+
+@pytest.mark.asyncio
+async def test_reservations_are_capped_below_the_limit():
+    scheduler = PriorityScheduler(limit=1, reserved={PREMIUM: 1, FREE: 1})
+
+    await scheduler.acquire(FREE)
+    premium = asyncio.create_task(scheduler.acquire(PREMIUM))
+    await _settle()
+    assert not premium.done()
+
+    scheduler.release(FREE)
+    await premium
+    assert scheduler.stats()[PREMIUM]["running"] == 1
+
+    # Raising the limit gives the reservations back
+    scheduler.set_limit(3)
+    assert scheduler._reserved == {PREMIUM: 1, FREE: 1}
+
+
+@pytest.mark.asyncio
+async def test_reserved_slots_are_kept_for_their_tier():
+    scheduler = PriorityScheduler(limit=2, reserved={FREE: 1})
+
+    await scheduler.acquire(PREMIUM)
+    blocked = asyncio.create_task(scheduler.acquire(PREMIUM))
+    await _settle()
+    assert not blocked.done()
+
+    await scheduler.acquire(FREE)
+    assert scheduler.stats()[FREE]["running"] == 1
+
+    blocked.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await blocked
+    assert scheduler.stats()[PREMIUM]["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stats_record_wait_times():
+    scheduler = PriorityScheduler(limit=1)
+    await scheduler.acquire(FREE)
+    waiter = asyncio.create_task(scheduler.acquire(FREE))
+    await asyncio.sleep(0.02)
+
+    scheduler.release(FREE)
+    await waiter
+
+    stats = scheduler.stats()[FREE]
+    assert stats["admitted"] == 2
+    assert stats["max_wait"] >= 0.02
+
+
+@pytest.mark.asyncio
+async def test_set_limit_admits_waiters_and_shrinks_as_slots_free_up():
+    scheduler = PriorityScheduler(limit=1)
+    await scheduler.acquire(FREE)
+    waiters = [asyncio.create_task(scheduler.acquire(FREE)) for _ in range(2)]
+    await _settle()
+    assert scheduler.stats()[FREE]["queued"] == 2
+
+    scheduler.set_limit(2)
+    await _settle()
+    assert scheduler.stats()[FREE]["running"] == 2
+
+    scheduler.set_limit(1)
+    scheduler.release(FREE)
+    await _settle()
+    # Two were running against a limit of 1: the release admits nobody
+    assert scheduler.stats()[FREE]["queued"] == 1
+
+    scheduler.release(FREE)
+    await asyncio.gather(*waiters)
+    assert scheduler.stats()[FREE]["running"] == 1
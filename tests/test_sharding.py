@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import os
+import queue
+import threading
+import time
+
+import pytest
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, MessageHandler, filters
+
+from src.sharding import ShardPool, shard_for
+from tests.fakes import FakeTelegramServer
+
+
+def _make_update(update_id: int, user_id: int | None) -> Update:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id or 1, "type": "private"},
+        "text": "hola",
+    }
+    if user_id is not None:
+        message["from"] = {"id": user_id, "is_bot": False, "first_name": "u"}
+    return Update.de_json({"update_id": update_id, "message": message}, None)
+
+
+def build_echo_app(base_url: str, builder: ApplicationBuilder) -> Application:
+    """Worker application that answers with the process id."""
+
+    async def echo(update, context):
+        await update.message.reply_text(str(os.getpid()))
+
+    application = builder.token("123456:TEST").base_url(base_url).build()
+    application.add_handler(MessageHandler(filters.TEXT, echo))
+    return application
+
+
+def test_shard_for_is_stable_and_covers_all_shards():
+    assert [shard_for(user_id, 4) for user_id in range(8)] == [0, 1, 2, 3, 0, 1, 2, 3]
+    assert shard_for(123456789, 4) == shard_for(123456789, 4)
+    assert shard_for(None, 4) == 0
+
+
+async def test_route_sends_update_to_owning_shard():
+    pool = ShardPool(build_echo_app, shards=3)
+    pool._queues = [queue.Queue() for _ in range(3)]
+
+    await pool.route(_make_update(1, 7))
+    await pool.route(_make_update(2, 9))
+    await pool.route(_make_update(3, None))
+
+    assert [q.qsize() for q in pool._queues] == [2, 1, 0]
+    assert '"id": 7' in pool._queues[1].get_nowait()
+
+
+async def test_route_waits_when_shard_queue_is_full():
+    pool = ShardPool(build_echo_app, shards=1, queue_size=1)
+    pool._queues = [queue.Queue(maxsize=1)]
+    await pool.route(_make_update(1, 5))
+
+    routed = asyncio.create_task(pool.route(_make_update(2, 5)))
+    await asyncio.sleep(0.05)
+    assert not routed.done()
+
+    pool._queues[0].get_nowait()
+    await asyncio.wait_for(routed, 5)
+    assert pool._queues[0].qsize() == 1
+
+
+class _FakeProcess:
+    def __init__(self, name: str, alive: bool = True):
+        self.name = name
+        self.alive = alive
+        self.exitcode = None if alive else 1
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+
+def test_check_restarts_dead_workers_until_budget_is_spent(monkeypatch):
+    pool = ShardPool(build_echo_app, shards=2, max_restarts=1)
+    pool._queues = [queue.Queue(), queue.Queue()]
+    pool._processes = [_FakeProcess("shard-0"), _FakeProcess("shard-1", alive=False)]
+    spawned = []
+
+    def fake_spawn(index, shard_queue):
+        spawned.append((index, shard_queue))
+        return _FakeProcess(f"shard-{index}")
+
+    monkeypatch.setattr(pool, "_spawn", fake_spawn)
+
+    pool.check()
+    assert spawned == [(1, pool._queues[1])]
+    assert pool.restarts == 1
+
+    pool._processes[0].alive = False
+    with pytest.raises(RuntimeError):
+        pool.check()
+    assert len(spawned) == 1
+
+
+async def test_workers_keep_each_user_on_one_process():
+    replies: dict[int, set[str]] = {}
+    lock = threading.Lock()
+
+    def on_call(method, params):
+        if method == "sendMessage":
+            with lock:
+                replies.setdefault(int(params["chat_id"]), set()).add(params["text"])
+
+    server = FakeTelegramServer(on_call=on_call).start()
+    pool = ShardPool(functools.partial(build_echo_app, server.base_url), shards=2)
+    loop = asyncio.get_running_loop()
+    try:
+        pool.start()
+        for i in range(12):
+            await pool.route(_make_update(i + 1, 100 + i % 4))
+        deadline = loop.time() + 60
+        while sum(1 for _, method, _ in server.calls if method == "sendMessage") < 12:
+            assert loop.time() < deadline
+            await asyncio.sleep(0.1)
+    finally:
+        await loop.run_in_executor(None, pool.stop)
+        server.stop()
+
+    assert set(replies) == {100, 101, 102, 103}
+    assert all(len(pids) == 1 for pids in replies.values())
+    # Even and odd users live on different processes
+    assert replies[100] == replies[102]
+    assert replies[100] != replies[101]
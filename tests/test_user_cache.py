@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+
+from src import user_cache as user_cache_module
+from src.user_cache import CachedUser, UserCache
+
+
+async def test_second_lookup_is_a_hit():
+    cache = UserCache(max_entries=10, ttl_seconds=60)
+    load = AsyncMock(return_value=CachedUser(1, None))
+
+    first = await cache.get(100, load)
+    second = await cache.get(100, load)
+
+    assert first == second == CachedUser(1, None)
+    load.assert_awaited_once()
+    assert cache.stats() == {
+        "size": 1,
+        "hits": 1,
+        "misses": 1,
+        "hit_rate": 0.5,
+        "evictions": 0,
+        "invalidations": 0,
+    }
+
+
+async def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(user_cache_module.time, "monotonic", lambda: now[0])
+    cache = UserCache(max_entries=10, ttl_seconds=60)
+    load = AsyncMock(return_value=CachedUser(1, None))
+
+    await cache.get(100, load)
+    now[0] += 61
+    await cache.get(100, load)
+
+    assert load.await_count == 2
+
+
+async def test_least_recently_used_entry_is_evicted():
+    cache = UserCache(max_entries=2, ttl_seconds=60)
+    for telegram_id in (1, 2):
+        await cache.get(telegram_id, AsyncMock(return_value=CachedUser(telegram_id, None)))
+    await cache.get(1, AsyncMock())  # 1 is now the most recent
+    await cache.get(3, AsyncMock(return_value=CachedUser(3, None)))
+
+    load = AsyncMock(return_value=CachedUser(2, None))
+    await cache.get(2, load)
+
+    load.assert_awaited_once()
+    assert cache.evictions == 2
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = UserCache(max_entries=10, ttl_seconds=60)
+    release = asyncio.Event()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return CachedUser(1, None)
+
+    lookups = [asyncio.create_task(cache.get(100, load)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*lookups) == [CachedUser(1, None)] * 5
+    assert calls == 1
+
+
+async def test_invalidate_during_load_keeps_stale_value_out():
+    cache = UserCache(max_entries=10, ttl_seconds=60)
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        return CachedUser(1, None)
+
+    lookup = asyncio.create_task(cache.get(100, load))
+    await asyncio.sleep(0)
+    cache.invalidate(100)
+    release.set()
+    await lookup
+
+    assert cache.stats()["size"] == 0
+
+
+async def test_failed_load_is_not_cached():
+    cache = UserCache(max_entries=10, ttl_seconds=60)
+
+    with pytest.raises(RuntimeError):
+        await cache.get(100, AsyncMock(side_effect=RuntimeError("db down")))
+
+    assert await cache.get(100, AsyncMock(return_value=CachedUser(1, None))) == CachedUser(1, None)
+
+
+def test_premium_ends_with_subscription():
+    assert CachedUser(1, datetime.now() + timedelta(minutes=1)).is_premium()
+    assert not CachedUser(1, datetime.now() - timedelta(seconds=1)).is_premium()
+    assert not CachedUser(1, None).is_premium()